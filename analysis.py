@@ -78,7 +78,80 @@ def check_continuation(df):
         return True
     return False
 
-def calculate_signal_confidence(df_short, df_long, df_higher):
+class SignalSnapshot:
+    # Immutable record of everything derived from one timeframe's DataFrame:
+    # Fibonacci levels, reversal/continuation/crossover flags and the last
+    # indicator values. Built once per timeframe, then scoring, filtering and
+    # report rendering all read from it instead of re-running the checks.
+    __slots__ = (
+        'symbol', 'close', 'prev_close', 'high', 'low',
+        'fib_0382', 'fib_05', 'fib_0618',
+        'ema_short', 'ema_long', 'rsi', 'macd', 'macd_signal',
+        'crossover_down', 'crossover_up', 'reversal', 'continuation'
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SignalSnapshot is immutable")
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"SignalSnapshot({fields})"
+
+
+def _last_two(df, column):
+    # (.iloc[-1], .iloc[-2]) of a column, or NaN when the indicator wasn't calculated
+    if column not in df.columns:
+        return float('nan'), float('nan')
+    values = df[column].to_numpy()
+    return float(values[-1]), float(values[-2]) if len(values) > 1 else float('nan')
+
+
+def build_snapshot(df, symbol='N/A', short_period=9, long_period=21):
+    # Same rules as check_reversal, check_continuation and check_ema_crossover,
+    # evaluated once. The symbol comes from df.attrs, a 'symbol' column, or the argument.
+    if 'symbol' in df.attrs:
+        symbol = df.attrs['symbol']
+    elif 'symbol' in df.columns:
+        symbol = df['symbol'].iloc[0]
+
+    high = float(df['high'].max())
+    low = float(df['low'].min())
+    fib_0618 = high - (high - low) * 0.618
+    fib_05 = high - (high - low) * 0.5
+    fib_0382 = high - (high - low) * 0.382
+
+    last_close, prev_close = _last_two(df, 'close')
+    ema_short, prev_ema_short = _last_two(df, f'EMA_{short_period}')
+    ema_long, prev_ema_long = _last_two(df, f'EMA_{long_period}')
+
+    cond_fib = last_close < fib_0618 or last_close < fib_05 or last_close < fib_0382
+
+    return SignalSnapshot(
+        symbol=symbol,
+        close=last_close,
+        prev_close=prev_close,
+        high=high,
+        low=low,
+        fib_0382=fib_0382,
+        fib_05=fib_05,
+        fib_0618=fib_0618,
+        ema_short=ema_short,
+        ema_long=ema_long,
+        rsi=_last_two(df, 'RSI')[0],
+        macd=_last_two(df, 'MACD')[0],
+        macd_signal=_last_two(df, 'MACD_signal')[0],
+        crossover_down=prev_ema_short > prev_ema_long and ema_short < ema_long,
+        crossover_up=prev_ema_short < prev_ema_long and ema_short > ema_long,
+        reversal=cond_fib and last_close < ema_long,
+        continuation=last_close > ema_long and last_close > prev_close
+    )
+
+
+def snapshot_confidence(short, long, higher):
     """
     This function quantifies how strong a trading signal is, based on multiple technical factors:
     - Signals confirmed across multiple timeframes (short, long, higher) add reliability.
@@ -89,38 +162,25 @@ def calculate_signal_confidence(df_short, df_long, df_higher):
     """
     confidence = 0
 
-    reversal_short = check_reversal(df_short)
-    continuation_short = check_continuation(df_short)
-    crossover_down, crossover_up = check_ema_crossover(df_short)
-    rsi_short = df_short['RSI'].iloc[-1]
-    macd_short = df_short['MACD'].iloc[-1]
-    macd_signal_short = df_short['MACD_signal'].iloc[-1]
-
-    reversal_long = check_reversal(df_long)
-    continuation_long = check_continuation(df_long)
-
-    reversal_high = check_reversal(df_higher)
-    continuation_high = check_continuation(df_higher)
-
     # Assign points to each confirmed signal, prioritizing multi-timeframe agreement
-    if reversal_short or continuation_short:
+    if short.reversal or short.continuation:
         confidence += 40
-    if reversal_long or continuation_long:
+    if long.reversal or long.continuation:
         confidence += 30
-    if reversal_high or continuation_high:
+    if higher.reversal or higher.continuation:
         confidence += 20
 
-    if crossover_down or crossover_up:
+    if short.crossover_down or short.crossover_up:
         confidence += 10
 
     # Add points for RSI confirming overbought/oversold conditions that support the reversal or continuation signals
-    if reversal_short and rsi_short < 40:
+    if short.reversal and short.rsi < 40:
         confidence += 10
-    if continuation_short and rsi_short > 60:
+    if short.continuation and short.rsi > 60:
         confidence += 10
 
     # Add points if MACD supports the signal momentum
-    if (macd_short > macd_signal_short and continuation_short) or (macd_short < macd_signal_short and reversal_short):
+    if (short.macd > short.macd_signal and short.continuation) or (short.macd < short.macd_signal and short.reversal):
         confidence += 10
 
     # Limit confidence to 100%
@@ -128,14 +188,26 @@ def calculate_signal_confidence(df_short, df_long, df_higher):
 
     return confidence
 
+
+def calculate_signal_confidence(df_short, df_long, df_higher):
+    # DataFrame entry point for snapshot_confidence (see its docstring for the scoring rules)
+    return snapshot_confidence(build_snapshot(df_short), build_snapshot(df_long), build_snapshot(df_higher))
+
+
 def generate_report(df_short, df_long, df_higher, symbol='N/A', detailed=False):
+    short = build_snapshot(df_short, symbol)
+    confidence = snapshot_confidence(short, build_snapshot(df_long), build_snapshot(df_higher))
+    return render_report(short, confidence, detailed)
+
+
+def render_report(snapshot, confidence, detailed=False, side=None, direction_label=None):
     # Generates a human-readable summary of the technical analysis, including:
     # - Overall confidence score
-    # - Direction of expected price movement (Bullish/Long or Bearish/Short)
+    # - Direction of expected price movement (Bullish/Long or Bearish/Short);
+    #   `side` ('short'/'long', e.g. the alerting strategy's side) fixes the direction,
+    #   otherwise it follows the reversal signal. `direction_label` replaces the label
     # - Current price and key indicator values
     # - Targets for profit-taking and stop loss levels
-    confidence = calculate_signal_confidence(df_short, df_long, df_higher)
-
     if not detailed:
         # Provide a quick summary signal strength:
         if confidence >= 70:
@@ -145,17 +217,12 @@ def generate_report(df_short, df_long, df_higher, symbol='N/A', detailed=False):
         else:
             return f"❌ No significant signals (Confidence: {confidence}%)"
 
-    high = df_short['high'].max()
-    low = df_short['low'].min()
-    last_close = df_short['close'].iloc[-1]
-    ema_21 = df_short['EMA_21'].iloc[-1]
-    rsi = df_short['RSI'].iloc[-1]
-    macd = df_short['MACD'].iloc[-1]
-    macd_signal = df_short['MACD_signal'].iloc[-1]
-    crossover_down, crossover_up = check_ema_crossover(df_short)
-
-    # Determine trade direction based on reversal signals
-    if check_reversal(df_short):
+    high = snapshot.high
+    low = snapshot.low
+    last_close = snapshot.close
+
+    # Determine trade direction from the given side, or else from reversal signals
+    if side == 'short' or (side is None and snapshot.reversal):
         direction = "SHORT"  # Expecting price drop; bearish position
         stop_loss = high * 1.02  # Stop loss above recent high for risk control
         target_1 = last_close * 0.98  # First profit target ~2% below entry
@@ -166,18 +233,21 @@ def generate_report(df_short, df_long, df_higher, symbol='N/A', detailed=False):
         target_1 = last_close * 1.02  # First profit target ~2% above entry
         target_2 = last_close * 1.04  # Second profit target ~4% above entry
 
+    if direction_label is None:
+        direction_label = 'Bullish 📈 (Long)' if direction == 'LONG' else 'Bearish 📉 (Short)'
+
     # Format the detailed report (e.g., for Discord message)
     report = (
         "```ini\n"
-        f"Symbol           = {df_short['symbol'].iloc[0] if 'symbol' in df_short.columns else 'N/A'}\n"
-        f"Direction        = {'Bullish 📈 (Long)' if direction == 'LONG' else 'Bearish 📉 (Short)'}\n\n"
+        f"Symbol           = {snapshot.symbol}\n"
+        f"Direction        = {direction_label}\n\n"
         f"Current Price    = {last_close:.4f}\n"
-        f"EMA (21)         = {ema_21:.4f}\n"
-        f"RSI              = {rsi:.2f}\n"
-        f"MACD             = {macd:.4f} (Signal: {macd_signal:.4f})\n"
-        f"EMA Crossover    = {'Bullish 🔺' if crossover_up else ('Bearish 🔻' if crossover_down else 'None ➖')}\n\n"
-        f"Reversal Detected= {'Yes ✅' if check_reversal(df_short) else 'No ❌'}\n"
-        f"Continuation     = {'Yes ✅' if check_continuation(df_short) else 'No ❌'}\n\n"
+        f"EMA (21)         = {snapshot.ema_long:.4f}\n"
+        f"RSI              = {snapshot.rsi:.2f}\n"
+        f"MACD             = {snapshot.macd:.4f} (Signal: {snapshot.macd_signal:.4f})\n"
+        f"EMA Crossover    = {'Bullish 🔺' if snapshot.crossover_up else ('Bearish 🔻' if snapshot.crossover_down else 'None ➖')}\n\n"
+        f"Reversal Detected= {'Yes ✅' if snapshot.reversal else 'No ❌'}\n"
+        f"Continuation     = {'Yes ✅' if snapshot.continuation else 'No ❌'}\n\n"
         f"Confidence Score = {confidence}%\n\n"
         f"Target 1         = {target_1:.4f}\n"
         f"Target 2         = {target_2:.4f}\n"
@@ -0,0 +1,59 @@
+#backfill.py
+import argparse
+import asyncio
+import logging
+import time
+from data import AsyncKlineFetcher, KlineStore, INTERVAL_MS, FUTURES_BASE_URL
+
+logger = logging.getLogger(__name__)
+
+
+async def backfill_series(fetcher, store, symbol, interval, start_time, end_time=None, page_size=1000):
+    # Pagina o histórico de um (symbol, interval) gravando cada página no store.
+    # O último candle gravado é o checkpoint: rodar de novo continua de onde parou.
+    end_time = int(time.time() * 1000) if end_time is None else int(end_time)
+    ultimo = store.last_open_time(symbol, interval)
+    cursor = int(start_time) if ultimo is None else max(int(start_time), ultimo + INTERVAL_MS[interval])
+    total = 0
+    while cursor < end_time:
+        pagina = await fetcher.fetch_raw(symbol, interval, page_size, start_time=cursor)
+        pagina = [k for k in pagina if k[0] < end_time]
+        if not pagina:
+            break
+        total += store.queue(symbol, interval, pagina)
+        cursor = pagina[-1][0] + INTERVAL_MS[interval]
+    logger.info(f"{symbol} ({interval}): {total} candles gravados.")
+    return total
+
+
+async def backfill(store, symbols, intervals, start_time, end_time=None, base_url=FUTURES_BASE_URL, max_concurrency=10):
+    async with AsyncKlineFetcher(base_url, max_concurrency=max_concurrency) as fetcher:
+        resultados = await asyncio.gather(
+            *(backfill_series(fetcher, store, symbol, interval, start_time, end_time)
+              for symbol in symbols for interval in intervals),
+            return_exceptions=True
+        )
+    await store.flush()
+    for resultado in resultados:
+        if isinstance(resultado, Exception):
+            logger.warning(f"Falha no backfill (rode de novo para retomar): {resultado}")
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baixa o histórico de candles dos futuros para o KlineStore local.")
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--store', default='klines')
+    parser.add_argument('--intervals', default='15m,1h,4h')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--base-url', default=FUTURES_BASE_URL)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s')
+    start_time = int(time.time() * 1000) - args.days * 86_400_000
+    asyncio.run(backfill(KlineStore(args.store), args.symbols, args.intervals.split(','), start_time,
+                         base_url=args.base_url))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+#backtest.py
+import argparse
+import asyncio
+import logging
+import time
+import numpy as np
+import pandas as pd
+from data import AsyncKlineFetcher, Candles, KlineStore, INTERVAL_MS
+from rules import FeatureTable, SHORT_STRATEGY, compile_strategy, with_params, load_strategies
+
+logger = logging.getLogger(__name__)
+
+# Candle window the live bot keeps per series (KlineCache uses limit=100)
+WINDOW = 100
+
+
+def history_matrix(series, interval):
+    """
+    Aligns {symbol: Candles} histories on one open_time grid and returns
+    (close, high, low) DataFrames shaped (bars x symbols). Bars a symbol
+    doesn't have (before its listing, gaps) are NaN.
+    """
+    step = INTERVAL_MS[interval]
+    series = {symbol: c for symbol, c in series.items() if len(c)}
+    start = min(int(c.open_time[0]) for c in series.values())
+    end = max(int(c.open_time[-1]) for c in series.values())
+    index = np.arange(start, end + step, step)
+
+    frames = []
+    for column in ('close', 'high', 'low'):
+        matrix = np.full((len(index), len(series)), np.nan)
+        for j, c in enumerate(series.values()):
+            matrix[(c.open_time - start) // step, j] = c[column]
+        frames.append(pd.DataFrame(matrix, index=index, columns=list(series)))
+    return tuple(frames)
+
+
+def _full_ema(df, period):
+    return df.ewm(span=period, adjust=False).mean()
+
+
+def windowed_ema(close, period, window=WINDOW, lag=0):
+    # EMA seeded at the first close of the last `window` candles, evaluated `lag`
+    # candles before the window's end. This is the pandas recompute the bot falls back
+    # to; live scoring uses the full-history incremental EMA, which differs slightly
+    # near the seed. EMA is linear, so
+    # from the full-history EMA E and window start s:
+    #     EMA_window(t) = E(t) - (1 - alpha)^(t - s) * (E(s) - close(s))
+    # which turns "recompute the EMA on every 100-candle slice" into O(1) per bar.
+    alpha = 2 / (period + 1)
+    full = _full_ema(close, period)
+    start_gap = full.shift(window - 1) - close.shift(window - 1)
+    return full.shift(lag) - (1 - alpha) ** (window - 1 - lag) * start_gap
+
+
+def _ema_weight_sum(r, signal_period, n):
+    # Sum over an n-step EMA(signal) of the weights applied to the sequence r^k
+    g = 2 / (signal_period + 1)
+    j = np.arange(1, n + 1)
+    return (1 - g) ** n + g * np.sum((1 - g) ** (n - j) * r ** j)
+
+
+def windowed_macd(close, window=WINDOW, fast=12, slow=26, signal=9):
+    # Same idea as windowed_ema, carried through MACD and its signal line
+    n = window - 1
+    r_fast, r_slow = 1 - 2 / (fast + 1), 1 - 2 / (slow + 1)
+    g = 2 / (signal + 1)
+
+    ema_fast, ema_slow = _full_ema(close, fast), _full_ema(close, slow)
+    gap_fast = (ema_fast - close).shift(n)
+    gap_slow = (ema_slow - close).shift(n)
+
+    macd_full = ema_fast - ema_slow
+    signal_full = _full_ema(macd_full, signal)
+
+    macd = macd_full - r_fast ** n * gap_fast + r_slow ** n * gap_slow
+    macd_signal = (
+        signal_full - (1 - g) ** n * (signal_full.shift(n) - macd_full.shift(n))
+        - _ema_weight_sum(r_fast, signal, n) * gap_fast
+        + _ema_weight_sum(r_slow, signal, n) * gap_slow
+    )
+    return macd, macd_signal
+
+
+def rolling_rsi(close, period=14):
+    # With a 100-candle window the first-candle zero change never reaches the
+    # last 14 deltas, so calculate_rsi on a window equals a plain rolling RSI
+    delta = close.diff()
+    gain = delta.where(delta > 0, 0).where(delta.notna())
+    loss = -delta.where(delta < 0, 0).where(delta.notna())
+    rs = gain.rolling(window=period).mean() / loss.rolling(window=period).mean()
+    return 100 - (100 / (1 + rs))
+
+
+def align_to_base(frame, interval, base_index, base_interval):
+    # For each base bar, the latest higher-timeframe candle already closed when the
+    # base bar closes (no look-ahead into the still-forming higher candle). The live
+    # bot scores the forming 1h/4h candle, derived from the 15m ones, instead.
+    step = INTERVAL_MS[interval]
+    closes_at = base_index + INTERVAL_MS[base_interval]
+    last_closed = (closes_at // step) * step - step
+    aligned = frame.reindex(last_closed)
+    aligned.index = base_index
+    return aligned
+
+
+class HistoryFeatures(FeatureTable):
+    # Rule features (rules.py) at every bar of the short timeframe, each bar judged
+    # on the `window` candles ending at it. This approximates live scoring rather than
+    # replaying it: see windowed_ema and align_to_base for where the two differ.
+    # Bars without a full window are NaN, so every comparison on them is False.
+    # Long/higher features come from their last candle already closed at that bar.
+    # Features are plain (bars x symbols) arrays: rules run as numpy ops, without
+    # pandas re-checking the index alignment on every operation.
+    def __init__(self, short, long, higher, intervals=('15m', '1h', '4h'), window=WINDOW):
+        super().__init__()
+        self.timeframes = (short, long, higher)
+        self.intervals = intervals
+        self.window = window
+        self._full = [close.rolling(window).count() == window for close, _, _ in self.timeframes]
+        self._macd = {}
+
+    def compute(self, timeframe, spec):
+        close, high, low = self.timeframes[timeframe]
+        kind = spec[0]
+        if kind == 'close':
+            value = close.shift(spec[1])
+        elif kind == 'high':
+            value = high.rolling(self.window).max()
+        elif kind == 'low':
+            value = low.rolling(self.window).min()
+        elif kind == 'ema':
+            value = windowed_ema(close, spec[1], self.window, lag=spec[2])
+        elif kind == 'rsi':
+            value = rolling_rsi(close, spec[1])
+        else:
+            key = (timeframe,) + spec[1:]
+            if key not in self._macd:
+                self._macd[key] = windowed_macd(close, self.window, *spec[1:])
+            value = self._macd[key][0 if kind == 'macd' else 1]
+        value = value.where(self._full[timeframe])
+        if timeframe:
+            base = self.timeframes[0][0]
+            value = align_to_base(value, self.intervals[timeframe], base.index, self.intervals[0])
+            value = value.reindex(columns=base.columns)
+        return value.to_numpy()
+
+
+def compute_signals(short, long, higher, intervals=('15m', '1h', '4h'), window=WINDOW, strategy=None, table=None):
+    """
+    Evaluates a rule strategy (default: SHORT_STRATEGY, i.e. calculate_signal_confidence
+    and the alert rule of monitorar) at every historical bar of the short timeframe.
+    Each argument is the (close, high, low) tuple from history_matrix.
+    Returns (confidence, signals) with (bars x symbols) frames; signals holds the
+    short-timeframe report flags, the window high/low and the strategy's 'alert'.
+    Pass the HistoryFeatures `table` of an earlier call to reuse its indicators
+    when evaluating several strategies over the same bars.
+    """
+    if table is None:
+        table = HistoryFeatures(short, long, higher, intervals, window)
+    values = compile_strategy(strategy or SHORT_STRATEGY).evaluate(table)
+    base = values if strategy is None else compile_strategy(SHORT_STRATEGY).evaluate_defines(table)
+    close = table.timeframes[0][0]
+
+    def frame(value):
+        return pd.DataFrame(np.broadcast_to(value, close.shape), index=close.index, columns=close.columns)
+
+    signals = {
+        'reversal': frame(base['reversal_short']),
+        'continuation': frame(base['continuation_short']),
+        'crossover_down': frame(base['crossover_down']),
+        'crossover_up': frame(base['crossover_up']),
+        'high': frame(table['high']),
+        'low': frame(table['low']),
+        'alert': frame(values['alert']),
+    }
+    return frame(values['confidence']), signals
+
+
+def _first_hit(mask):
+    # Index of the first True along axis 1, or mask.shape[1] if none
+    hit = mask.any(axis=1)
+    return np.where(hit, mask.argmax(axis=1), mask.shape[1])
+
+
+def simulate_exits(short, signals, alerts, horizon=96, chunk_size=20_000):
+    """
+    Replays the Target 1 / Target 2 / Stop Loss levels generate_report would
+    print for each alert over the next `horizon` bars. Direction follows the
+    report (SHORT when a reversal is flagged, LONG otherwise). A new alert on a
+    symbol is ignored while its previous trade is still open, and a bar that
+    touches both a target and the stop counts as stopped out.
+    """
+    close, high, low = (f.to_numpy() for f in short)
+    reversal = signals['reversal'].to_numpy()
+    hi, lo = signals['high'].to_numpy(), signals['low'].to_numpy()
+
+    bars, cols = np.nonzero(alerts.to_numpy())
+    order = np.lexsort((bars, cols))
+    bars, cols = bars[order], cols[order]
+
+    # Only one open trade per symbol. Each round takes, for every symbol, its next
+    # alert after the previous trade closed, so exits are only simulated for alerts
+    # that become trades (most alerts fire while a trade is still open)
+    taken, exits = [], []
+    open_until = np.full(alerts.shape[1], -1)
+    pending = np.arange(len(bars))
+    while True:
+        pending = pending[bars[pending] > open_until[cols[pending]]]
+        if not len(pending):
+            break
+        first = pending[np.r_[True, cols[pending[1:]] != cols[pending[:-1]]]]
+        result = _exits(close, high, low, reversal, hi, lo, bars[first], cols[first], horizon, chunk_size)
+        open_until[cols[first]] = bars[first] + result['bars_held']
+        taken.append(first)
+        exits.append(result)
+
+    taken = np.concatenate(taken) if taken else np.zeros(0, dtype=np.int64)
+    order = np.argsort(taken, kind='stable')
+    bars, cols = bars[taken][order], cols[taken][order]
+    trades = pd.DataFrame({
+        'symbol': alerts.columns[cols],
+        'open_time': alerts.index[bars],
+        **{
+            name: np.concatenate([e[name] for e in exits])[order] if exits else np.zeros(0, dtype=dtype)
+            for name, dtype in _EXIT_COLUMNS
+        },
+    })
+    return trades
+
+
+_EXIT_COLUMNS = [
+    ('direction', object), ('entry', float), ('target_1', float), ('target_2', float), ('stop_loss', float),
+    ('hit_target_1', bool), ('hit_target_2', bool), ('stopped', bool), ('bars_held', np.int64),
+]
+
+
+def _exits(close, high, low, reversal, hi, lo, bars, cols, horizon, chunk_size):
+    # Exit columns (see _EXIT_COLUMNS) of the trades opened at (bars, cols)
+    entry = close[bars, cols]
+    short_side = reversal[bars, cols]
+    stop = np.where(short_side, hi[bars, cols] * 1.02, lo[bars, cols] * 0.98)
+    target_1 = np.where(short_side, entry * 0.98, entry * 1.02)
+    target_2 = np.where(short_side, entry * 0.96, entry * 1.04)
+
+    # Forward windows are built in chunks to keep memory bounded with many trades
+    t1_bar, t2_bar, stop_bar = (np.empty(len(bars), dtype=np.int64) for _ in range(3))
+    for lo_i in range(0, len(bars), chunk_size):
+        sl = slice(lo_i, lo_i + chunk_size)
+        offsets = bars[sl, None] + 1 + np.arange(horizon)
+        valid = offsets < len(close)
+        offsets = np.minimum(offsets, len(close) - 1)
+        fwd_high = np.where(valid, high[offsets, cols[sl, None]], np.nan)
+        fwd_low = np.where(valid, low[offsets, cols[sl, None]], np.nan)
+        side = short_side[sl, None]
+        with np.errstate(invalid='ignore'):
+            t1_bar[sl] = _first_hit(np.where(side, fwd_low <= target_1[sl, None], fwd_high >= target_1[sl, None]))
+            t2_bar[sl] = _first_hit(np.where(side, fwd_low <= target_2[sl, None], fwd_high >= target_2[sl, None]))
+            stop_bar[sl] = _first_hit(np.where(side, fwd_high >= stop[sl, None], fwd_low <= stop[sl, None]))
+
+    return {
+        'direction': np.where(short_side, 'SHORT', 'LONG'),
+        'entry': entry,
+        'target_1': target_1,
+        'target_2': target_2,
+        'stop_loss': stop,
+        'hit_target_1': t1_bar < stop_bar,
+        'hit_target_2': t2_bar < stop_bar,
+        'stopped': (stop_bar < horizon) & (stop_bar <= t1_bar),
+        'bars_held': np.minimum(np.minimum(t2_bar, stop_bar) + 1, horizon),
+    }
+
+
+def summarize(trades):
+    if trades.empty:
+        return pd.DataFrame()
+    grouped = trades.groupby('direction')
+    summary = pd.DataFrame({
+        'trades': grouped.size(),
+        'target_1_rate': grouped['hit_target_1'].mean(),
+        'target_2_rate': grouped['hit_target_2'].mean(),
+        'stop_rate': grouped['stopped'].mean(),
+        'expired_rate': grouped.apply(lambda g: (~g['hit_target_1'] & ~g['stopped']).mean()),
+        'avg_bars_held': grouped['bars_held'].mean(),
+    })
+    summary.loc['ALL'] = [
+        len(trades), trades['hit_target_1'].mean(), trades['hit_target_2'].mean(),
+        trades['stopped'].mean(), (~trades['hit_target_1'] & ~trades['stopped']).mean(),
+        trades['bars_held'].mean()
+    ]
+    return summary
+
+
+def run_backtest(histories, intervals=('15m', '1h', '4h'), threshold=None, horizon=96,
+                 window=WINDOW, symbols_per_chunk=50, strategy=None):
+    # histories: {interval: {symbol: Candles}}. Alerts use the same strategy as monitorar
+    # (SHORT_STRATEGY unless another spec is given); `threshold` overrides its cutoff.
+    # Symbols are processed in chunks so memory stays bounded on years of data.
+    inicio = time.perf_counter()
+    strategy = strategy or SHORT_STRATEGY
+    if threshold is not None:
+        strategy = with_params(strategy, threshold=threshold)
+    symbols = list(histories[intervals[0]])
+    trades, n_alerts, n_bars = [], 0, 0
+    for i in range(0, len(symbols), symbols_per_chunk):
+        chunk = symbols[i:i + symbols_per_chunk]
+        short, long, higher = (
+            history_matrix({s: histories[interval][s] for s in chunk if s in histories[interval]}, interval)
+            for interval in intervals
+        )
+        confidence, signals = compute_signals(short, long, higher, intervals, window, strategy)
+        alerts = signals['alert']
+        trades.append(simulate_exits(short, signals, alerts, horizon))
+        n_alerts += int(alerts.to_numpy().sum())
+        n_bars = max(n_bars, short[0].shape[0])
+
+    trades = pd.concat(trades, ignore_index=True) if trades else pd.DataFrame()
+    logger.info(
+        f"Backtest: {len(symbols)} símbolos x {n_bars} barras, {n_alerts} alertas, "
+        f"{len(trades)} trades em {time.perf_counter() - inicio:.1f}s."
+    )
+    return trades
+
+
+async def load_histories(symbols, intervals, days, fetcher=None):
+    fetcher = fetcher or AsyncKlineFetcher()
+    start = int(time.time() * 1000) - days * 86_400_000
+    try:
+        pares = [(symbol, interval) for symbol in symbols for interval in intervals]
+        resultados = await asyncio.gather(
+            *(fetcher.fetch_range(symbol, interval, start) for symbol, interval in pares)
+        )
+    finally:
+        await fetcher.close()
+    histories = {interval: {} for interval in intervals}
+    for (symbol, interval), klines in zip(pares, resultados):
+        histories[interval][symbol] = Candles.from_klines(klines, symbol, interval)
+    return histories
+
+
+def load_histories_from_store(store, symbols, intervals, days):
+    # Zero-copy read from the local KlineStore (see backfill.py), no network
+    start = int(time.time() * 1000) - days * 86_400_000
+    return {
+        interval: {symbol: store.read(symbol, interval, start=start) for symbol in symbols}
+        for interval in intervals
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest da regra de alerta SHORT sobre candles históricos.")
+    parser.add_argument('symbols', nargs='*', help="padrão com --store: todos os símbolos gravados")
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--store', help="diretório do KlineStore; sem ele os candles vêm da Binance")
+    parser.add_argument('--threshold', type=int, help="confiança mínima (padrão: a da estratégia, 70)")
+    parser.add_argument('--strategy', help="arquivo JSON com a estratégia (padrão: a regra SHORT do bot)")
+    parser.add_argument('--horizon', type=int, default=96, help="barras do timeframe curto até o trade expirar")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s')
+    intervals = ('15m', '1h', '4h')
+    if args.store:
+        store = KlineStore(args.store)
+        symbols = args.symbols or store.symbols(intervals[0])
+        histories = load_histories_from_store(store, symbols, intervals, args.days)
+    else:
+        if not args.symbols:
+            parser.error("informe os símbolos ou --store")
+        histories = asyncio.run(load_histories(args.symbols, intervals, args.days))
+    strategy = load_strategies(args.strategy)[0] if args.strategy else None
+    trades = run_backtest(histories, intervals, args.threshold, args.horizon, strategy=strategy)
+    print(summarize(trades).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#batch.py
+import numpy as np
+import logging
+from analysis import SignalSnapshot
+from rules import FeatureTable, SHORT_STRATEGY, compile_strategy
+
+logger = logging.getLogger(__name__)
+
+# One row per symbol; mirrors what check_reversal, check_continuation,
+# check_ema_crossover and calculate_signal_confidence compute for a single DataFrame.
+BATCH_RESULT_DTYPE = np.dtype([
+    ('confidence', np.int16),
+    ('reversal_short', np.bool_),
+    ('continuation_short', np.bool_),
+    ('crossover_down', np.bool_),
+    ('crossover_up', np.bool_),
+    ('reversal_long', np.bool_),
+    ('continuation_long', np.bool_),
+    ('reversal_high', np.bool_),
+    ('continuation_high', np.bool_),
+    ('close', np.float64),
+    ('prev_close', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('fib_0382', np.float64),
+    ('fib_05', np.float64),
+    ('fib_0618', np.float64),
+    ('ema_9', np.float64),
+    ('ema_21', np.float64),
+    ('rsi', np.float64),
+    ('macd', np.float64),
+    ('macd_signal', np.float64),
+])
+
+
+def to_matrix(columns):
+    # Stacks 1-D price columns into a (symbols x candles) float array.
+    # Shorter series (e.g. recent listings) are left-padded with NaN so the last
+    # candle of every symbol sits in the last column.
+    columns = [np.asarray(c, dtype=np.float64) for c in columns]
+    width = max((len(c) for c in columns), default=0)
+    matrix = np.full((len(columns), width), np.nan)
+    for i, c in enumerate(columns):
+        if len(c):
+            matrix[i, width - len(c):] = c
+    return matrix
+
+
+def ema_matrix(close, period=21):
+    # Same recurrence as ewm(span=period, adjust=False).mean(), one step per candle
+    # across every symbol at once. Leading NaN padding is skipped: the first real
+    # close seeds the average, just like pandas does on the unpadded series.
+    alpha = 2 / (period + 1)
+    old_wt = 1 - alpha
+    out = np.empty_like(close)
+    value = close[:, 0].copy()
+    out[:, 0] = value
+    for t in range(1, close.shape[1]):
+        x = close[:, t]
+        blended = (old_wt * value + alpha * x) / (old_wt + alpha)
+        value = np.where(np.isnan(value), x, blended)
+        out[:, t] = value
+    return out
+
+
+def rsi_matrix(close, period=14):
+    # Same definition as calculate_rsi: rolling mean of gains/losses over `period`
+    # candles, where the first real candle of each row counts as a zero change.
+    delta = np.diff(close, axis=1, prepend=np.nan)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    padding = np.isnan(close)
+    gain[padding] = np.nan
+    loss[padding] = np.nan
+
+    avg_gain = np.full_like(close, np.nan)
+    avg_loss = np.full_like(close, np.nan)
+    if close.shape[1] >= period:
+        windows = np.lib.stride_tricks.sliding_window_view
+        avg_gain[:, period - 1:] = windows(gain, period, axis=1).mean(axis=2)
+        avg_loss[:, period - 1:] = windows(loss, period, axis=1).mean(axis=2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+
+def macd_matrix(close, fast=12, slow=26, signal=9):
+    macd = ema_matrix(close, fast) - ema_matrix(close, slow)
+    return macd, ema_matrix(macd, signal)
+
+
+class BatchFeatures(FeatureTable):
+    # Rule features on the last candle of each row of aligned (symbols x candles)
+    # matrices; EMA/MACD matrices are computed once per period and timeframe.
+    # `state` (one {spec: array} per timeframe, see IndicatorEngine.features) holds
+    # indicator values already kept incrementally. A row uses them when it is marked
+    # 'valid' and its ('close', 0) matches the matrices' last close; only the other
+    # rows are recomputed from the window.
+    def __init__(self, short, long, higher, state=None):
+        super().__init__()
+        self.timeframes = (short, long, higher)
+        self.state = state
+        self._emas = {}
+        self._synced = {}
+        self._fallback = {}
+
+    def _from_state(self, timeframe, spec):
+        # (state values, mask of the rows that can use them), or (None, None)
+        if self.state is None or self.state[timeframe] is None:
+            return None, None
+        values = self.state[timeframe]
+        if spec not in values:
+            return None, None
+        if timeframe not in self._synced:
+            close = self.timeframes[timeframe][2]
+            if close.shape[1] == 0:
+                self._synced[timeframe] = np.zeros(close.shape[0], dtype=bool)
+            else:
+                kept, last = values[('close', 0)], close[:, -1]
+                self._synced[timeframe] = values['valid'] & ((kept == last) | (np.isnan(kept) & np.isnan(last)))
+        return values[spec], self._synced[timeframe]
+
+    def _rows(self, timeframe, rows):
+        # Table over a subset of the rows of `timeframe`, without state (window recompute)
+        if timeframe not in self._fallback:
+            timeframes = list(self.timeframes)
+            timeframes[timeframe] = tuple(m[rows] for m in self.timeframes[timeframe])
+            self._fallback[timeframe] = BatchFeatures(*timeframes)
+        return self._fallback[timeframe]
+
+    def _ema(self, timeframe, period):
+        key = (timeframe, period)
+        if key not in self._emas:
+            self._emas[key] = ema_matrix(self.timeframes[timeframe][2], period)
+        return self._emas[key]
+
+    def _macd(self, timeframe, fast, slow, signal):
+        key = (timeframe, 'macd', fast, slow, signal)
+        if key not in self._emas:
+            macd = self._ema(timeframe, fast) - self._ema(timeframe, slow)
+            self._emas[key] = (macd, ema_matrix(macd, signal))
+        return self._emas[key]
+
+    def compute(self, timeframe, spec):
+        high, low, close = self.timeframes[timeframe]
+        kind = spec[0]
+        if kind in ('ema', 'rsi', 'macd', 'macd_signal'):
+            values, use = self._from_state(timeframe, spec)
+            if values is not None and use.all():
+                return values
+            if values is not None and use.any():
+                values = values.copy()
+                values[~use] = self._rows(timeframe, ~use).compute(timeframe, spec)
+                return values
+        if kind == 'close':
+            return close[:, -1 - spec[1]]
+        if kind == 'high':
+            return np.nanmax(high, axis=1)
+        if kind == 'low':
+            return np.nanmin(low, axis=1)
+        if kind == 'ema':
+            return self._ema(timeframe, spec[1])[:, -1 - spec[2]]
+        if kind == 'rsi':
+            return rsi_matrix(close, spec[1])[:, -1]
+        macd, signal = self._macd(timeframe, *spec[1:])
+        return (macd if kind == 'macd' else signal)[:, -1]
+
+
+def result_dtype(strategies):
+    # BATCH_RESULT_DTYPE plus <name>_confidence / <name>_alert for each strategy
+    extra = []
+    for strategy in strategies:
+        extra += [(f'{strategy.name}_confidence', np.float64), (f'{strategy.name}_alert', np.bool_)]
+    return np.dtype(BATCH_RESULT_DTYPE.descr + extra)
+
+
+def analyze_batch(short, long, higher, strategies=None, state=None):
+    """
+    Vectorized equivalent of running the indicator chain plus check_reversal,
+    check_continuation, check_ema_crossover and calculate_signal_confidence for
+    every symbol at once. Each argument is a (high, low, close) tuple of aligned
+    (symbols x candles) arrays for that timeframe (see to_matrix).
+    `strategies` (rule specs, see rules.py; default: SHORT_STRATEGY) are all
+    evaluated over the same indicator arrays. `state` (see BatchFeatures) supplies
+    incrementally kept indicator values instead of recomputing them.
+    Returns a structured array (see result_dtype), one row per symbol.
+    """
+    strategies = [compile_strategy(s) for s in (strategies or [SHORT_STRATEGY])]
+    table = BatchFeatures(short, long, higher, state)
+    # The report fields always describe the SHORT rule set, as generate_report does
+    base = compile_strategy(SHORT_STRATEGY).evaluate(table)
+
+    result = np.zeros(short[2].shape[0], dtype=result_dtype(strategies))
+    result['confidence'] = base['confidence']
+    for name in ('reversal_short', 'continuation_short', 'crossover_down', 'crossover_up',
+                 'reversal_long', 'continuation_long', 'reversal_high', 'continuation_high',
+                 'fib_0382', 'fib_05', 'fib_0618'):
+        result[name] = base[name]
+    result['close'] = table['close']
+    result['prev_close'] = table['prev_close']
+    result['high'] = table['high']
+    result['low'] = table['low']
+    result['ema_9'] = table['ema_9']
+    result['ema_21'] = table['ema_21']
+    result['rsi'] = table['rsi']
+    result['macd'] = table['macd']
+    result['macd_signal'] = table['macd_signal']
+
+    for strategy in strategies:
+        values = strategy.evaluate(table)
+        result[f'{strategy.name}_confidence'] = values['confidence']
+        result[f'{strategy.name}_alert'] = values['alert']
+
+    logger.debug(f"Análise em lote concluída para {len(result)} símbolos.")
+    return result
+
+
+def frames_to_batch(frames):
+    # Builds the (high, low, close) matrices analyze_batch expects from a list of
+    # kline DataFrames or data.Candles series (whose columns are read without copying)
+    return tuple(to_matrix(np.asarray(df[col]) for df in frames) for col in ('high', 'low', 'close'))
+
+
+def snapshot_from_batch(row, symbol):
+    # SignalSnapshot of the short timeframe straight from an analyze_batch row,
+    # so alerts can be rendered without rebuilding a DataFrame
+    return SignalSnapshot(
+        symbol=symbol,
+        close=float(row['close']),
+        prev_close=float(row['prev_close']),
+        high=float(row['high']),
+        low=float(row['low']),
+        fib_0382=float(row['fib_0382']),
+        fib_05=float(row['fib_05']),
+        fib_0618=float(row['fib_0618']),
+        ema_short=float(row['ema_9']),
+        ema_long=float(row['ema_21']),
+        rsi=float(row['rsi']),
+        macd=float(row['macd']),
+        macd_signal=float(row['macd_signal']),
+        crossover_down=bool(row['crossover_down']),
+        crossover_up=bool(row['crossover_up']),
+        reversal=bool(row['reversal_short']),
+        continuation=bool(row['continuation_short'])
+    )
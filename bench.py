@@ -0,0 +1,474 @@
+#bench.py
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+import requests
+from data import (
+    FUTURES_BASE_URL, COINGECKO_MARKETS_URL, INTERVAL_MS, CANDLE_FLOAT_COLUMNS, CANDLE_INT_COLUMNS,
+    AsyncKlineFetcher, Candles, KlineCache, StoredKlines, UniverseResolver
+)
+from indicators import IndicatorEngine
+from analysis import calculate_ema, calculate_rsi, calculate_macd, calculate_signal_confidence, generate_report
+from batch import analyze_batch
+from parallel import ParallelAnalyzer
+from scheduler import CandleScheduler
+from cooldown import AlertCooldown
+from outbox import AlertOutbox, StubChannel
+from monitor import Monitor
+
+# Offline benchmarks for the analysis functions and full monitoring cycles.
+# Fixtures are either recorded from Binance/CoinGecko (`python bench.py record DIR`)
+# or generated synthetically with the same JSON shapes; no network is used when running.
+
+INTERVALS = ('15m', '1h', '4h')
+WINDOWS = (100, 500, 1000, 1500)
+SYMBOL_COUNTS = (1, 100, 500, 1000)
+WARM_CYCLES = 8
+BASELINE = 'bench_baseline.json'
+
+
+class Fixtures:
+    # Kline series per (symbol, interval) as column arrays, plus the CoinGecko markets,
+    # futures exchangeInfo and 24h ticker documents the universe/pre-screen stages read
+    def __init__(self, series, markets, exchange_info, tickers):
+        self.series = series
+        self.markets = markets
+        self.exchange_info = exchange_info
+        self.tickers = tickers
+
+    @property
+    def symbols(self):
+        return [s['symbol'] for s in self.exchange_info['symbols']]
+
+    @classmethod
+    def synthetic(cls, n_symbols, candles=1500, end_time=None, seed=42):
+        # Random walks ending at the same (4h-aligned) open_time on every interval
+        rng = np.random.default_rng(seed)
+        n = candles
+        end_time = end_time or int(time.time() * 1000) // INTERVAL_MS['4h'] * INTERVAL_MS['4h']
+        series, markets, contracts, tickers = {}, [], [], []
+        for i in range(n_symbols):
+            base = f"SYN{i}"
+            symbol = f"{base}USDT"
+            for interval in INTERVALS:
+                step = INTERVAL_MS[interval]
+                close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004 * np.sqrt(step / 900_000), n)))
+                open_ = np.r_[close[0], close[:-1]]
+                spread = np.abs(rng.normal(0, 0.002, n)) * close
+                volume = rng.uniform(1e3, 1e5, n)
+                open_time = end_time - step * np.arange(n - 1, -1, -1, dtype=np.int64)
+                series[(symbol, interval)] = StoredKlines(symbol, interval, {
+                    'open_time': open_time, 'close_time': open_time + step - 1,
+                    'num_trades': rng.integers(100, 5000, n),
+                    'open': open_, 'close': close,
+                    'high': np.maximum(open_, close) + spread, 'low': np.minimum(open_, close) - spread,
+                    'volume': volume, 'quote_asset_volume': volume * close,
+                    'taker_buy_base': volume / 2, 'taker_buy_quote': volume * close / 2,
+                })
+            last = series[(symbol, '15m')]
+            markets.append({'id': base.lower(), 'symbol': base.lower(), 'market_cap': 350_000_000 - i * 1000})
+            contracts.append({'symbol': symbol, 'baseAsset': base, 'quoteAsset': 'USDT', 'contractType': 'PERPETUAL'})
+            tickers.append({'symbol': symbol, 'lastPrice': str(last['close'][-1]),
+                            'highPrice': str(last['high'][-96:].max()), 'lowPrice': str(last['low'][-96:].min())})
+        return cls(series, markets, {'symbols': contracts}, tickers)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'markets.json')) as f:
+            markets = json.load(f)
+        with open(os.path.join(path, 'exchange_info.json')) as f:
+            exchange_info = json.load(f)
+        with open(os.path.join(path, 'ticker_24hr.json')) as f:
+            tickers = json.load(f)
+        series = {}
+        for name in sorted(os.listdir(os.path.join(path, 'klines'))):
+            symbol, interval = name[:-len('.json')].rsplit('_', 1)
+            with open(os.path.join(path, 'klines', name)) as f:
+                candles = Candles.from_klines(json.load(f), symbol, interval)
+            series[(symbol, interval)] = StoredKlines(symbol, interval, {
+                column: candles[column].copy() for column in {**CANDLE_INT_COLUMNS, **CANDLE_FLOAT_COLUMNS}
+            })
+        # Only contracts with recorded klines on every interval take part
+        recorded = {symbol for symbol, _ in series}
+        exchange_info = {'symbols': [s for s in exchange_info['symbols'] if s['symbol'] in recorded
+                                     and all((s['symbol'], i) in series for i in INTERVALS)]}
+        return cls(series, markets, exchange_info, tickers)
+
+    def scaled(self, n_symbols):
+        # First n symbols; when fewer were recorded, the recorded ones are cloned under new names
+        contracts = self.exchange_info['symbols']
+        markets = {m['symbol'].upper(): m for m in self.markets}
+        tickers = {t['symbol']: t for t in self.tickers}
+        series, new_markets, new_contracts, new_tickers = {}, [], [], []
+        for i in range(n_symbols):
+            contract = contracts[i % len(contracts)]
+            clone = i // len(contracts)
+            base = contract['baseAsset'] + (str(clone) if clone else '')
+            symbol = base + contract['quoteAsset']
+            for interval in INTERVALS:
+                series[(symbol, interval)] = self.series[(contract['symbol'], interval)]
+            market = markets.get(contract['baseAsset'], {'id': base.lower(), 'market_cap': 300_000_000})
+            new_markets.append({**market, 'id': f"{market['id']}{clone or ''}", 'symbol': base.lower()})
+            new_contracts.append({**contract, 'symbol': symbol, 'baseAsset': base})
+            new_tickers.append({**tickers.get(contract['symbol'], {}), 'symbol': symbol})
+        new_markets.sort(key=lambda m: -(m.get('market_cap') or 0))
+        return Fixtures(series, new_markets, {'symbols': new_contracts}, new_tickers)
+
+    def klines(self, symbol, interval, now_ms, limit=100, start_time=None):
+        # Kline rows as the REST API returns them at `now_ms` (the last one may still be forming)
+        series = self.series[(symbol, interval)]
+        stop = int(np.searchsorted(series.open_time, now_ms, side='right'))
+        start = max(stop - limit, 0) if start_time is None else int(np.searchsorted(series.open_time, start_time))
+        stop = min(stop, start + limit)
+        columns = {name: values[start:stop] for name, values in series.columns.items()}
+        linhas = StoredKlines(symbol, interval, columns).rows()
+        # Binance sends prices and volumes as strings
+        for linha in linhas:
+            for pos in CANDLE_FLOAT_COLUMNS.values():
+                linha[pos] = repr(linha[pos])
+        return linhas
+
+    def end_time(self):
+        return min(int(s.open_time[-1]) for (symbol, interval), s in self.series.items() if interval == INTERVALS[0])
+
+
+class _Response:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FixtureSession:
+    # Stands in for the requests.Session used for CoinGecko: serves markets.json page by page
+    def __init__(self, markets):
+        self.markets = markets
+
+    def get(self, url, params=None, timeout=None):
+        per_page, page = params['per_page'], params['page']
+        return _Response(self.markets[(page - 1) * per_page:page * per_page])
+
+
+class FixtureClient:
+    # Stands in for the python-binance client (only exchange info is used)
+    def __init__(self, exchange_info):
+        self.exchange_info = exchange_info
+
+    def futures_exchange_info(self):
+        return self.exchange_info
+
+
+class FixtureFetcher:
+    # Same interface as AsyncKlineFetcher, serving the fixture candles visible at the simulated time
+    def __init__(self, fixtures, clock):
+        self.fixtures = fixtures
+        self.clock = clock
+        self.requests = 0
+
+    async def fetch_raw(self, symbol, interval='15m', limit=100, start_time=None):
+        self.requests += 1
+        return self.fixtures.klines(symbol, interval, int(self.clock() * 1000), limit, start_time)
+
+    async def fetch_range(self, symbol, interval, start_time, end_time=None, page_size=1000):
+        now_ms = int(self.clock() * 1000)
+        end_time = now_ms if end_time is None else end_time
+        linhas = []
+        cursor = start_time
+        while cursor < end_time:
+            self.requests += 1
+            pagina = [k for k in self.fixtures.klines(symbol, interval, now_ms, page_size, cursor) if k[0] < end_time]
+            if not pagina:
+                break
+            linhas.extend(pagina)
+            cursor = pagina[-1][0] + INTERVAL_MS[interval]
+        return linhas
+
+    async def fetch_tickers(self):
+        self.requests += 1
+        return {t['symbol']: t for t in self.fixtures.tickers}
+
+
+@contextmanager
+def simulated_clock(start):
+    # The cache, indicators and pre-screen read time.time(); the benchmark moves it
+    # forward one candle per warm cycle instead of waiting for real candles to close
+    real = time.time
+    clock = [start]
+    time.time = lambda: clock[0]
+    try:
+        yield clock
+    finally:
+        time.time = real
+
+
+def _measure(fn, make_args, repeat):
+    tempos = []
+    for _ in range(repeat):
+        args = make_args()
+        inicio = time.perf_counter()
+        fn(*args)
+        tempos.append(time.perf_counter() - inicio)
+    args = make_args()
+    tracemalloc.start()
+    fn(*args)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {**_spread(tempos), 'min_seconds': min(tempos), 'peak_bytes': pico}
+
+
+def _spread(tempos):
+    # Median of the repeated runs and its median absolute deviation, the noise
+    # estimate compare() uses; both are robust to the odd run hit by a GC pause
+    mediana = statistics.median(tempos)
+    return {'seconds': mediana, 'mad_seconds': statistics.median(abs(t - mediana) for t in tempos)}
+
+
+def bench_functions(fixtures, repeat):
+    resultados = {}
+    symbol = fixtures.symbols[0]
+    for window in WINDOWS:
+        frames = {}
+        for interval in INTERVALS:
+            series = fixtures.series[(symbol, interval)]
+            frames[interval] = Candles.from_klines(
+                StoredKlines(symbol, interval, {k: v[-window:] for k, v in series.columns.items()}).rows(),
+                symbol, interval
+            ).to_frame()
+        if len(frames['15m']) < window:
+            continue
+        prontos = {i: calculate_macd(calculate_rsi(calculate_ema(calculate_ema(df.copy(), 9), 21))) for i, df in frames.items()}
+        df = frames['15m']
+        casos = {
+            'calculate_ema': (calculate_ema, lambda: (df.copy(), 21)),
+            'calculate_rsi': (calculate_rsi, lambda: (df.copy(),)),
+            'calculate_macd': (calculate_macd, lambda: (df.copy(),)),
+            'calculate_signal_confidence': (calculate_signal_confidence, lambda: tuple(prontos[i] for i in INTERVALS)),
+            'generate_report': (generate_report, lambda: tuple(prontos[i] for i in INTERVALS) + (symbol, True)),
+        }
+        for name, (fn, make_args) in casos.items():
+            resultados[f"{name}[window={window}]"] = _measure(fn, make_args, repeat)
+    return resultados
+
+
+def bench_batch(fixtures, repeat, window=100):
+    resultados = {}
+    for n in SYMBOL_COUNTS:
+        sub = fixtures.scaled(n)
+        timeframes = [
+            tuple(np.vstack([sub.series[(s, interval)][col][-window:] for s in sub.symbols]) for col in ('high', 'low', 'close'))
+            for interval in INTERVALS
+        ]
+        resultados[f"analyze_batch[symbols={n}]"] = _measure(analyze_batch, lambda: timeframes, repeat)
+    return resultados
+
+
+async def _run_cycles(fixtures, workers, clock):
+    fetcher = FixtureFetcher(fixtures, time.time)
+    universo = UniverseResolver(FixtureClient(fixtures.exchange_info), 0, float('inf'), session=FixtureSession(fixtures.markets))
+    cache = KlineCache(fetcher, indicators=IndicatorEngine(), derived={'1h': '15m', '4h': '15m'})
+    analisador = ParallelAnalyzer(workers)
+    canal = StubChannel()
+    saida = AlertOutbox(canal, linger=0, rate=10**9).start()
+    cooldown = AlertCooldown(':memory:', ttl=0)
+    monitor = Monitor(universo, fetcher, cache, CandleScheduler(INTERVALS), cooldown, analisador, saida,
+                      INTERVALS, spread_seconds=0)
+    step = INTERVAL_MS[INTERVALS[0]] / 1000
+    try:
+        tempos = []
+        analisados = 0
+        for ciclo in range(WARM_CYCLES + 1):
+            fechados = set(INTERVALS) if ciclo == 0 else {
+                i for i in INTERVALS if int(clock[0] * 1000) % INTERVAL_MS[i] == 0
+            }
+            inicio = time.perf_counter()
+            n, _ = await monitor.cycle(fechados)
+            await saida.drain()
+            tempos.append(time.perf_counter() - inicio)
+            if ciclo:
+                analisados += n
+            clock[0] += step
+        return {
+            'cold_seconds': tempos[0],
+            **_spread(tempos[1:]),
+            'symbols_per_second': analisados / sum(tempos[1:]) if sum(tempos[1:]) else 0,
+            'requests': fetcher.requests,
+            'messages': len(canal.messages),
+        }
+    finally:
+        await saida.stop()
+        analisador.shutdown()
+        cooldown.close()
+
+
+def bench_cycles(fixtures, workers):
+    resultados = {}
+    for n in SYMBOL_COUNTS:
+        sub = fixtures.scaled(n)
+        # Starts WARM_CYCLES candles before the end of the fixtures, then replays them one by one
+        inicio = (sub.end_time() - WARM_CYCLES * INTERVAL_MS[INTERVALS[0]]) / 1000
+        with simulated_clock(inicio) as clock:
+            resultados[f"cycle[symbols={n}]"] = asyncio.run(_run_cycles(sub, workers, clock))
+    return resultados
+
+
+def regression_threshold(base, mad_base, mad_atual, tolerance, noise=4.0, floor=50e-6):
+    # Slowdown (s) above which a median counts as a regression: the relative tolerance,
+    # widened to `noise` times the combined spread of both runs when they are noisier
+    # than that, and never below `floor` (timer resolution on sub-millisecond cases)
+    return max(tolerance * base, noise * (mad_base + mad_atual), floor)
+
+
+def run_suite(fixtures_path, candles, only, repeat, workers):
+    # One round of the suite: every selected benchmark, in the calling process
+    # 20 distinct series are enough: the larger symbol counts clone them under new names
+    fixtures = Fixtures.load(fixtures_path) if fixtures_path else Fixtures.synthetic(20, candles=candles)
+    resultados = {}
+    if only in (None, 'functions'):
+        resultados.update(bench_functions(fixtures, repeat))
+    if only in (None, 'batch'):
+        resultados.update(bench_batch(fixtures, repeat))
+    if only in (None, 'cycle'):
+        resultados.update(bench_cycles(fixtures, workers))
+    return resultados
+
+
+def run_rounds(rounds, *suite_args):
+    # Runs the suite `rounds` times, each in a fresh process: timings shift between
+    # processes (memory layout, CPU frequency, neighbours on the host) far more than
+    # between repeats inside one, so the spread used by compare() has to come from
+    # several processes. Every metric is the median over the rounds; mad_seconds is
+    # the larger of the spread between round medians and the median spread inside one.
+    if rounds <= 1:
+        return run_suite(*suite_args)
+    rodadas = []
+    contexto = multiprocessing.get_context('spawn')
+    for _ in range(rounds):
+        with ProcessPoolExecutor(1, mp_context=contexto) as executor:
+            rodadas.append(executor.submit(run_suite, *suite_args).result())
+    resultados = {}
+    for name in rodadas[0]:
+        amostras = [r[name] for r in rodadas]
+        resultado = {k: statistics.median(a[k] for a in amostras) for k in amostras[0]}
+        entre = _spread([a['seconds'] for a in amostras])
+        resultado['seconds'] = entre['seconds']
+        resultado['mad_seconds'] = max(entre['mad_seconds'], resultado.get('mad_seconds', 0.0))
+        resultado['rounds'] = len(rodadas)
+        resultados[name] = resultado
+    return resultados
+
+
+def compare(resultados, baseline, tolerance, noise=4.0):
+    # Compares medians; a case only regresses when the slowdown is beyond the noise of
+    # both measurements (see regression_threshold)
+    regressoes = []
+    print(f"\n{'caso':<48}{'atual':>12}{'baseline':>12}{'delta':>9}{'limite':>9}")
+    for name, r in resultados.items():
+        atual = r['seconds']
+        anterior = baseline.get(name, {})
+        base = anterior.get('seconds')
+        if base is None:
+            print(f"{name:<48}{atual * 1000:>10.3f}ms{'-':>12}")
+            continue
+        # Baselines saved before the spread was recorded count as noiseless
+        limite = regression_threshold(base, anterior.get('mad_seconds', 0.0), r.get('mad_seconds', 0.0),
+                                      tolerance, noise)
+        marca = ' <-- regressão' if atual - base > limite else ''
+        if marca:
+            regressoes.append(name)
+        print(f"{name:<48}{atual * 1000:>10.3f}ms{base * 1000:>10.3f}ms{atual / base - 1:>+8.1%}"
+              f"{limite / base:>+8.1%}{marca}")
+    return regressoes
+
+
+def report(resultados):
+    for name, r in resultados.items():
+        extras = ', '.join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}"
+                           for k, v in r.items() if k != 'seconds')
+        print(f"{name:<48}{r['seconds'] * 1000:>10.3f}ms  {extras}")
+
+
+async def record(path, n_symbols, candles):
+    # Records real fixtures (needs network); the universe is the top perpetuals by market cap
+    os.makedirs(os.path.join(path, 'klines'), exist_ok=True)
+    markets = []
+    for page in range(1, 5):
+        resposta = requests.get(COINGECKO_MARKETS_URL, params={
+            'vs_currency': 'usd', 'order': 'market_cap_desc', 'per_page': 250, 'page': page}, timeout=15)
+        resposta.raise_for_status()
+        markets.extend(resposta.json())
+    exchange_info = requests.get(f"{FUTURES_BASE_URL}/fapi/v1/exchangeInfo", timeout=15).json()
+    perpetuos = {s['baseAsset']: s for s in exchange_info['symbols']
+                 if s['contractType'] == 'PERPETUAL' and s['quoteAsset'] == 'USDT'}
+    escolhidos = [perpetuos[m['symbol'].upper()] for m in markets if m['symbol'].upper() in perpetuos][:n_symbols]
+    exchange_info = {'symbols': [{k: s[k] for k in ('symbol', 'baseAsset', 'quoteAsset', 'contractType')} for s in escolhidos]}
+
+    async with AsyncKlineFetcher() as fetcher:
+        tickers = await fetcher.fetch_tickers()
+        for contrato in escolhidos:
+            for interval in INTERVALS:
+                klines = await fetcher.fetch_raw(contrato['symbol'], interval, min(candles, 1500))
+                with open(os.path.join(path, 'klines', f"{contrato['symbol']}_{interval}.json"), 'w') as f:
+                    json.dump(klines, f)
+    with open(os.path.join(path, 'markets.json'), 'w') as f:
+        json.dump(markets, f)
+    with open(os.path.join(path, 'exchange_info.json'), 'w') as f:
+        json.dump(exchange_info, f)
+    with open(os.path.join(path, 'ticker_24hr.json'), 'w') as f:
+        json.dump([tickers[c['symbol']] for c in escolhidos if c['symbol'] in tickers], f)
+    print(f"{len(escolhidos)} símbolos gravados em {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks offline da análise e do ciclo de monitoramento.")
+    parser.add_argument('command', nargs='?', default='run', choices=('run', 'record'))
+    parser.add_argument('path', nargs='?', help="record: diretório onde gravar as fixtures")
+    parser.add_argument('--fixtures', help="diretório com fixtures gravadas (padrão: sintéticas)")
+    parser.add_argument('--symbols', type=int, default=20, help="record: quantos símbolos gravar")
+    parser.add_argument('--candles', type=int, default=1500, help="candles de 15m por símbolo")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=5,
+                        help="rodadas da suíte, cada uma num processo novo (a mediana entre elas é a comparada)")
+    parser.add_argument('--workers', type=int, default=0, help="processos de análise no ciclo (0 = thread)")
+    parser.add_argument('--only', choices=('functions', 'batch', 'cycle'))
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="piora relativa mínima tolerada (na mediana) antes de acusar regressão")
+    parser.add_argument('--noise', type=float, default=4.0,
+                        help="a piora também precisa passar deste múltiplo do desvio (MAD) das duas medições")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        if not args.path:
+            parser.error("informe o diretório das fixtures")
+        asyncio.run(record(args.path, args.symbols, args.candles))
+        return
+
+    resultados = run_rounds(args.rounds, args.fixtures, args.candles, args.only, args.repeat, args.workers)
+    report(resultados)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(resultados, f, indent=1, sort_keys=True)
+        print(f"\nBaseline salvo em {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressoes = compare(resultados, json.load(f), args.tolerance, args.noise)
+        if regressoes:
+            raise SystemExit(f"{len(regressoes)} casos acima do limite de regressão")
+
+
+if __name__ == '__main__':
+    main()
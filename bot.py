@@ -5,21 +5,23 @@ import asyncio
 import logging
 from dotenv import load_dotenv
 from data import (
-    obter_moedas_com_capitalizacao,
     get_binance_client,
-    get_recent_futures,
-    get_klines
-)
-from analysis import (
-    calculate_ema, 
-    check_reversal,
-    check_continuation, 
-    calculate_rsi, 
-    calculate_macd,
-    calculate_signal_confidence,
-    check_ema_crossover,
-    generate_report
+    UniverseResolver,
+    AsyncKlineFetcher,
+    KlineCache,
+    KlineStore
 )
+from stream import KlineStream
+from indicators import IndicatorEngine
+from parallel import ParallelAnalyzer
+from scheduler import CandleScheduler
+from cooldown import AlertCooldown
+from outbox import AlertOutbox
+from monitor import Monitor
+from metrics import start_metrics_server
+from shard import Coordinator
+from ondemand import OnDemandAnalyzer
+from rules import SHORT_STRATEGY, load_strategies
 
 # 🔧 Logging configurado (terminal + arquivo)
 logging.basicConfig(
@@ -38,9 +40,25 @@ API_KEY = os.getenv('API_KEY')
 API_SECRET = os.getenv('API_SECRET')
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 CANAL_ID = int(os.getenv('CANAL_ID'))
-
-# 🔗 Inicializa cliente Binance
-client_binance = get_binance_client(API_KEY, API_SECRET)
+INGESTAO = os.getenv('INGESTAO', 'rest')  # 'rest' (polling) ou 'stream' (WebSocket)
+KLINE_STORE = os.getenv('KLINE_STORE')  # diretório do histórico local de candles (opcional)
+ANALISE_WORKERS = os.getenv('ANALISE_WORKERS')  # processos de análise (padrão: nº de CPUs; 0 = thread)
+ALERTAS_DB = os.getenv('ALERTAS_DB', 'alertas.db')  # cooldown dos símbolos já alertados
+COOLDOWN_HORAS = float(os.getenv('COOLDOWN_HORAS', '6'))
+METRICAS_PORTA = os.getenv('METRICAS_PORTA')  # expõe /metrics (formato Prometheus) nessa porta local
+ESTRATEGIAS = os.getenv('ESTRATEGIAS')  # JSON com as estratégias de alerta (padrão: a regra SHORT)
+# Endereço (host:porta ou unix:/caminho) em que o bot coordena workers do shard.py;
+# com ele definido o bot não analisa nada, só divide os símbolos e posta os alertas
+SHARD_COORDENADOR = os.getenv('SHARD_COORDENADOR')
+# INFO desliga a formatação dos logs de depuração nos loops quentes (modo de baixo custo)
+logging.getLogger().setLevel(os.getenv('LOG_NIVEL', 'DEBUG').upper())
+
+# ⏱️ Timeframes analisados por símbolo
+INTERVALOS = ('15m', '1h', '4h')
+# 🧮 Timeframes montados localmente a partir do 15m (só a carga inicial vai à Binance)
+DERIVADOS = {'1h': '15m', '4h': '15m'}
+# Janela (s) em que as buscas REST de cada ciclo são espalhadas para evitar rajadas
+ESPALHAR_SEGUNDOS = 5
 
 # ⚙️ Intents do Discord
 intents = discord.Intents.default()
@@ -49,79 +67,95 @@ intents.message_content = True
 # 🤖 Classe principal do bot
 class BotShort(discord.Client):
     async def setup_hook(self):
+        # 🔗 Inicializa cliente Binance (o construtor faz um ping, então roda em thread)
+        self.client_binance = await asyncio.to_thread(get_binance_client, API_KEY, API_SECRET)
+        self.cooldown = AlertCooldown(ALERTAS_DB, ttl=COOLDOWN_HORAS * 3600)
+        self.saida = None
+        self.stream = self.analisador = None
+        # 📐 Estratégias declarativas (rules.py); todas avaliadas sobre os mesmos indicadores
+        self.estrategias = load_strategies(ESTRATEGIAS) if ESTRATEGIAS else [SHORT_STRATEGY]
+        if not SHARD_COORDENADOR:
+            self.fetcher = AsyncKlineFetcher()
+            self.indicadores = IndicatorEngine()
+            store = KlineStore(KLINE_STORE) if KLINE_STORE else None
+            self.cache = KlineCache(self.fetcher, indicators=self.indicadores, store=store, derived=DERIVADOS)
+            self.agendador = CandleScheduler(INTERVALOS)
+            if INGESTAO == 'stream':
+                self.stream = KlineStream(self.cache, on_close=self.agendador.notify)
+            self.analisador = ParallelAnalyzer(int(ANALISE_WORKERS) if ANALISE_WORKERS else None,
+                                               strategies=self.estrategias)
+            self.sob_demanda = OnDemandAnalyzer(self.cache, INTERVALOS, self.estrategias)
+        else:
+            # Sem ciclo local: o !analyze usa um cache próprio e pequeno, com pouco peso
+            # para não disputar o limite da Binance com workers no mesmo IP
+            self.fetcher = AsyncKlineFetcher(max_concurrency=3, weight_limit=240)
+            self.cache = KlineCache(self.fetcher, derived=DERIVADOS)
+            self.sob_demanda = OnDemandAnalyzer(self.cache, INTERVALOS, self.estrategias, max_symbols=50)
+        self.metricas = await start_metrics_server(int(METRICAS_PORTA)) if METRICAS_PORTA else None
         self.bg_task = asyncio.create_task(self.monitorar())
 
     async def on_ready(self):
         logging.info(f"🟢 Bot online como {self.user}")
 
+    async def on_message(self, message):
+        # 💬 !analyze SYMBOL [intervalo]: relatório na hora, a partir do cache do monitor
+        partes = message.content.split()
+        if message.author.bot or not partes or partes[0].lower() != '!analyze':
+            return
+        if len(partes) < 2:
+            await message.channel.send(f"Uso: `!analyze SYMBOL [{'|'.join(INTERVALOS)}]`")
+            return
+        try:
+            texto = await self.sob_demanda.analyze(partes[1], partes[2] if len(partes) > 2 else None)
+        except ValueError as e:
+            texto = f"⚠️ {e}"
+        except Exception as e:
+            logging.warning(f"⚠️ Erro no !analyze de {partes[1]}: {e}")
+            texto = f"❌ Não foi possível analisar `{partes[1].upper()}`: {e}"
+        await message.channel.send(texto)
+
+    async def close(self):
+        if self.saida is not None:
+            await self.saida.stop()
+        if self.stream is not None:
+            await self.stream.stop()
+        if self.cache.store is not None:
+            # Candles ainda na fila de gravação do histórico local
+            await self.cache.store.flush()
+        await self.fetcher.close()
+        if self.analisador is not None:
+            self.analisador.shutdown()
+        self.cooldown.close()
+        if self.metricas is not None:
+            await self.metricas.cleanup()
+        await super().close()
+
     async def monitorar(self):
         canal = await self.fetch_channel(CANAL_ID)
-        analisados = set()
+        # 📬 Alertas vão para a fila de saída; o envio ao Discord roda em outra task.
+        # Alerta não entregue libera o cooldown do símbolo
+        self.saida = AlertOutbox(canal, on_failure=self.cooldown.unmute).start()
 
         min_cap = 200_000_000
         max_cap = 350_000_000
+        universo = UniverseResolver(self.client_binance, min_cap, max_cap)
 
-        while True:
+        if SHARD_COORDENADOR:
+            # 🧩 Os símbolos são divididos entre os workers (python shard.py worker ...)
+            coordenador = Coordinator(universo, self.saida, self.cooldown, SHARD_COORDENADOR)
             try:
-                moedas_gecko = obter_moedas_com_capitalizacao(min_cap, max_cap)
-                symbols_binance = get_recent_futures(client_binance)
-
-                symbols_filtrados = []
-                for moeda in moedas_gecko:
-                    sym = moeda['symbol'].upper()
-                    sym_usdt = sym + "USDT"
-                    if sym_usdt in symbols_binance:
-                        symbols_filtrados.append(sym_usdt)
-
-                for symbol in symbols_filtrados:
-                    if symbol in analisados:
-                        continue
-
-                    logging.info(f"🔍 Analisando símbolo em background: {symbol}")
-                    try:
-                        df_15m = get_klines(client_binance, symbol, interval='15m')
-                        df_1h = get_klines(client_binance, symbol, interval='1h')
-                        df_4h = get_klines(client_binance, symbol, interval='4h')
-
-                        for df in (df_15m, df_1h, df_4h):
-                            df = calculate_ema(df, 9)
-                            df = calculate_ema(df, 21)
-                            df = calculate_rsi(df)
-                            df = calculate_macd(df)
-
-                        # Recalculate explicitly (you can wrap this logic into a helper if needed)
-                        df_15m = calculate_macd(calculate_rsi(calculate_ema(calculate_ema(df_15m, 9), 21)))
-                        df_1h  = calculate_macd(calculate_rsi(calculate_ema(calculate_ema(df_1h, 9), 21)))
-                        df_4h  = calculate_macd(calculate_rsi(calculate_ema(calculate_ema(df_4h, 9), 21)))
-
-                        confidence = calculate_signal_confidence(df_15m, df_1h, df_4h)
-
-                        crossover_down, crossover_up = check_ema_crossover(df_15m)
-                        reversal = check_reversal(df_15m)
-                        continuation = check_continuation(df_15m)
-
-                        # Only send alert if bearish (short) signal:
-                        if confidence >= 70 and (crossover_down or reversal) and not continuation:
-                            report = generate_report(df_15m, df_1h, df_4h, detailed=True)
-
-                            # Add the direction explicitly here
-                            report = report.replace("Direction = N/A", "Direction = Bearish 📉 (Short)")
-
-                            await canal.send(f"📉 *Alerta SHORT para `{symbol}`*\n{report}")
-                            analisados.add(symbol)
-                        else:
-                            logging.info(f"Sinal não bearish para {symbol}, ignorado.")
-
-                    except Exception as e:
-                        logging.warning(f"⚠️ Erro ao analisar {symbol} no monitoramento: {e}")
-
-                await asyncio.sleep(60)
+                await coordenador.run()
+            finally:
+                await coordenador.stop()
+            return
 
-            except Exception as e:
-                logging.error(f"❌ Erro geral no monitoramento: {e}")
-                await asyncio.sleep(10)
+        monitor = Monitor(universo, self.fetcher, self.cache, self.agendador, self.cooldown,
+                          self.analisador, self.saida, INTERVALOS, self.stream, ESPALHAR_SEGUNDOS,
+                          strategies=self.estrategias)
+        await monitor.run()
 
 
 # 🚀 Executa o bot
-bot = BotShort(intents=intents)
-bot.run(DISCORD_TOKEN)
+if __name__ == '__main__':
+    bot = BotShort(intents=intents)
+    bot.run(DISCORD_TOKEN)
@@ -0,0 +1,74 @@
+#cooldown.py
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AlertCooldown:
+    # Silencia por `ttl` segundos os símbolos que já geraram alerta.
+    # Os prazos ficam num dict em memória (consulta O(1), sem I/O no ciclo) e são
+    # gravados num SQLite, então um restart não libera todos os símbolos de uma vez.
+    # Registros vencidos saem da memória na consulta e do banco a cada `compact_every` segundos.
+    def __init__(self, path='alertas.db', ttl=6 * 3600, compact_every=3600, clock=time.time):
+        self.ttl = ttl
+        self.compact_every = compact_every
+        self.clock = clock
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS cooldown (symbol TEXT PRIMARY KEY, until REAL NOT NULL)")
+        self._db.commit()
+        self._until = {}
+        self._last_compact = 0
+        self.compact()
+        self._until = dict(self._db.execute("SELECT symbol, until FROM cooldown"))
+        if self._until:
+            logger.info(f"{len(self._until)} símbolos em cooldown carregados de {path}.")
+
+    def __len__(self):
+        return len(self._until)
+
+    def __contains__(self, symbol):
+        return self.is_muted(symbol)
+
+    def is_muted(self, symbol, now=None):
+        until = self._until.get(symbol)
+        if until is None:
+            return False
+        if until > (self.clock() if now is None else now):
+            return True
+        del self._until[symbol]
+        return False
+
+    def remaining(self, symbol, now=None):
+        # Segundos de cooldown que ainda faltam para o símbolo (0 se não está silenciado)
+        now = self.clock() if now is None else now
+        return max(self._until.get(symbol, now) - now, 0)
+
+    def mute(self, symbol, now=None, ttl=None):
+        now = self.clock() if now is None else now
+        until = now + (self.ttl if ttl is None else ttl)
+        self._until[symbol] = until
+        self._db.execute("INSERT OR REPLACE INTO cooldown (symbol, until) VALUES (?, ?)", (symbol, until))
+        self._db.commit()
+        if now - self._last_compact >= self.compact_every:
+            self.compact(now)
+
+    def unmute(self, symbol):
+        # Libera o símbolo antes do prazo (ex.: o alerta que o silenciou não foi entregue)
+        if self._until.pop(symbol, None) is not None:
+            self._db.execute("DELETE FROM cooldown WHERE symbol = ?", (symbol,))
+            self._db.commit()
+
+    def compact(self, now=None):
+        now = self.clock() if now is None else now
+        removidos = self._db.execute("DELETE FROM cooldown WHERE until <= ?", (now,)).rowcount
+        self._db.commit()
+        self._last_compact = now
+        for symbol in [s for s, until in self._until.items() if until <= now]:
+            del self._until[symbol]
+        if removidos:
+            logger.debug(f"{removidos} cooldowns vencidos removidos do banco.")
+
+    def close(self):
+        self._db.close()
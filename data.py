@@ -1,11 +1,26 @@
 # data.py
+import asyncio
+import os
+import time
+from collections import deque
 import requests
+import aiohttp
 from binance.client import Client
+import numpy as np
 import pandas as pd
 import logging
+from metrics import HTTP_SECONDS, WEIGHT_USED, CACHE_LOOKUPS
 
 logger = logging.getLogger(__name__)
 
+FUTURES_BASE_URL = "https://fapi.binance.com"
+
+KLINE_COLUMNS = [
+    'open_time', 'open', 'high', 'low', 'close', 'volume',
+    'close_time', 'quote_asset_volume', 'num_trades',
+    'taker_buy_base', 'taker_buy_quote', 'ignore'
+]
+
 def get_binance_client(api_key, api_secret):
     logger.debug("Inicializando cliente Binance...")
     client = Client(api_key, api_secret)
@@ -19,47 +34,157 @@ def get_recent_futures(client):
     logger.debug(f"Encontrados {len(symbols)} símbolos futuros.")
     return symbols
     
-def get_klines(client, symbol, interval='15m', limit=100):
-    logger.debug(f"Buscando candles para {symbol} (intervalo {interval}, limite {limit})...")
-    klines = client.futures_klines(symbol=symbol, interval=interval, limit=limit)
-    logger.debug(f"{len(klines)} candles recebidos para {symbol}.")
+# Posições das colunas numéricas na linha de kline (REST e WebSocket convertido)
+CANDLE_FLOAT_COLUMNS = {
+    'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5,
+    'quote_asset_volume': 7, 'taker_buy_base': 9, 'taker_buy_quote': 10
+}
+CANDLE_INT_COLUMNS = {'open_time': 0, 'close_time': 6, 'num_trades': 8}
+_FLOAT_ROWS = {name: row for row, name in enumerate(CANDLE_FLOAT_COLUMNS)}
+_INT_ROWS = {name: row for row, name in enumerate(CANDLE_INT_COLUMNS)}
+
+
+class Candles:
+    # Série de candles em colunas contíguas (float64, ou float32 se pedido; int64 para tempos).
+    # O símbolo fica uma vez só como metadado. As linhas de kline são convertidas direto
+    # nos buffers pré-alocados; o buffer tem o dobro da capacidade e, quando enche,
+    # os candles mais recentes são movidos para o início, então as colunas expostas
+    # são sempre views contíguas, sem cópia.
+    __slots__ = ('symbol', 'interval', 'capacity', '_floats', '_ints', '_start', '_len')
+
+    def __init__(self, symbol, interval=None, capacity=100, dtype=np.float64):
+        self.symbol = symbol
+        self.interval = interval
+        self.capacity = capacity
+        self._floats = np.empty((len(CANDLE_FLOAT_COLUMNS), 2 * capacity), dtype=dtype)
+        self._ints = np.empty((len(CANDLE_INT_COLUMNS), 2 * capacity), dtype=np.int64)
+        self._start = 0
+        self._len = 0
+
+    @classmethod
+    def from_klines(cls, klines, symbol, interval=None, capacity=None, dtype=np.float64):
+        candles = cls(symbol, interval, capacity or max(len(klines), 1), dtype)
+        candles.merge(klines)
+        return candles
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, name):
+        end = self._start + self._len
+        if name in _FLOAT_ROWS:
+            return self._floats[_FLOAT_ROWS[name], self._start:end]
+        return self._ints[_INT_ROWS[name], self._start:end]
+
+    @property
+    def close(self):
+        return self['close']
+
+    @property
+    def high(self):
+        return self['high']
+
+    @property
+    def low(self):
+        return self['low']
+
+    @property
+    def open_time(self):
+        return self['open_time']
+
+    def last_open_time(self):
+        return int(self._ints[0, self._start + self._len - 1]) if self._len else None
+
+    def last_close_time(self):
+        return int(self._ints[1, self._start + self._len - 1]) if self._len else None
 
-    df = pd.DataFrame(klines, columns=[
-        'open_time', 'open', 'high', 'low', 'close', 'volume',
-        'close_time', 'quote_asset_volume', 'num_trades',
-        'taker_buy_base', 'taker_buy_quote', 'ignore'
-    ])
+    def last_closed_time(self, now=None):
+        # close_time do candle mais recente já fechado em `now` (o último pode estar em formação)
+        now = int(time.time() * 1000) if now is None else now
+        close_time = self['close_time']
+        i = int(np.searchsorted(close_time, now)) - 1
+        return int(close_time[i]) if i >= 0 else None
 
-    df['close'] = df['close'].astype(float)
-    df['high'] = df['high'].astype(float)
-    df['low'] = df['low'].astype(float)
+    def clear(self):
+        self._start = self._len = 0
 
-    # Add the symbol column here
-    df['symbol'] = symbol
+    def _write(self, pos, kline):
+        for row, col in enumerate(CANDLE_FLOAT_COLUMNS.values()):
+            self._floats[row, pos] = float(kline[col])
+        for row, col in enumerate(CANDLE_INT_COLUMNS.values()):
+            self._ints[row, pos] = int(kline[col])
 
-    logger.debug(f"DataFrame montado para {symbol} com {df.shape[0]} linhas.")
-    return df
+    def _append_slot(self):
+        if self._len == self.capacity:
+            self._start += 1
+            self._len -= 1
+        if self._start + self._len == self._floats.shape[1]:
+            # Buffer cheio: move a janela atual para o início (custo amortizado O(1))
+            end = self._start + self._len
+            self._floats[:, :self._len] = self._floats[:, self._start:end]
+            self._ints[:, :self._len] = self._ints[:, self._start:end]
+            self._start = 0
+        self._len += 1
+        return self._start + self._len - 1
 
+    def merge(self, klines):
+        # Mesmo open_time do último candle: candle em formação atualizado no lugar;
+        # open_time maior: candle novo; mais antigo: ignorado
+        for kline in klines:
+            last = self.last_open_time()
+            if last is not None and kline[0] == last:
+                self._write(self._start + self._len - 1, kline)
+            elif last is None or kline[0] > last:
+                self._write(self._append_slot(), kline)
+        return self
 
-def obter_moedas_com_capitalizacao(min_cap, max_cap):
+    def to_frame(self):
+        # DataFrame montado sobre as views dos buffers (zero-copy); o símbolo vai em df.attrs
+        columns = {name: self[name] for name in CANDLE_INT_COLUMNS}
+        columns.update({name: self[name] for name in CANDLE_FLOAT_COLUMNS})
+        df = pd.DataFrame(columns, copy=False)
+        df.attrs['symbol'] = self.symbol
+        return df
+
+
+COINGECKO_MARKETS_URL = "https://api.coingecko.com/api/v3/coins/markets"
+
+# Sessão HTTP compartilhada: reaproveita conexões TCP/TLS entre chamadas ao CoinGecko
+http_session = requests.Session()
+
+
+def obter_moedas_com_capitalizacao(min_cap, max_cap, session=None, per_page=250, max_pages=20,
+                                   url=COINGECKO_MARKETS_URL):
     logger.debug(f"Consultando moedas no CoinGecko com market cap entre {min_cap} e {max_cap} USD...")
+    session = session or http_session
 
-    url = "https://api.coingecko.com/api/v3/coins/markets"
-    params = {
-        "vs_currency": "usd",
-        "order": "market_cap_desc",
-        "per_page": 250,
-        "page": 1
-    }
+    # A lista vem ordenada por market cap decrescente, então paginamos até
+    # passar do limite inferior da faixa (antes só a página 1 era lida e a
+    # faixa era truncada silenciosamente).
+    moedas = []
+    for page in range(1, max_pages + 1):
+        params = {
+            "vs_currency": "usd",
+            "order": "market_cap_desc",
+            "per_page": per_page,
+            "page": page
+        }
+        try:
+            resposta = session.get(url, params=params, timeout=15)
+            resposta.raise_for_status()
+            pagina = resposta.json()
+        except requests.RequestException as e:
+            # Qualquer página que falha invalida a lista inteira: uma faixa truncada
+            # trocaria o universo em cache por um pedaço dele
+            logger.error(f"Erro ao buscar moedas no CoinGecko (página {page}): {e}")
+            raise
 
-    try:
-        resposta = requests.get(url, params=params)
-        resposta.raise_for_status()
-        moedas = resposta.json()
-        logger.debug(f"Recebidas {len(moedas)} moedas do CoinGecko.")
-    except requests.RequestException as e:
-        logger.error(f"Erro ao buscar moedas no CoinGecko: {e}")
-        return []
+        moedas.extend(pagina)
+        caps = [m["market_cap"] for m in pagina if m.get("market_cap")]
+        if len(pagina) < per_page or not caps or caps[-1] < min_cap:
+            break
+
+    logger.debug(f"Recebidas {len(moedas)} moedas do CoinGecko em {page} página(s).")
 
     moedas_filtradas = [
         moeda for moeda in moedas
@@ -70,3 +195,624 @@ def obter_moedas_com_capitalizacao(min_cap, max_cap):
     logger.debug(f"Moedas filtradas: {[m['id'] for m in moedas_filtradas]}")
 
     return moedas_filtradas
+
+
+def get_perpetual_index(client, quote_asset='USDT'):
+    # {base asset: símbolo perpétuo}, para casar moedas do CoinGecko em O(1)
+    logger.debug("Montando índice de futuros PERPETUAIS por base asset...")
+    info = client.futures_exchange_info()
+    index = {
+        s['baseAsset']: s['symbol'] for s in info['symbols']
+        if s['contractType'] == 'PERPETUAL' and s['quoteAsset'] == quote_asset
+    }
+    logger.debug(f"Índice com {len(index)} perpétuos em {quote_asset}.")
+    return index
+
+
+class TTLValue:
+    # Valor carregado por uma função bloqueante, com TTL e stale-while-revalidate:
+    # - dentro do TTL devolve o valor guardado
+    # - vencido há menos de `max_stale`, devolve o valor antigo e recarrega em background
+    # - sem valor (ou velho demais), espera o carregamento
+    # Um valor que não passa em `validate` conta como falha do carregamento.
+    def __init__(self, loader, ttl, max_stale=None, validate=None):
+        self.loader = loader
+        self.validate = validate
+        self.ttl = ttl
+        self.max_stale = ttl if max_stale is None else max_stale
+        self.value = None
+        self.loaded_at = None
+        self._refresh_task = None
+
+    def age(self):
+        return None if self.loaded_at is None else time.monotonic() - self.loaded_at
+
+    async def _load(self):
+        value = await asyncio.to_thread(self.loader)
+        if self.validate is not None and not self.validate(value):
+            raise ValueError(f"Valor carregado rejeitado: {str(value)[:100]}")
+        self.value, self.loaded_at = value, time.monotonic()
+        return value
+
+    async def _refresh(self):
+        try:
+            await self._load()
+        except Exception as e:
+            logger.warning(f"Falha ao recarregar valor em background, mantendo o anterior: {e}")
+
+    async def get(self):
+        age = self.age()
+        if age is not None and age <= self.ttl:
+            return self.value
+        if age is not None and age <= self.ttl + self.max_stale:
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._refresh())
+            return self.value
+        if self._refresh_task is not None and not self._refresh_task.done():
+            await self._refresh_task
+            if self.age() is not None and self.age() <= self.ttl:
+                return self.value
+        return await self._load()
+
+
+class UniverseResolver:
+    # Resolve a lista de símbolos perpétuos da faixa de market cap.
+    # CoinGecko e exchange info mudam devagar, então ficam em cache com TTL
+    # em vez de serem consultados a cada ciclo.
+    # `markets_url` troca o endpoint do CoinGecko (ex.: servidor falso do loadtest.py).
+    # Resposta vazia é tratada como falha, então o último universo bom continua valendo.
+    def __init__(self, client, min_cap, max_cap, quote_asset='USDT', moedas_ttl=300, futuros_ttl=900, session=None,
+                 markets_url=COINGECKO_MARKETS_URL):
+        self.quote_asset = quote_asset
+        self._moedas = TTLValue(
+            lambda: obter_moedas_com_capitalizacao(min_cap, max_cap, session, url=markets_url), moedas_ttl,
+            validate=bool
+        )
+        self._perpetuos = TTLValue(lambda: get_perpetual_index(client, quote_asset), futuros_ttl, validate=bool)
+
+    async def symbols(self):
+        moedas, perpetuos = await asyncio.gather(self._moedas.get(), self._perpetuos.get())
+        symbols = []
+        vistos = set()
+        for moeda in moedas:
+            symbol = perpetuos.get(moeda['symbol'].upper())
+            if symbol is not None and symbol not in vistos:
+                vistos.add(symbol)
+                symbols.append(symbol)
+        return symbols
+
+def kline_request_weight(limit):
+    # Peso de /fapi/v1/klines conforme a documentação da Binance (USDⓈ-M Futures)
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+class WeightBudget:
+    # Janela deslizante de 60 s com o peso de requisições já consumido.
+    # A Binance limita os futuros a 2400 de peso por minuto por IP; por padrão
+    # usamos só uma fração disso para deixar folga para outras chamadas.
+    def __init__(self, limit=2400, window=60.0, safety=0.8):
+        self.limit = int(limit * safety)
+        self.window = window
+        self._events = deque()
+        self._local_used = 0
+        self._server_used = 0
+        self._server_seen_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def used(self):
+        now = time.monotonic()
+        cutoff = now - self.window
+        while self._events and self._events[0][0] <= cutoff:
+            self._local_used -= self._events.popleft()[1]
+        local = self._local_used
+        # O header X-MBX-USED-WEIGHT-1M é a fonte da verdade enquanto for recente
+        if now - self._server_seen_at < self.window:
+            return max(local, self._server_used)
+        return local
+
+    def update_from_server(self, used):
+        self._server_used = used
+        self._server_seen_at = time.monotonic()
+
+    async def acquire(self, weight):
+        async with self._lock:
+            while self.used() + weight > self.limit:
+                wait = self._events[0][0] + self.window - time.monotonic() if self._events else 1.0
+                logger.debug(f"Orçamento de peso esgotado ({self.used()}/{self.limit}), aguardando {wait:.1f}s...")
+                await asyncio.sleep(max(wait, 0.05))
+            self._events.append((time.monotonic(), weight))
+            self._local_used += weight
+
+
+class AsyncKlineFetcher:
+    # Busca candles de vários (symbol, interval) em paralelo sem bloquear o event loop.
+    # - max_concurrency limita as requisições simultâneas
+    # - o TCPConnector reaproveita as conexões HTTP (keep-alive)
+    # - WeightBudget respeita o limite de peso por minuto da Binance
+    def __init__(self, base_url=FUTURES_BASE_URL, max_concurrency=20, weight_limit=2400,
+                 timeout=10, max_retries=3):
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.budget = WeightBudget(limit=weight_limit)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _get_json(self, path, params, weight):
+        url = f"{self.base_url}{path}"
+        for tentativa in range(self.max_retries + 1):
+            await self.budget.acquire(weight)
+            async with self._semaphore:
+                inicio = time.perf_counter()
+                async with self._get_session().get(url, params=params) as resposta:
+                    HTTP_SECONDS.observe(time.perf_counter() - inicio, endpoint=path, status=resposta.status)
+                    usado = resposta.headers.get('X-MBX-USED-WEIGHT-1M')
+                    if usado is not None:
+                        self.budget.update_from_server(int(usado))
+                    WEIGHT_USED.set(self.budget.used())
+                    if resposta.status not in (418, 429) or tentativa == self.max_retries:
+                        resposta.raise_for_status()
+                        return await resposta.json()
+                    espera = float(resposta.headers.get('Retry-After', 2 ** tentativa))
+            # A espera do Retry-After acontece fora do semáforo, sem segurar a vaga das outras requisições
+            logger.warning(f"Binance respondeu {resposta.status}, aguardando {espera}s antes de tentar novamente...")
+            await asyncio.sleep(espera)
+
+    async def fetch_raw(self, symbol, interval='15m', limit=100, start_time=None):
+        params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+        if start_time is not None:
+            params['startTime'] = int(start_time)
+        return await self._get_json('/fapi/v1/klines', params, kline_request_weight(limit))
+
+    async def fetch_tickers(self):
+        # Ticker 24h de todos os símbolos numa requisição só (peso 40), {symbol: ticker}
+        tickers = await self._get_json('/fapi/v1/ticker/24hr', {}, 40)
+        return {t['symbol']: t for t in tickers}
+
+    async def fetch_range(self, symbol, interval, start_time, end_time=None, page_size=1000):
+        # Histórico longo paginado por startTime; 1000 candles por página é o melhor custo por peso
+        end_time = int(time.time() * 1000) if end_time is None else int(end_time)
+        klines = []
+        cursor = int(start_time)
+        while cursor < end_time:
+            pagina = await self.fetch_raw(symbol, interval, page_size, start_time=cursor)
+            pagina = [k for k in pagina if k[0] < end_time]
+            if not pagina:
+                break
+            klines.extend(pagina)
+            cursor = pagina[-1][0] + INTERVAL_MS[interval]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"{len(klines)} candles históricos recebidos para {symbol} ({interval}).")
+        return klines
+
+
+# Maior buraco (em candles) que o KlineCache tenta recuperar para o KlineStore numa busca completa
+STORE_GAP_LIMIT = 10_000
+
+INTERVAL_MS = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000,
+    '8h': 28_800_000, '12h': 43_200_000, '1d': 86_400_000
+}
+
+
+def resample_klines(base, interval, since=None):
+    # Agrega uma série de candles menores (Candles ou StoredKlines) em linhas de kline de `interval`.
+    # Os buckets seguem o alinhamento da Binance (múltiplos do intervalo desde o epoch, UTC).
+    # O primeiro bucket só entra se a série cobrir o início dele; o último pode estar
+    # em formação, e aí sai parcial, como o candle em formação da própria Binance.
+    # `since`: devolve só os buckets com open_time >= since.
+    step = INTERVAL_MS[interval]
+    open_time = np.asarray(base['open_time'])
+    if not len(open_time):
+        return []
+    buckets = open_time // step * step
+    inicio = 0 if open_time[0] == buckets[0] else int(np.searchsorted(buckets, buckets[0], side='right'))
+    if since is not None:
+        inicio = max(inicio, int(np.searchsorted(buckets, since)))
+    buckets = buckets[inicio:]
+    if not len(buckets):
+        return []
+
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+
+    def col(name):
+        return np.asarray(base[name])[inicio:]
+
+    abertura = buckets[starts]
+    colunas = [
+        abertura,
+        col('open')[starts],
+        np.maximum.reduceat(col('high'), starts),
+        np.minimum.reduceat(col('low'), starts),
+        col('close')[ends],
+        np.add.reduceat(col('volume'), starts),
+        abertura + step - 1,
+        np.add.reduceat(col('quote_asset_volume'), starts),
+        np.add.reduceat(col('num_trades'), starts),
+        np.add.reduceat(col('taker_buy_base'), starts),
+        np.add.reduceat(col('taker_buy_quote'), starts),
+    ]
+    return [linha + ['0'] for linha in map(list, zip(*(c.tolist() for c in colunas)))]
+
+
+class KlineCache:
+    # Cache incremental de candles por (symbol, interval).
+    # Cada série é um buffer circular (Candles) com os últimos `capacity` candles;
+    # a cada ciclo só pedimos à Binance os candles a partir do último guardado,
+    # e o candle ainda em formação é substituído no lugar.
+    # Se `indicators` (indicators.IndicatorEngine) for informado, ele é alimentado
+    # com cada candle mesclado e mantém EMA/RSI/MACD atualizados em O(1).
+    # Com um `store` (KlineStore), as séries novas partem do histórico local (útil
+    # após um restart) e os candles fechados são gravados nele.
+    # `derived` ({'1h': '15m', ...}) monta esses intervalos a partir da série base:
+    # a série derivada é buscada uma vez (REST ou store) e, daí em diante, cada
+    # merge na base reconstrói os buckets afetados, sem requisição própria.
+    def __init__(self, fetcher, capacity=100, indicators=None, dtype=np.float64, store=None, derived=None):
+        self.fetcher = fetcher
+        self.capacity = capacity
+        self.indicators = indicators
+        self.dtype = dtype
+        self.store = store
+        self.derived = dict(derived or {})
+        self._series = {}
+
+    def __len__(self):
+        return len(self._series)
+
+    def __contains__(self, key):
+        return key in self._series
+
+    def merge(self, symbol, interval, klines):
+        buf = self._series.get((symbol, interval))
+        if buf is None:
+            buf = self._series[(symbol, interval)] = Candles(symbol, interval, self.capacity, self.dtype)
+        buf.merge(klines)
+        if self.indicators is not None:
+            self.indicators.feed(symbol, interval, klines)
+        if self.store is not None:
+            self.store.queue(symbol, interval, klines)
+        for alvo, base in self.derived.items():
+            if base == interval:
+                self._resample(symbol, alvo, buf)
+        return buf
+
+    def _resample(self, symbol, interval, base):
+        buf = self._series.get((symbol, interval))
+        if not buf:
+            return
+        ultimo = buf.last_open_time()
+        novos = resample_klines(base, interval, since=ultimo)
+        if not novos:
+            return
+        if novos[0][0] != ultimo:
+            # A base não cobre mais o último bucket (ex.: rebusca completa após um buraco):
+            # a série derivada é descartada e buscada de novo no próximo update
+            logger.debug(f"Série derivada {symbol} ({interval}) perdeu a continuidade; será recarregada.")
+            self._discard(symbol, interval)
+            return
+        self.merge(symbol, interval, novos)
+
+    def _discard(self, symbol, interval):
+        self._series.pop((symbol, interval), None)
+        if self.indicators is not None:
+            self.indicators.reset(symbol, interval)
+
+    def source(self, symbol, interval):
+        # Par que de fato precisa ser buscado para manter (symbol, interval) atualizado
+        base = self.derived.get(interval)
+        if base is not None and (symbol, interval) in self._series:
+            return symbol, base
+        return symbol, interval
+
+    def _seed_from_store(self, symbol, interval):
+        linhas = self.store.tail(symbol, interval, self.capacity).rows()
+        if linhas:
+            logger.debug(f"{len(linhas)} candles de {symbol} ({interval}) carregados do histórico local.")
+            self.merge(symbol, interval, linhas)
+
+    def series(self, symbol, interval):
+        return self._series[(symbol, interval)]
+
+    def frame(self, symbol, interval):
+        return self._series[(symbol, interval)].to_frame()
+
+    def _pending_request(self, symbol, interval):
+        # Decide (limit, start_time) da próxima busca; start_time None = busca completa
+        buf = self._series.get((symbol, interval))
+        if not buf:
+            return self.capacity, None
+        # Sempre rebusca o último candle guardado: ele pode ter sido salvo ainda em formação
+        now = int(time.time() * 1000)
+        last_open = buf.last_open_time()
+        faltando = (now - last_open) // INTERVAL_MS[interval] + 2
+        if faltando >= self.capacity:
+            return self.capacity, None
+        return faltando, last_open
+
+    async def update(self, symbol, interval):
+        fonte = self.source(symbol, interval)
+        if fonte != (symbol, interval):
+            await self.update(*fonte)
+            if (symbol, interval) in self._series:
+                CACHE_LOOKUPS.inc(result='derived')
+                return self.series(symbol, interval)
+        if self.store is not None and (symbol, interval) not in self._series:
+            self._seed_from_store(symbol, interval)
+        limit, start_time = self._pending_request(symbol, interval)
+        if start_time is None:
+            self._discard(symbol, interval)
+        CACHE_LOOKUPS.inc(result='full' if start_time is None else 'incremental')
+        klines = await self.fetcher.fetch_raw(symbol, interval, limit, start_time=start_time)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"{len(klines)} candles novos para {symbol} ({interval}), início={start_time}.")
+        if start_time is None and self.store is not None:
+            await self._fill_store_gap(symbol, interval, klines)
+        return self.merge(symbol, interval, klines)
+
+    async def _fill_store_gap(self, symbol, interval, klines):
+        # Busca completa depois de um buraco maior que o cache: o trecho entre o último
+        # candle gravado e o primeiro recebido é buscado e gravado antes, senão o histórico
+        # fica com um buraco que voltaria para o cache no próximo restart. Se não der para
+        # buscar, o histórico da série é apagado e recomeça a partir destes candles.
+        ultimo = self.store.last_open_time(symbol, interval)
+        step = INTERVAL_MS[interval]
+        if ultimo is None or not klines or klines[0][0] <= ultimo + step:
+            return
+        faltando = (klines[0][0] - ultimo) // step - 1
+        try:
+            if faltando > STORE_GAP_LIMIT:
+                raise ValueError(f"mais de {STORE_GAP_LIMIT} candles")
+            linhas = await self.fetcher.fetch_range(symbol, interval, ultimo + step, klines[0][0])
+            self.store.queue(symbol, interval, linhas)
+            logger.info(f"{len(linhas)} candles de {symbol} ({interval}) recuperados para o histórico local.")
+        except Exception as e:
+            logger.warning(f"Buraco de {faltando} candles de {symbol} ({interval}) no histórico local não foi "
+                           f"preenchido ({e}); o histórico da série recomeça agora.")
+            self.store.drop(symbol, interval)
+
+    async def update_many(self, pairs):
+        # {(symbol, interval): Candles ou exceção}
+        # Séries derivadas saem da atualização da base: cada base é buscada uma vez só
+        pairs = list(pairs)
+        fontes = {pair: self.source(*pair) for pair in pairs}
+        buscar = list(dict.fromkeys(fontes.values()))
+        buscados = dict(zip(buscar, await asyncio.gather(
+            *(self.update(symbol, interval) for symbol, interval in buscar),
+            return_exceptions=True
+        )))
+        resultados = {}
+        for pair, fonte in fontes.items():
+            if fonte == pair or isinstance(buscados[fonte], Exception):
+                resultados[pair] = buscados[fonte]
+            elif pair in self._series:
+                resultados[pair] = self._series[pair]
+                CACHE_LOOKUPS.inc(result='derived')
+        # Derivadas descartadas por perda de continuidade voltam a ser buscadas direto
+        faltando = [pair for pair in pairs if pair not in resultados]
+        if faltando:
+            resultados.update(zip(faltando, await asyncio.gather(
+                *(self.update(symbol, interval) for symbol, interval in faltando),
+                return_exceptions=True
+            )))
+        return {pair: resultados[pair] for pair in pairs}
+
+    def retain(self, symbols):
+        # Remove as séries de símbolos que saíram do universo filtrado
+        symbols = set(symbols)
+        removidos = [key for key in self._series if key[0] not in symbols]
+        for key in removidos:
+            del self._series[key]
+        if self.indicators is not None:
+            self.indicators.retain(symbols)
+        if removidos:
+            logger.debug(f"{len(removidos)} séries removidas do cache de candles.")
+
+
+class StoredKlines:
+    # Colunas de uma série lidas do KlineStore: cada coluna é um np.memmap (zero-copy).
+    # Expõe a mesma interface de leitura de Candles (len, series['close'], open_time).
+    def __init__(self, symbol, interval, columns):
+        self.symbol = symbol
+        self.interval = interval
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['open_time'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def open_time(self):
+        return self.columns['open_time']
+
+    @property
+    def close(self):
+        return self.columns['close']
+
+    def rows(self):
+        # Linhas no formato de kline do REST, para alimentar Candles/KlineCache
+        n = len(self)
+        linhas = [[0] * len(KLINE_COLUMNS) for _ in range(n)]
+        for name, pos in {**CANDLE_INT_COLUMNS, **CANDLE_FLOAT_COLUMNS}.items():
+            for linha, valor in zip(linhas, self.columns[name].tolist()):
+                linha[pos] = valor
+        return linhas
+
+
+class KlineStore:
+    # Histórico local em colunas: <root>/<interval>/<SYMBOL>/<coluna>.bin, um arquivo
+    # por coluna (int64 para tempos, float64 para preços/volumes). Só candles fechados
+    # são gravados, sempre em append. A leitura mapeia os arquivos em memória, sem cópia.
+    # Se um append for interrompido no meio, as colunas mais longas são ignoradas na
+    # leitura (o tamanho válido é o da menor coluna) e cortadas no próximo append.
+    # Dentro do event loop, queue() só acumula os candles em memória: a gravação sai em
+    # lote, numa thread, `flush_delay` segundos depois (flush() espera terminar).
+    def __init__(self, root, flush_delay=0.5):
+        self.root = os.path.abspath(root)
+        self.flush_delay = flush_delay
+        self._last_open = {}
+        self._lengths = {}
+        self._pending = {}
+        self._drops = set()
+        self._writer = None
+
+    def _dir(self, symbol, interval):
+        return os.path.join(self.root, interval, symbol)
+
+    def _path(self, symbol, interval, column):
+        return os.path.join(self._dir(symbol, interval), f"{column}.bin")
+
+    @staticmethod
+    def _dtype(column):
+        return np.int64 if column in CANDLE_INT_COLUMNS else np.float64
+
+    def _all_columns(self):
+        return list(CANDLE_INT_COLUMNS) + list(CANDLE_FLOAT_COLUMNS)
+
+    def _stored_len(self, symbol, interval):
+        tamanhos = []
+        for column in self._all_columns():
+            path = self._path(symbol, interval, column)
+            tamanhos.append(os.path.getsize(path) // 8 if os.path.exists(path) else 0)
+        return min(tamanhos)
+
+    def symbols(self, interval):
+        pasta = os.path.join(self.root, interval)
+        return sorted(os.listdir(pasta)) if os.path.isdir(pasta) else []
+
+    def time_range(self, symbol, interval):
+        # (primeiro open_time, último open_time) lendo só as duas pontas do arquivo
+        n = self._stored_len(symbol, interval)
+        if n == 0:
+            return None
+        ot = np.memmap(self._path(symbol, interval, 'open_time'), dtype=np.int64, mode='r', shape=(n,))
+        return int(ot[0]), int(ot[-1])
+
+    def last_open_time(self, symbol, interval):
+        # Inclui os candles ainda na fila de gravação
+        key = (symbol, interval)
+        if key not in self._last_open:
+            faixa = self.time_range(symbol, interval)
+            self._last_open[key] = faixa[1] if faixa else None
+        return self._last_open[key]
+
+    def _closed_new(self, symbol, interval, klines, now):
+        now = int(time.time() * 1000) if now is None else now
+        ultimo = self.last_open_time(symbol, interval)
+        novos = sorted((k for k in klines if k[6] < now and (ultimo is None or k[0] > ultimo)), key=lambda k: k[0])
+        if novos:
+            self._last_open[(symbol, interval)] = int(novos[-1][0])
+        return novos
+
+    def queue(self, symbol, interval, klines, now=None):
+        # Só candles fechados e mais novos que o último gravado; a gravação fica para o
+        # writer em thread (sem event loop rodando, grava na hora). Retorna quantos entraram
+        novos = self._closed_new(symbol, interval, klines, now)
+        if novos:
+            self._pending.setdefault((symbol, interval), []).extend(novos)
+            self._schedule()
+        return len(novos)
+
+    def drop(self, symbol, interval):
+        # Apaga o histórico da série (os candles na fila também); a próxima gravação recomeça do zero
+        key = (symbol, interval)
+        self._pending.pop(key, None)
+        self._drops.add(key)
+        self._last_open[key] = None
+        self._schedule()
+
+    def _schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_pending()
+            return
+        if self._writer is None or self._writer.done():
+            self._writer = loop.create_task(self._write_loop())
+
+    async def _write_loop(self):
+        while self._pending or self._drops:
+            await asyncio.sleep(self.flush_delay)
+            lote, self._pending = self._pending, {}
+            drops, self._drops = self._drops, set()
+            try:
+                await asyncio.to_thread(self._write, lote, drops)
+            except OSError as e:
+                # Tamanho e último candle das séries do lote voltam a ser lidos do disco
+                logger.error(f"Falha ao gravar {len(lote)} séries no histórico local: {e}")
+                for key in lote:
+                    self._lengths.pop(key, None)
+                    self._last_open.pop(key, None)
+
+    async def flush(self):
+        # Espera a fila de gravação esvaziar
+        while self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+
+    def _write_pending(self):
+        lote, self._pending = self._pending, {}
+        drops, self._drops = self._drops, set()
+        self._write(lote, drops)
+
+    def _write(self, lote, drops):
+        for symbol, interval in drops:
+            for column in self._all_columns():
+                path = self._path(symbol, interval, column)
+                if os.path.exists(path):
+                    os.remove(path)
+            self._lengths[(symbol, interval)] = 0
+        for (symbol, interval), novos in lote.items():
+            os.makedirs(self._dir(symbol, interval), exist_ok=True)
+            n = self._lengths.get((symbol, interval))
+            if n is None:
+                n = self._stored_len(symbol, interval)
+            for column, pos in {**CANDLE_INT_COLUMNS, **CANDLE_FLOAT_COLUMNS}.items():
+                converte = int if column in CANDLE_INT_COLUMNS else float
+                valores = np.fromiter((converte(k[pos]) for k in novos), dtype=self._dtype(column), count=len(novos))
+                with open(self._path(symbol, interval, column), 'ab') as f:
+                    f.truncate(n * 8)
+                    f.write(valores.tobytes())
+            self._lengths[(symbol, interval)] = n + len(novos)
+
+    def read(self, symbol, interval, start=None, end=None):
+        # Série [start, end) por open_time como views de np.memmap; busca binária no open_time
+        n = self._stored_len(symbol, interval)
+        columns = {
+            column: (np.memmap(self._path(symbol, interval, column), dtype=self._dtype(column), mode='r', shape=(n,))
+                     if n else np.empty(0, dtype=self._dtype(column)))
+            for column in self._all_columns()
+        }
+        ot = columns['open_time']
+        i = 0 if start is None else int(np.searchsorted(ot, start, side='left'))
+        j = n if end is None else int(np.searchsorted(ot, end, side='left'))
+        return StoredKlines(symbol, interval, {name: col[i:j] for name, col in columns.items()})
+
+    def tail(self, symbol, interval, n):
+        stored = self.read(symbol, interval)
+        return StoredKlines(symbol, interval, {name: col[-n:] if n else col[:0] for name, col in stored.columns.items()})
@@ -0,0 +1,221 @@
+# indicators.py
+import math
+import time
+import logging
+from collections import deque
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EMAState:
+    # Mesma recorrência do ewm(span=period, adjust=False).mean() do pandas:
+    # o primeiro valor inicia a média e cada fechamento entra com alpha = 2 / (span + 1).
+    __slots__ = ('alpha', 'old_wt', 'value')
+
+    def __init__(self, period):
+        self.alpha = 2 / (period + 1)
+        self.old_wt = 1 - self.alpha
+        self.value = None
+
+    def peek(self, x):
+        if self.value is None:
+            return x
+        return (self.old_wt * self.value + self.alpha * x) / (self.old_wt + self.alpha)
+
+    def push(self, x):
+        self.value = self.peek(x)
+        return self.value
+
+
+class RSIState:
+    # method='sma' reproduz calculate_rsi (média móvel de ganhos/perdas, com o primeiro
+    # candle contando como variação zero); method='wilder' parte dessa mesma média e
+    # depois suaviza recursivamente com alpha = 1 / period.
+    __slots__ = ('period', 'method', 'prev_close', 'gains', 'losses', 'avg_gain', 'avg_loss')
+
+    def __init__(self, period=14, method='sma'):
+        if method not in ('sma', 'wilder'):
+            raise ValueError(f"Método de RSI desconhecido: {method}")
+        self.period = period
+        self.method = method
+        self.prev_close = None
+        self.gains = deque(maxlen=period)
+        self.losses = deque(maxlen=period)
+        self.avg_gain = None
+        self.avg_loss = None
+
+    def _step(self, close):
+        delta = 0.0 if self.prev_close is None else close - self.prev_close
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        if self.method == 'wilder' and self.avg_gain is not None:
+            n = self.period
+            return gain, loss, (self.avg_gain * (n - 1) + gain) / n, (self.avg_loss * (n - 1) + loss) / n
+        if len(self.gains) + 1 < self.period:
+            return gain, loss, None, None
+        keep = len(self.gains) - (self.period - 1)
+        gains = list(self.gains)[keep:] + [gain]
+        losses = list(self.losses)[keep:] + [loss]
+        return gain, loss, math.fsum(gains) / self.period, math.fsum(losses) / self.period
+
+    @staticmethod
+    def _rsi(avg_gain, avg_loss):
+        if avg_gain is None:
+            return math.nan
+        if avg_loss == 0:
+            return 100.0 if avg_gain > 0 else math.nan
+        return 100 - (100 / (1 + avg_gain / avg_loss))
+
+    def peek(self, close):
+        _, _, avg_gain, avg_loss = self._step(close)
+        return self._rsi(avg_gain, avg_loss)
+
+    def push(self, close):
+        gain, loss, self.avg_gain, self.avg_loss = self._step(close)
+        self.gains.append(gain)
+        self.losses.append(loss)
+        self.prev_close = close
+        return self._rsi(self.avg_gain, self.avg_loss)
+
+
+class MACDState:
+    __slots__ = ('fast', 'slow', 'signal')
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = EMAState(fast)
+        self.slow = EMAState(slow)
+        self.signal = EMAState(signal)
+
+    def peek(self, close):
+        macd = self.fast.peek(close) - self.slow.peek(close)
+        return macd, self.signal.peek(macd)
+
+    def push(self, close):
+        macd = self.fast.push(close) - self.slow.push(close)
+        return macd, self.signal.push(macd)
+
+
+class SeriesIndicators:
+    # Estado dos indicadores de um (symbol, interval).
+    # Candles fechados entram no estado (commit); o candle em formação só é "espiado"
+    # (peek), então cada tick custa O(1) e nunca altera o estado consolidado.
+    # `current` tem os valores do último candle (em formação ou fechado) e `previous`
+    # os do candle anterior, ou seja, .iloc[-1] e .iloc[-2].
+    __slots__ = ('ema_periods', 'emas', 'rsi', 'macd', 'last_open_time',
+                 'committed', 'previous_committed', 'current', 'previous')
+
+    def __init__(self, ema_periods=(9, 21), rsi_period=14, rsi_method='sma', macd=(12, 26, 9)):
+        self.ema_periods = ema_periods
+        self.emas = [EMAState(p) for p in ema_periods]
+        self.rsi = RSIState(rsi_period, rsi_method)
+        self.macd = MACDState(*macd)
+        self.last_open_time = None
+        self.committed = None
+        self.previous_committed = None
+        self.current = None
+        self.previous = None
+
+    def _values(self, close, emas, rsi, macd):
+        values = {f'EMA_{p}': v for p, v in zip(self.ema_periods, emas)}
+        values['RSI'] = rsi
+        values['MACD'], values['MACD_signal'] = macd
+        values['close'] = close
+        return values
+
+    def update(self, open_time, close, closed):
+        if self.last_open_time is not None and open_time < self.last_open_time:
+            return self.current
+        if closed:
+            values = self._values(close, [e.push(close) for e in self.emas],
+                                  self.rsi.push(close), self.macd.push(close))
+            self.previous_committed, self.committed = self.committed, values
+            self.previous, self.current = self.previous_committed, values
+            self.last_open_time = open_time + 1  # candle fechado não é reprocessado
+        else:
+            self.previous = self.committed
+            self.current = self._values(close, [e.peek(close) for e in self.emas],
+                                        self.rsi.peek(close), self.macd.peek(close))
+            self.last_open_time = open_time
+        return self.current
+
+
+class IndicatorEngine:
+    # Mantém um SeriesIndicators por (symbol, interval), alimentado com as linhas de
+    # kline (REST ou WebSocket) à medida que são mescladas no KlineCache.
+    # features() entrega esse estado à análise em lote (batch.BatchFeatures), que assim
+    # não recalcula EMA/RSI/MACD sobre a janela inteira a cada ciclo.
+    def __init__(self, ema_periods=(9, 21), rsi_period=14, rsi_method='sma', macd=(12, 26, 9)):
+        self.params = dict(ema_periods=tuple(ema_periods), rsi_period=rsi_period, rsi_method=rsi_method, macd=tuple(macd))
+        self._series = {}
+        # Colunas de features() no formato de spec de rules.py, na ordem de _row()
+        self.specs = [('close', 0)]
+        for p in self.params['ema_periods']:
+            self.specs += [('ema', p, 0), ('ema', p, 1)]
+        # O RSI das regras é o de média simples (batch.rsi_matrix)
+        if rsi_method == 'sma':
+            self.specs.append(('rsi', rsi_period))
+        self.specs += [('macd',) + self.params['macd'], ('macd_signal',) + self.params['macd']]
+
+    def __contains__(self, key):
+        return key in self._series
+
+    def feed(self, symbol, interval, klines, now=None):
+        series = self._series.get((symbol, interval))
+        if series is None:
+            series = self._series[(symbol, interval)] = SeriesIndicators(**self.params)
+        now = int(time.time() * 1000) if now is None else now
+        for kline in klines:
+            series.update(kline[0], float(kline[4]), kline[6] < now)
+        return series.current
+
+    def reset(self, symbol, interval):
+        # Usado quando a série é buscada de novo do zero (ex.: buraco maior que o cache)
+        self._series.pop((symbol, interval), None)
+
+    def values(self, symbol, interval):
+        series = self._series[(symbol, interval)]
+        return series.current, series.previous
+
+    def committed(self, symbol, interval):
+        # Valores do último candle fechado (None se nada foi consolidado ainda)
+        series = self._series.get((symbol, interval))
+        return None if series is None else series.committed
+
+    def _row(self, series):
+        nan = math.nan
+        current, previous = series.current, series.previous or {}
+        row = [current['close']]
+        for p in self.params['ema_periods']:
+            row += [current[f'EMA_{p}'], previous.get(f'EMA_{p}', nan)]
+        if self.params['rsi_method'] == 'sma':
+            row.append(current['RSI'])
+        row += [current['MACD'], current['MACD_signal']]
+        return row
+
+    def features(self, symbols, interval):
+        """
+        {spec: array} com o valor atual de cada indicador para `symbols`, no formato das
+        features de rules.py (('ema', 21, 0), ('rsi', 14), ...). ('close', 0) vai junto
+        para a análise conferir que o estado está no mesmo candle das matrizes de preço.
+        Símbolos ainda sem estado ficam com NaN e False em 'valid'; a análise recalcula
+        só essas linhas. None se nenhum símbolo tem estado.
+        """
+        vazia = [math.nan] * len(self.specs)
+        linhas, valid = [], []
+        for symbol in symbols:
+            series = self._series.get((symbol, interval))
+            ok = series is not None and series.current is not None
+            valid.append(ok)
+            linhas.append(self._row(series) if ok else vazia)
+        if not any(valid):
+            return None
+        matriz = np.array(linhas, dtype=np.float64).reshape(len(linhas), len(self.specs))
+        features = {spec: matriz[:, i] for i, spec in enumerate(self.specs)}
+        features['valid'] = np.array(valid, dtype=bool)
+        return features
+
+    def retain(self, symbols):
+        symbols = set(symbols)
+        for key in [key for key in self._series if key[0] not in symbols]:
+            del self._series[key]
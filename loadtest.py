@@ -0,0 +1,768 @@
+#loadtest.py
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+import requests
+from aiohttp import web
+from binance.client import Client
+from data import (INTERVAL_MS, AsyncKlineFetcher, KlineCache, KlineStore, UniverseResolver, WeightBudget,
+                  StoredKlines, kline_request_weight)
+from indicators import IndicatorEngine
+from parallel import ParallelAnalyzer
+from scheduler import CandleScheduler, next_boundary
+from cooldown import AlertCooldown
+from outbox import AlertOutbox, StubChannel
+from monitor import Monitor
+from stream import KlineStream, stream_name
+from shard import Coordinator, ShardUniverse
+from bench import INTERVALS, Fixtures, FixtureFetcher, report, simulated_clock
+
+logger = logging.getLogger(__name__)
+
+# Replay/load test of the whole monitoring pipeline (the same pieces BotShort.monitorar
+# wires together) against a local fake Binance/CoinGecko HTTP server and a stub
+# Discord channel. The clock runs `speed` times faster than real time, so a 15m
+# candle closes every 900/speed seconds; a cycle that takes longer than that
+# overruns, exactly as it would live with 15 minutes per candle.
+# Rate limits of the external services (Binance weight per minute, Retry-After,
+# Discord messages per 5 s) follow the simulated clock; processing and the injected
+# network latency are real, so a higher speed is a stricter test.
+
+SYMBOL_COUNTS = (10, 100, 500, 1000, 2000)
+
+
+@contextmanager
+def accelerated_clock(start, speed):
+    # time.time() starts at `start` (epoch seconds) and advances `speed` times faster
+    # than the wall clock; asyncio timers and time.monotonic() stay real
+    real = time.time
+    t0 = time.monotonic()
+    time.time = lambda: start + (time.monotonic() - t0) * speed
+    try:
+        yield
+    finally:
+        time.time = real
+
+
+class FakeExchange:
+    # Local aiohttp server with the Binance futures and CoinGecko endpoints the bot
+    # calls, answered from fixtures at the (simulated) current time.
+    # Klines and the 24h ticker wait `latency` seconds on average (uniform between 0
+    # and twice that) and a fraction `error_rate` of them answers 429 with Retry-After.
+    # X-MBX-USED-WEIGHT-1M reports the weight served in the last simulated minute.
+    def __init__(self, fixtures, latency=0.0, error_rate=0.0, retry_after=1, speed=1.0, seed=0):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.speed = speed
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.rejected = 0
+        self.weight = 0
+        self._window = deque()
+        self._used = 0
+        self._runner = None
+        self.url = None
+
+    async def start(self, host='127.0.0.1'):
+        app = web.Application()
+        app.router.add_get('/fapi/v1/klines', self.klines)
+        app.router.add_get('/fapi/v1/ticker/24hr', self.tickers)
+        app.router.add_get('/fapi/v1/exchangeInfo', self.exchange_info)
+        app.router.add_get('/api/v3/coins/markets', self.markets)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, 0).start()
+        self.url = f"http://{host}:{self._runner.addresses[0][1]}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _use_weight(self, weight):
+        agora = time.monotonic()
+        self._window.append((agora, weight))
+        self._used += weight
+        self.weight += weight
+        while self._window[0][0] <= agora - 60 / self.speed:
+            self._used -= self._window.popleft()[1]
+        return self._used
+
+    async def _binance(self, weight, payload):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.random.uniform(0, 2 * self.latency))
+        headers = {'X-MBX-USED-WEIGHT-1M': str(self._use_weight(weight))}
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.rejected += 1
+            return web.json_response({'code': -1003, 'msg': "Too many requests."}, status=429,
+                                     headers={**headers, 'Retry-After': str(self.retry_after / self.speed)})
+        return web.json_response(payload(), headers=headers)
+
+    async def klines(self, request):
+        q = request.query
+        symbol, interval, limit = q['symbol'], q['interval'], int(q.get('limit', 500))
+        if (symbol, interval) not in self.fixtures.series:
+            return web.json_response({'code': -1121, 'msg': "Invalid symbol."}, status=400)
+        start_time = int(q['startTime']) if 'startTime' in q else None
+        return await self._binance(kline_request_weight(limit), lambda: self.fixtures.klines(
+            symbol, interval, int(time.time() * 1000), limit, start_time))
+
+    async def tickers(self, request):
+        return await self._binance(40, lambda: self._tickers_at(int(time.time() * 1000)))
+
+    def _tickers_at(self, now_ms):
+        # The recorded 24h ticker is the one at the end of the fixtures; during the replay
+        # last price and 24h high/low follow the short candles at the simulated time
+        tickers = []
+        for ticker in self.fixtures.tickers:
+            series = self.fixtures.series.get((ticker['symbol'], INTERVALS[0]))
+            stop = 0 if series is None else int(np.searchsorted(series.open_time, now_ms, side='right'))
+            if not stop:
+                tickers.append(ticker)
+                continue
+            dia = slice(max(stop - 96, 0), stop)
+            tickers.append({**ticker, 'lastPrice': repr(float(series['close'][stop - 1])),
+                            'highPrice': repr(float(series['high'][dia].max())),
+                            'lowPrice': repr(float(series['low'][dia].min()))})
+        return tickers
+
+    async def exchange_info(self, request):
+        return web.json_response(self.fixtures.exchange_info)
+
+    async def markets(self, request):
+        per_page, page = int(request.query.get('per_page', 100)), int(request.query.get('page', 1))
+        return web.json_response(self.fixtures.markets[(page - 1) * per_page:page * per_page])
+
+
+class FakeKlineStream:
+    # Local WebSocket server speaking Binance's combined kline streams
+    # (/stream?streams=a@kline_15m/b@kline_1h), replaying the fixture candles at the
+    # (simulated) current time. Every `tick` real seconds each stream gets its forming
+    # candle with x=false; a candle whose close time has passed is sent once more with
+    # x=true before the next one. SUBSCRIBE/UNSUBSCRIBE messages change a connection's
+    # streams as on Binance, and drop() closes every open connection.
+    def __init__(self, fixtures, tick=0.05):
+        self.fixtures = fixtures
+        self.tick = tick
+        self.connections = 0
+        self.closed = []
+        self._sockets = set()
+        self._runner = None
+        self.url = None
+
+    async def start(self, host='127.0.0.1'):
+        app = web.Application()
+        app.router.add_get('/stream', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, 0).start()
+        self.url = f"ws://{host}:{self._runner.addresses[0][1]}"
+        return self.url
+
+    async def stop(self):
+        await self.drop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def drop(self):
+        for ws in list(self._sockets):
+            await ws.close()
+
+    def _pair(self, name):
+        symbol, interval = name.split('@kline_')
+        return symbol.upper(), interval
+
+    def _event(self, name, pair, i, closed):
+        c = self.fixtures.series[pair].columns
+        price = lambda column: repr(float(c[column][i]))
+        return {'stream': name, 'data': {'e': 'kline', 's': pair[0], 'k': {
+            't': int(c['open_time'][i]), 'T': int(c['close_time'][i]), 's': pair[0], 'i': pair[1],
+            'o': price('open'), 'h': price('high'), 'l': price('low'), 'c': price('close'),
+            'v': price('volume'), 'n': int(c['num_trades'][i]), 'x': closed, 'q': price('quote_asset_volume'),
+            'V': price('taker_buy_base'), 'Q': price('taker_buy_quote'), 'B': '0',
+        }}}
+
+    async def _control(self, ws, streams):
+        async for msg in ws:
+            if msg.type != web.WSMsgType.TEXT:
+                continue
+            request = msg.json()
+            for name in request.get('params', []):
+                if request.get('method') == 'SUBSCRIBE':
+                    streams[name] = self._pair(name)
+                elif request.get('method') == 'UNSUBSCRIBE':
+                    streams.pop(name, None)
+            await ws.send_json({'result': None, 'id': request.get('id')})
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        self._sockets.add(ws)
+        streams = {name: self._pair(name) for name in request.query.get('streams', '').split('/') if name}
+        current = {}
+        control = asyncio.create_task(self._control(ws, streams))
+        try:
+            while not ws.closed:
+                now_ms = time.time() * 1000
+                for name, pair in list(streams.items()):
+                    i = int(np.searchsorted(self.fixtures.series[pair].open_time, now_ms, side='right')) - 1
+                    if i < 0:
+                        continue
+                    for j in range(current.get(name, i), i):
+                        await ws.send_json(self._event(name, pair, j, True))
+                        self.closed.append(pair)
+                    current[name] = i
+                    await ws.send_json(self._event(name, pair, i, False))
+                await asyncio.sleep(self.tick)
+        except ConnectionError:
+            pass
+        finally:
+            control.cancel()
+            self._sockets.discard(ws)
+        return ws
+
+
+class RateLimited(Exception):
+    # Carries the same attributes the outbox reads from discord.RateLimited/HTTPException
+    status = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f"429 Too Many Requests (retry_after={retry_after})")
+        self.retry_after = retry_after
+
+
+class FlakyChannel(StubChannel):
+    # Stub Discord channel that answers a fraction `error_rate` of the sends with 429
+    def __init__(self, latency=0.0, error_rate=0.0, retry_after=1.0, seed=0):
+        super().__init__(latency)
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.rejected = 0
+
+    async def send(self, content):
+        await asyncio.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.rejected += 1
+            raise RateLimited(self.retry_after)
+        self.messages.append(content)
+
+
+class TimedOutbox(AlertOutbox):
+    # Keeps (since, latency) of every delivered alert, in simulated seconds, besides
+    # feeding the histogram
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def _delivered(self, alertas):
+        super()._delivered(alertas)
+        agora = time.time()
+        self.latencies.extend((since, agora - since) for _, since, _ in alertas if since is not None)
+
+
+def inject_signals(fixtures, open_times, per_candle=1):
+    """
+    Copy of `fixtures` where, for each short candle in `open_times`, `per_candle`
+    symbols (a different set each time, from the end of the universe) close 10%
+    below the previous close. That breaks the Fibonacci levels and EMA(21) on
+    all three timeframes (1h/4h are resampled from the short series), so the
+    SHORT rule fires on those symbols during warm cycles, when the random-walk
+    fixtures alone rarely produce an alert that is not already in cooldown.
+    Returns (fixtures, {open_time: [symbols]}).
+    """
+    symbols = fixtures.symbols
+    series = dict(fixtures.series)
+    sinais = {}
+    for k, open_time in enumerate(open_times):
+        escolhidos = [symbols[-1 - (k * per_candle + j) % len(symbols)] for j in range(per_candle)]
+        for symbol in escolhidos:
+            original = series[(symbol, INTERVALS[0])]
+            i = int(np.searchsorted(original.open_time, open_time))
+            if i == 0 or i >= len(original) or original.open_time[i] != open_time:
+                continue
+            columns = {name: values.copy() for name, values in original.columns.items()}
+            columns['close'][i] = columns['close'][i - 1] * 0.9
+            columns['low'][i] = min(columns['low'][i], columns['close'][i])
+            series[(symbol, INTERVALS[0])] = StoredKlines(symbol, INTERVALS[0], columns)
+            sinais.setdefault(open_time, []).append(symbol)
+    return Fixtures(series, fixtures.markets, fixtures.exchange_info, fixtures.tickers), sinais
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) else float('nan')
+
+
+async def replay(fixtures, speed=300, cycles=8, latency=0.0, error_rate=0.0, discord_latency=0.05,
+                 discord_error_rate=0.0, workers=0, weight_limit=2400, spread_seconds=5, drain_timeout=120,
+                 signals=1):
+    """
+    Runs one cold cycle plus `cycles` candle-aligned cycles of the monitoring
+    pipeline against FakeExchange. Must run under accelerated_clock(start, speed)
+    with `start` at least `cycles` short candles before the end of the fixtures.
+    Times in the result are wall-clock seconds; `budget_seconds` is the real time
+    one short candle lasts at this speed.
+    Each warm cycle gets `signals` synthetic SHORT signals (see inject_signals), so
+    alert latency is measured on warm cycles too: cold_alert_latency_* covers the
+    alerts of the cold cycle (a burst with the whole universe fetched at once),
+    alert_latency_* those of the warm cycles.
+    """
+    # The cold cycle runs right away; the warm ones at the next `cycles` short boundaries
+    step = INTERVAL_MS[INTERVALS[0]]
+    primeiro = next_boundary(INTERVALS[0], int(time.time() * 1000))
+    fixtures, sinais = inject_signals(fixtures, [primeiro + k * step for k in range(cycles)], signals)
+    exchange = FakeExchange(fixtures, latency, error_rate, speed=speed)
+    url = await exchange.start()
+    fetcher = AsyncKlineFetcher(base_url=url)
+    fetcher.budget = WeightBudget(limit=weight_limit, window=60 / speed)
+    client = Client(ping=False)
+    client.FUTURES_URL = f"{url}/fapi"
+    universo = UniverseResolver(client, 0, float('inf'), session=requests.Session(),
+                                markets_url=f"{url}/api/v3/coins/markets")
+    cache = KlineCache(fetcher, indicators=IndicatorEngine(), derived={'1h': '15m', '4h': '15m'})
+    # Defaults bind the real time.time at import; the accelerated one is passed explicitly
+    agendador = CandleScheduler(INTERVALS, clock=time.time, speed=speed)
+    analisador = ParallelAnalyzer(workers)
+    canal = FlakyChannel(discord_latency, discord_error_rate, retry_after=1 / speed)
+    saida = TimedOutbox(canal, linger=1 / speed, per=5 / speed).start()
+    cooldown = AlertCooldown(':memory:', clock=time.time)
+    monitor = Monitor(universo, fetcher, cache, agendador, cooldown, analisador, saida,
+                      INTERVALS, spread_seconds=spread_seconds / speed)
+
+    ciclos = []
+    inicio_total = time.perf_counter()
+    inicio_frio = None
+    try:
+        for _ in range(cycles + 1):
+            fechados = await agendador.wait_next()
+            agora = int(time.time() * 1000)
+            if inicio_frio is None:
+                inicio_frio = agora / 1000
+            # A synthetic signal must not land on a symbol muted by an earlier alert
+            for symbol in sinais.get(agora // step * step, ()):
+                cooldown.unmute(symbol)
+            prazo = next_boundary(INTERVALS[0], agora) / 1000
+            inicio = time.perf_counter()
+            n, alertas = await monitor.cycle(fechados)
+            ciclos.append({'seconds': time.perf_counter() - inicio, 'symbols': n, 'alerts': alertas,
+                           'overrun': time.time() > prazo})
+        try:
+            await asyncio.wait_for(saida.drain(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{len(saida)} alertas ainda na fila após {drain_timeout}s.")
+        duracao = time.perf_counter() - inicio_total
+    finally:
+        await saida.stop()
+        await fetcher.close()
+        analisador.shutdown()
+        cooldown.close()
+        await exchange.stop()
+
+    quentes = ciclos[1:]
+    tempos = [c['seconds'] for c in quentes]
+    # Cold-cycle alerts come from candles closed before it started; since is in simulated seconds
+    frias = [l / speed for since, l in saida.latencies if since <= inicio_frio]
+    quentes_lat = [l / speed for since, l in saida.latencies if since > inicio_frio]
+    return {
+        'seconds': _percentile(tempos, 50),
+        'p95_seconds': _percentile(tempos, 95),
+        'max_seconds': max(tempos, default=float('nan')),
+        'cold_seconds': ciclos[0]['seconds'],
+        'budget_seconds': INTERVAL_MS[INTERVALS[0]] / 1000 / speed,
+        'overruns': sum(c['overrun'] for c in quentes),
+        'symbols_per_second': sum(c['symbols'] for c in quentes) / sum(tempos) if sum(tempos) else 0,
+        'requests': exchange.requests,
+        'requests_per_second': exchange.requests / duracao,
+        'weight': exchange.weight,
+        'binance_429': exchange.rejected,
+        'alerts': sum(c['alerts'] for c in ciclos),
+        'messages': len(canal.messages),
+        'discord_429': canal.rejected,
+        'signals': sum(len(s) for s in sinais.values()),
+        'cold_alert_latency_p50': _percentile(frias, 50),
+        'cold_alert_latency_p95': _percentile(frias, 95),
+        'warm_alerts': len(quentes_lat),
+        'alert_latency_p50': _percentile(quentes_lat, 50),
+        'alert_latency_p95': _percentile(quentes_lat, 95),
+    }
+
+
+async def _until(condition, timeout):
+    # Polls `condition` every 10 ms (real time); False if it did not hold within `timeout` seconds
+    limite = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > limite:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+async def check_stream(fixtures, speed=300, candles=3, timeout=10):
+    """
+    Stream-mode check against FakeKlineStream, with REST backfill served from the
+    fixtures. Runs `candles` short candles, drops every connection in between and
+    then swaps one symbol of the universe. Must run under accelerated_clock.
+    Returns a list of failures (empty when everything matched):
+    - every candle-close event the server sent became one on_close notification;
+    - the cached series equal the fixture candles after the reconnect backfill;
+    - the universe change reused the open connections (SUBSCRIBE/UNSUBSCRIBE only)
+      and the new symbol went live.
+    """
+    falhas = []
+    server = FakeKlineStream(fixtures)
+    await server.start()
+    cache = KlineCache(FixtureFetcher(fixtures, time.time))
+    notificados = []
+    pares = [(symbol, interval) for symbol in fixtures.symbols for interval in INTERVALS[:2]]
+    stream = KlineStream(cache, server.url, on_close=lambda *pair: notificados.append(pair),
+                         max_streams_per_connection=max(len(pares) // 3, 2))
+    step = INTERVAL_MS[INTERVALS[0]] / 1000 / speed
+    try:
+        inicial = pares[:-2]
+        stream.subscribe(inicial)
+        if not await _until(lambda: not stream.stale_pairs(inicial), timeout):
+            falhas.append("streams não ficaram vivos após a conexão inicial")
+        await asyncio.sleep(step * candles / 2)
+        await server.drop()
+        if not await _until(lambda: not stream.stale_pairs(inicial), timeout):
+            falhas.append("streams não voltaram após a queda das conexões")
+        await asyncio.sleep(step * candles / 2)
+
+        conexoes = server.connections
+        trocados = pares[2:]
+        stream.subscribe(trocados)
+        if not await _until(lambda: not stream.stale_pairs(trocados), timeout):
+            falhas.append("pares novos não ficaram vivos após a troca de universo")
+        if server.connections != conexoes:
+            falhas.append(f"troca de universo abriu {server.connections - conexoes} conexões novas")
+        await asyncio.sleep(step)
+
+        # Close events still in flight when the check stops are not counted
+        enviados = list(server.closed)
+        await asyncio.sleep(server.tick * 4)
+        if sorted(notificados[:len(enviados)]) != sorted(enviados):
+            falhas.append(f"{len(enviados)} fechamentos enviados, {len(notificados)} notificados")
+        if not enviados:
+            falhas.append("nenhum candle fechou durante o teste")
+
+        agora = int(time.time() * 1000)
+        for symbol, interval in trocados:
+            esperado = fixtures.klines(symbol, interval, agora, cache.capacity)
+            serie = cache.series(symbol, interval)
+            if (serie.open_time.tolist() != [k[0] for k in esperado][-len(serie):]
+                    or serie.close.tolist() != [float(k[4]) for k in esperado][-len(serie):]):
+                falhas.append(f"cache de {symbol} ({interval}) difere das fixtures")
+    finally:
+        await stream.stop()
+        await server.stop()
+    return falhas
+
+
+async def check_store(fixtures, clock, capacity=20, gap=40):
+    """
+    KlineStore check against FakeExchange: loads the series, restarts after a
+    downtime shorter than the cache (seeded from the store, incremental fetch),
+    restarts after one longer than the cache (full fetch, the missing range is
+    backfilled into the store) and finally after another long one with
+    fetch_range failing (the store history of the series is dropped).
+    Must run under simulated_clock; `clock` is moved forward by whole short candles.
+    Returns a list of failures (empty when everything matched):
+    - the store holds exactly the closed fixture candles, without holes;
+    - the restarted cache equals the fixture candles.
+    """
+    if gap < capacity or gap // 4 >= capacity:
+        raise ValueError("gap precisa passar de capacity nos candles curtos e não nos de 1h")
+    falhas = []
+    exchange = FakeExchange(fixtures)
+    url = await exchange.start()
+    pasta = tempfile.mkdtemp(prefix='klinestore-')
+    pares = [(symbol, interval) for symbol in fixtures.symbols for interval in INTERVALS[:2]]
+    step = INTERVAL_MS[INTERVALS[0]] / 1000
+
+    # First open_time each series should have in the store
+    desde = {}
+
+    def conferir(etapa, cache, store):
+        agora = int(time.time() * 1000)
+        for symbol, interval in pares:
+            esperado = [k for k in fixtures.klines(symbol, interval, agora, 10_000, desde[(symbol, interval)])
+                        if k[6] < agora]
+            gravado = store.read(symbol, interval)
+            if gravado.columns['open_time'].tolist() != [k[0] for k in esperado]:
+                falhas.append(f"{etapa}: histórico de {symbol} ({interval}) tem {len(gravado)} candles, "
+                              f"esperados {len(esperado)} sem buracos")
+            elif gravado.columns['close'].tolist() != [float(k[4]) for k in esperado]:
+                falhas.append(f"{etapa}: fechamentos de {symbol} ({interval}) diferem das fixtures")
+            recente = fixtures.klines(symbol, interval, agora, capacity)
+            if cache.series(symbol, interval).open_time.tolist() != [k[0] for k in recente]:
+                falhas.append(f"{etapa}: cache de {symbol} ({interval}) difere das fixtures")
+
+    async def etapa(nome, avanco, falhar_range=False):
+        clock[0] += avanco * step
+        fetcher = AsyncKlineFetcher(base_url=url)
+        agora = int(time.time() * 1000)
+        if not desde:
+            desde.update({pair: fixtures.klines(*pair, agora, capacity)[0][0] for pair in pares})
+        if falhar_range:
+            async def fetch_range(*args, **kwargs):
+                raise ConnectionError("falha simulada")
+            fetcher.fetch_range = fetch_range
+            # Only the short series falls more than `capacity` candles behind, so only
+            # its history is dropped and restarts at the first candle of the full fetch
+            desde.update({(symbol, interval): fixtures.klines(symbol, interval, agora, capacity)[0][0]
+                          for symbol, interval in pares if interval == INTERVALS[0]})
+        store = KlineStore(pasta, flush_delay=0)
+        cache = KlineCache(fetcher, capacity=capacity, store=store)
+        try:
+            resultados = await cache.update_many(pares)
+            erros = [r for r in resultados.values() if isinstance(r, Exception)]
+            if erros:
+                falhas.append(f"{nome}: {len(erros)} séries falharam ({erros[0]})")
+                return
+            # One more candle with the process running
+            clock[0] += step
+            await cache.update_many(pares)
+            await store.flush()
+            conferir(nome, cache, store)
+        finally:
+            await fetcher.close()
+
+    try:
+        await etapa("carga inicial", 0)
+        await etapa("restart curto", capacity // 2)
+        await etapa("restart após buraco", gap)
+        await etapa("restart sem backfill", gap, falhar_range=True)
+    finally:
+        await exchange.stop()
+        shutil.rmtree(pasta, ignore_errors=True)
+    return falhas
+
+
+async def check_shard(fixtures, workers=3, timeout=30):
+    """
+    Coordinator check with real worker processes (`shard.py worker`, analysing
+    against FakeExchange). Starts `workers` workers, adds one, kills one, then plays
+    a misbehaving worker over a raw connection and finally stops the coordinator
+    with the workers still connected. Runs on the real clock.
+    Returns a list of failures (empty when everything matched):
+    - after every membership change each symbol has exactly one owner, the one the
+      hash ring picks, and only symbols of the joining/leaving worker changed owner;
+    - malformed messages are ignored, a broken line drops only that connection and
+      its worker leaves the ring;
+    - stop() leaves no handler running and no exception for the event loop to report.
+    """
+    falhas = []
+    loop = asyncio.get_running_loop()
+    excecoes = []
+    loop.set_exception_handler(lambda loop, context: excecoes.append(context.get('message')))
+    exchange = FakeExchange(fixtures)
+    url = await exchange.start()
+    pasta = tempfile.mkdtemp(prefix='shard-')
+    endereco = f"unix:{os.path.join(pasta, 'coordenador.sock')}"
+    universo = ShardUniverse()
+    universo.assign(fixtures.symbols)
+    canal = StubChannel()
+    saida = AlertOutbox(canal, linger=0.05).start()
+    cooldown = AlertCooldown(':memory:')
+    coordenador = await Coordinator(universo, saida, cooldown, endereco).start()
+    processos = {}
+
+    def iniciar(nome):
+        processos[nome] = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shard.py'), 'worker',
+             '--coordenador', endereco, '--id', nome, '--base-url', url, '--analise-workers', '0'],
+            env={**os.environ, 'LOG_NIVEL': 'ERROR'})
+
+    def estavel(nomes):
+        # Os shards enviados são os do anel atual e cobrem o universo sem repetir símbolo
+        atual = coordenador.workers
+        return (set(atual) == set(nomes) and atual == coordenador.ring.partition(fixtures.symbols)
+                and sorted(s for shard in atual.values() for s in shard) == sorted(fixtures.symbols))
+
+    def donos():
+        return {s: worker for worker, shard in coordenador.workers.items() for s in shard}
+
+    async def etapa(nome, nomes, mudou):
+        # `mudou`: o worker que entrou ou saiu; todo símbolo que trocou de dono veio dele ou foi para ele
+        antes = donos()
+        if not await _until(lambda: estavel(nomes), timeout):
+            falhas.append(f"{nome}: shards não estabilizaram ({ {w: len(s) for w, s in coordenador.workers.items()} })")
+            return
+        depois = donos()
+        errados = [s for s in antes if antes[s] != depois[s] and mudou not in (antes[s], depois[s])]
+        if errados:
+            falhas.append(f"{nome}: {len(errados)} símbolos trocaram entre workers que não mudaram")
+
+    try:
+        nomes = [f"worker-{i}" for i in range(workers)]
+        for nome in nomes:
+            iniciar(nome)
+        await etapa("entrada", nomes, None)
+
+        novo = f"worker-{workers}"
+        iniciar(novo)
+        nomes.append(novo)
+        await etapa("worker novo", nomes, novo)
+
+        morto = nomes.pop(0)
+        processos[morto].kill()
+        await etapa("worker morto", nomes, morto)
+
+        # Worker que viola o protocolo: mensagens inválidas são ignoradas e a linha
+        # que não é JSON derruba só a conexão dele
+        reader, writer = await asyncio.open_unix_connection(endereco[len('unix:'):])
+        writer.write(b'{"type":"hello","worker":"intruso"}\n')
+        shard = json.loads(await asyncio.wait_for(reader.readline(), timeout))
+        symbol = fixtures.symbols[0]
+        for msg in ({'type': 'mute'}, [1, 2], {'type': 'alert', 'text': 5}, {'type': 'mute', 'symbol': symbol, 'ttl': 'x'},
+                    {'type': 'mute', 'symbol': symbol, 'ttl': 60},
+                    {'type': 'alert', 'text': 'alerta do intruso', 'since': None, 'symbol': symbol}):
+            writer.write(json.dumps(msg).encode() + b'\n')
+        if shard.get('type') != 'shard' or not await _until(lambda: estavel(nomes + ['intruso']), timeout):
+            falhas.append("intruso: não recebeu shard ao entrar")
+        if not await _until(lambda: 'alerta do intruso' in canal.messages, timeout):
+            falhas.append("intruso: alerta válido depois das mensagens inválidas não foi entregue")
+        if not cooldown.is_muted(symbol):
+            falhas.append("intruso: mute válido depois das mensagens inválidas não chegou ao cooldown")
+        try:
+            writer.write(b'isto nao e json\n')
+            resposta = await asyncio.wait_for(reader.read(), timeout)
+        except ConnectionError:
+            resposta = b''
+        if resposta:
+            falhas.append("intruso: o coordenador respondeu depois da linha inválida")
+        writer.close()
+        await etapa("intruso", nomes, 'intruso')
+
+        # Conexão sem hello válido é descartada sem entrar no anel
+        reader, writer = await asyncio.open_unix_connection(endereco[len('unix:'):])
+        writer.write(b'{"type":"hello"}\n')
+        if await asyncio.wait_for(reader.read(), timeout):
+            falhas.append("hello sem worker: a conexão não foi descartada")
+        writer.close()
+        if set(coordenador.workers) != set(nomes):
+            falhas.append(f"hello sem worker: anel com {sorted(coordenador.workers)}")
+
+        await coordenador.stop()
+        handlers = [t for t in asyncio.all_tasks() if t.get_coro().__qualname__ == 'Coordinator._handle']
+        if handlers:
+            falhas.append(f"stop: {len(handlers)} handlers ainda rodando")
+    finally:
+        await coordenador.stop()
+        for processo in processos.values():
+            processo.kill()
+            processo.wait()
+        await saida.stop()
+        cooldown.close()
+        await exchange.stop()
+        shutil.rmtree(pasta, ignore_errors=True)
+    if excecoes:
+        falhas.append(f"stop: o loop registrou {len(excecoes)} exceções ({excecoes[0]})")
+    return falhas
+
+
+def _run_stream(fixtures, speed):
+    fixtures = fixtures.scaled(6)
+    step = INTERVAL_MS[INTERVALS[0]]
+    with accelerated_clock((fixtures.end_time() - 4 * step - step // 2) / 1000, speed):
+        return asyncio.run(check_stream(fixtures, speed))
+
+
+def _run_store(fixtures, speed, capacity=20, gap=40):
+    fixtures = fixtures.scaled(6)
+    step = INTERVAL_MS[INTERVALS[0]]
+    # Starts mid-candle, far enough from the end of the fixtures for the four restarts
+    inicio = fixtures.end_time() - (3 * gap + capacity + 8) * step - step // 2
+    with simulated_clock(inicio / 1000) as clock:
+        return asyncio.run(check_store(fixtures, clock, capacity, gap))
+
+
+def _run_shard(fixtures, speed, workers=3):
+    return asyncio.run(check_shard(fixtures.scaled(60), workers))
+
+
+CHECKS = {'stream': _run_stream, 'store': _run_store, 'shard': _run_shard}
+
+
+def run_checks(fixtures, names, speed=300):
+    return {name: CHECKS[name](fixtures, speed) for name in names}
+
+
+def run(fixtures, symbol_counts, speed=300, cycles=8, **options):
+    resultados = {}
+    step = INTERVAL_MS[INTERVALS[0]]
+    for n in symbol_counts:
+        sub = fixtures.scaled(n)
+        # Starts mid-candle, `cycles` short candles before the end of the fixtures
+        inicio = (sub.end_time() - cycles * step - step // 2) / 1000
+        with accelerated_clock(inicio, speed):
+            resultados[f"replay[symbols={n}]"] = asyncio.run(replay(sub, speed, cycles, **options))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay/teste de carga do pipeline de monitoramento com Binance, CoinGecko e Discord falsos.")
+    parser.add_argument('--fixtures', help="diretório com fixtures gravadas por bench.py record (padrão: sintéticas)")
+    parser.add_argument('--symbols', default=','.join(map(str, SYMBOL_COUNTS)),
+                        help="quantidades de símbolos, ex.: 10,100,2000")
+    parser.add_argument('--candles', type=int, default=400, help="fixtures sintéticas: candles por série")
+    parser.add_argument('--speed', type=float, default=300, help="aceleração do relógio (300: um candle de 15m a cada 3s)")
+    parser.add_argument('--cycles', type=int, default=8, help="ciclos medidos depois do ciclo frio")
+    parser.add_argument('--latency', type=float, default=0.0, help="latência média (s) das respostas da Binance")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fração das requisições à Binance com 429")
+    parser.add_argument('--discord-latency', type=float, default=0.05)
+    parser.add_argument('--discord-error-rate', type=float, default=0.0, help="fração dos envios ao Discord com 429")
+    parser.add_argument('--workers', type=int, default=0, help="processos de análise (0 = thread)")
+    parser.add_argument('--weight-limit', type=int, default=2400, help="limite de peso por minuto da Binance")
+    parser.add_argument('--signals', type=int, default=1,
+                        help="sinais SHORT sintéticos por ciclo quente, para medir a latência de alerta fora do ciclo frio")
+    parser.add_argument('--output', help="grava os resultados em JSON")
+    parser.add_argument('--check', help=f"em vez da carga, roda as verificações ({','.join(CHECKS)}) contra os servidores falsos")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format='[%(asctime)s] [%(levelname)s] %(message)s')
+    symbol_counts = [int(n) for n in args.symbols.split(',')]
+    fixtures = (Fixtures.load(args.fixtures) if args.fixtures
+                else Fixtures.synthetic(max(symbol_counts), candles=args.candles))
+    if args.check:
+        falhas = run_checks(fixtures, args.check.split(','), args.speed)
+        for name, erros in falhas.items():
+            print(f"{name:<12}{'ok' if not erros else 'FALHOU'}")
+            for erro in erros:
+                print(f"    {erro}")
+        if any(falhas.values()):
+            raise SystemExit(1)
+        return
+    resultados = run(fixtures, symbol_counts, args.speed, args.cycles, latency=args.latency,
+                     error_rate=args.error_rate, discord_latency=args.discord_latency,
+                     discord_error_rate=args.discord_error_rate, workers=args.workers,
+                     weight_limit=args.weight_limit, signals=args.signals)
+    report(resultados)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(resultados, f, indent=1, sort_keys=True)
+
+    estourados = [name for name, r in resultados.items() if r['overruns']]
+    if estourados:
+        raise SystemExit(f"Ciclos estouraram o tempo de um candle em: {', '.join(estourados)}")
+
+
+if __name__ == '__main__':
+    main()
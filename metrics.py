@@ -0,0 +1,147 @@
+#metrics.py
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Métricas em memória no formato texto do Prometheus, sem dependência extra.
+# Tudo é atualizado no event loop, então não há lock; o custo de cada observação
+# é um dict lookup e uma soma.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+
+def _label_text(names, values, extra=()):
+    pares = list(zip(names, values)) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pares) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        linhas = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._values.items()):
+            linhas.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return linhas
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        estado = self._values.get(key)
+        if estado is None:
+            # contagem por bucket (não cumulativa), soma, total
+            estado = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        estado[0][bisect.bisect_left(self.buckets, value)] += 1
+        estado[1] += value
+        estado[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **labels)
+
+    def count(self, **labels):
+        estado = self._values.get(self._key(labels))
+        return 0 if estado is None else estado[2]
+
+    def render(self):
+        linhas = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, (contagens, soma, total) in sorted(self._values.items()):
+            acumulado = 0
+            for limite, n in zip(self.buckets + (float('inf'),), contagens):
+                acumulado += n
+                le = '+Inf' if limite == float('inf') else repr(limite)
+                linhas.append(f"{self.name}_bucket{_label_text(self.labels, key, [('le', le)])} {acumulado}")
+            linhas.append(f"{self.name}_sum{_label_text(self.labels, key)} {soma}")
+            linhas.append(f"{self.name}_count{_label_text(self.labels, key)} {total}")
+        return linhas
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        linhas = []
+        for metric in self._metrics:
+            linhas.extend(metric.render())
+        return '\n'.join(linhas) + '\n'
+
+
+REGISTRY = Registry()
+
+CYCLE_SECONDS = Histogram('bot_cycle_seconds', "Duração de um ciclo de monitoramento completo")
+STAGE_SECONDS = Histogram('bot_stage_seconds', "Duração de cada etapa do ciclo", ['stage'])
+SYMBOLS = Gauge('bot_symbols', "Símbolos em cada etapa do último ciclo", ['stage'])
+ALERTS = Counter('bot_alerts_total', "Alertas gerados")
+HTTP_SECONDS = Histogram('binance_request_seconds', "Latência das requisições à Binance", ['endpoint', 'status'])
+WEIGHT_USED = Gauge('binance_weight_used', "Peso de requisição usado na janela de 1 minuto")
+CACHE_LOOKUPS = Counter('kline_cache_lookups_total', "Séries pedidas ao cache de candles, por resultado", ['result'])
+OUTBOX_DEPTH = Gauge('outbox_queue_depth', "Alertas aguardando envio ao Discord")
+SEND_SECONDS = Histogram('discord_send_seconds', "Latência de cada envio ao Discord", ['status'])
+ALERT_LATENCY = Histogram('alert_latency_seconds', "Do fechamento do candle até a entrega do alerta no Discord")
+COMMAND_SECONDS = Histogram('bot_command_seconds', "Latência das respostas ao comando !analyze, por origem dos candles", ['source'])
+
+
+async def start_metrics_server(port, host='127.0.0.1', registry=REGISTRY):
+    # Endpoint /metrics local para o Prometheus; devolve o runner para o cleanup no encerramento
+    async def metrics(request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Métricas em http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,145 @@
+#monitor.py
+import asyncio
+import logging
+import time
+from analysis import render_report
+from batch import snapshot_from_batch
+from prescreen import prescreen
+from rules import SHORT_STRATEGY, compile_strategy
+from metrics import CYCLE_SECONDS, STAGE_SECONDS, SYMBOLS, ALERTS, CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+def format_alert(r, symbol, strategy):
+    # O relatório sai do mesmo resultado da análise em lote, sem recalcular nada.
+    # Direção, alvos e stop seguem o lado da estratégia; sem `side`, seguem a reversão
+    # e o rótulo da estratégia não é usado (poderia contradizer os alvos)
+    snapshot = snapshot_from_batch(r, symbol)
+    label = strategy.direction if strategy.side is not None else None
+    report = render_report(snapshot, int(r[f'{strategy.name}_confidence']), detailed=True,
+                           side=strategy.side, direction_label=label)
+    return f"{strategy.title.format(symbol=symbol)}\n{report}"
+
+
+class Monitor:
+    # Um ciclo de monitoramento, do universo de símbolos até os alertas na fila de saída.
+    # Não depende do Discord: o bot só monta as peças, e o mesmo pipeline roda nos
+    # benchmarks com dados gravados e um canal stub.
+    # As estratégias de alerta (rules.py) devem ser as mesmas passadas ao analyzer.
+    def __init__(self, universe, fetcher, cache, scheduler, cooldown, analyzer, outbox,
+                 intervals=('15m', '1h', '4h'), stream=None, spread_seconds=5, strategies=None):
+        self.universe = universe
+        self.fetcher = fetcher
+        self.cache = cache
+        self.scheduler = scheduler
+        self.cooldown = cooldown
+        self.analyzer = analyzer
+        self.outbox = outbox
+        self.intervals = tuple(intervals)
+        self.stream = stream
+        self.spread_seconds = spread_seconds
+        self.strategies = [compile_strategy(s) for s in (strategies or [SHORT_STRATEGY])]
+        # O pré-filtro deriva da regra SHORT (fechamento abaixo da EMA21); com qualquer
+        # outra estratégia ativa ele descartaria justamente os símbolos que ela procura
+        self.prescreen = all(s.spec == SHORT_STRATEGY for s in self.strategies)
+
+    async def run(self):
+        while True:
+            try:
+                # ⏰ Espera o próximo fechamento de candle (15m, 1h ou 4h)
+                fechados = await self.scheduler.wait_next()
+                with CYCLE_SECONDS.time():
+                    await self.cycle(fechados)
+            except Exception as e:
+                logger.error(f"❌ Erro geral no monitoramento: {e}")
+                await asyncio.sleep(10)
+
+    async def cycle(self, fechados):
+        # Devolve quantos símbolos foram analisados e quantos alertas foram enfileirados
+        inicio = int(time.time() * 1000)
+        # 🌍 Universo em cache com TTL; as consultas bloqueantes rodam em thread
+        with STAGE_SECONDS.time(stage='universe'):
+            symbols_filtrados = await self.universe.symbols()
+        SYMBOLS.set(len(symbols_filtrados), stage='universe')
+
+        self.cache.retain(symbols_filtrados)
+        # 🔕 Símbolos em cooldown nem chegam a buscar candles
+        pendentes = [s for s in symbols_filtrados if not self.cooldown.is_muted(s)]
+
+        # 🔎 Pré-filtro: um ticker 24h de todos os símbolos descarta quem não tem como dar alerta
+        if self.prescreen:
+            try:
+                with STAGE_SECONDS.time(stage='prescreen'):
+                    tickers = await self.fetcher.fetch_tickers()
+                    pendentes = prescreen(pendentes, tickers, self.cache, interval=self.intervals[0])
+            except Exception as e:
+                logger.warning(f"⚠️ Pré-filtro indisponível neste ciclo, seguindo com todos os símbolos: {e}")
+        SYMBOLS.set(len(pendentes), stage='prescreen')
+
+        pares = [(symbol, intervalo) for symbol in pendentes for intervalo in self.intervals]
+        # Timeframes sem candle novo são reaproveitados do cache
+        pares_rest = [par for par in pares if par[1] in fechados or par not in self.cache]
+        if self.stream is not None:
+            # 📡 O stream mantém o cache vivo; só vão pro REST os pares sem conexão ativa
+            self.stream.subscribe((symbol, intervalo) for symbol in symbols_filtrados
+                                  for intervalo in self.intervals if intervalo not in self.cache.derived)
+            pares_rest = self.stream.stale_pairs(pares)
+
+        # 🌐 Atualiza o cache com os candles novos do ciclo, em lotes espalhados
+        with STAGE_SECONDS.time(stage='fetch'):
+            candles = await self.scheduler.spread(pares_rest, self.cache.update_many, self.spread_seconds)
+        reaproveitados = 0
+        for par in pares:
+            if par not in candles:
+                candles[par] = self.cache.series(*par)
+                reaproveitados += 1
+        CACHE_LOOKUPS.inc(reaproveitados, result='reused')
+
+        validos = []
+        for symbol in pendentes:
+            erros = [candles[(symbol, intervalo)] for intervalo in self.intervals
+                     if isinstance(candles[(symbol, intervalo)], Exception)]
+            if erros:
+                logger.warning(f"⚠️ Erro ao buscar candles de {symbol} no monitoramento: {erros[0]}")
+            else:
+                validos.append(symbol)
+
+        # 🧮 Indicadores e pontuação em lote, distribuídos entre processos;
+        # cada bloco de símbolos é tratado assim que termina
+        if validos:
+            logger.info(f"🔍 Analisando {len(validos)} símbolos em background...")
+        SYMBOLS.set(len(validos), stage='analysis')
+        alertas = 0
+        series = [[candles[(symbol, intervalo)] for symbol in validos] for intervalo in self.intervals]
+        # EMA/RSI/MACD já mantidos de forma incremental pelo cache; a análise só recalcula a janela dos símbolos sem estado
+        estado = None
+        if self.cache.indicators is not None and validos:
+            estado = [self.cache.indicators.features(validos, intervalo) for intervalo in self.intervals]
+        # 'analysis' cobre o ciclo todo da análise em lote; 'alerts', só a montagem dos alertas
+        with STAGE_SECONDS.time(stage='analysis'):
+            async for simbolos, resultados in self.analyzer.analyze(validos, series, estado):
+                with STAGE_SECONDS.time(stage='alerts'):
+                    for symbol, r in zip(simbolos, resultados):
+                        disparadas = [s for s in self.strategies if r[f'{s.name}_alert']]
+                        if not disparadas:
+                            if logger.isEnabledFor(logging.DEBUG):
+                                logger.debug(f"Nenhuma estratégia disparou para {symbol}, ignorado.")
+                            continue
+
+                        try:
+                            # A latência do alerta conta do fechamento do candle curto que disparou
+                            # o ciclo (o último já fechado quando ele começou; a busca e a análise
+                            # podem terminar depois do fechamento seguinte)
+                            fechamento = candles[(symbol, self.intervals[0])].last_closed_time(inicio)
+                            fechamento = None if fechamento is None else fechamento / 1000
+                            for strategy in disparadas:
+                                self.outbox.put(format_alert(r, symbol, strategy), since=fechamento, symbol=symbol)
+                            self.cooldown.mute(symbol)
+                            alertas += 1
+                        except Exception as e:
+                            logger.warning(f"⚠️ Erro ao analisar {symbol} no monitoramento: {e}")
+        ALERTS.inc(alertas)
+        if validos:
+            logger.info(f"{alertas} símbolos com alerta de {len(validos)} analisados.")
+        return len(validos), alertas
@@ -0,0 +1,128 @@
+#ondemand.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from analysis import render_report
+from batch import analyze_batch, frames_to_batch, snapshot_from_batch
+from data import INTERVAL_MS
+from metrics import COMMAND_SECONDS
+from rules import SHORT_STRATEGY, compile_strategy
+
+logger = logging.getLogger(__name__)
+
+
+class OnDemandAnalyzer:
+    # Análise avulsa de um símbolo (comando !analyze) a partir do cache quente do monitor:
+    # - séries em dia (candle atual já no cache) não geram nenhuma requisição;
+    # - séries ausentes ou paradas (ex.: símbolo em cooldown) saem de uma única busca por
+    #   símbolo, compartilhada pelos pedidos simultâneos;
+    # - a análise é o mesmo analyze_batch do ciclo, com um símbolo, rodando em thread;
+    # - a resposta fica guardada enquanto os candles não mudam.
+    # `max_symbols` é para um cache exclusivo (sem ciclo fazendo retain, como no modo
+    # coordenador): só os últimos símbolos pedidos ficam nele.
+    def __init__(self, cache, intervals=('15m', '1h', '4h'), strategies=None, quote_asset='USDT',
+                 max_symbols=None, max_replies=256):
+        self.cache = cache
+        self.intervals = tuple(intervals)
+        self.strategies = [compile_strategy(s) for s in (strategies or [SHORT_STRATEGY])]
+        self.quote_asset = quote_asset
+        self.max_symbols = max_symbols
+        self.max_replies = max_replies
+        self._inflight = {}
+        self._replies = OrderedDict()
+        self._recentes = OrderedDict()
+
+    def normalize(self, symbol):
+        # 'btc' -> 'BTCUSDT'
+        symbol = symbol.strip().upper()
+        return symbol if symbol.endswith(self.quote_asset) else symbol + self.quote_asset
+
+    def timeframes(self, interval):
+        # (curto, longo, maior) a partir do intervalo pedido; no topo repete o maior disponível
+        i = self.intervals.index(interval)
+        escada = self.intervals[i:] + (self.intervals[-1],) * 2
+        return escada[:3]
+
+    def _stale(self, symbol, now_ms):
+        # Pares sem o candle atual no cache
+        pares = []
+        for interval in self.intervals:
+            if (symbol, interval) in self.cache:
+                ultimo = self.cache.series(symbol, interval).last_open_time()
+                if ultimo is not None and ultimo >= now_ms - now_ms % INTERVAL_MS[interval]:
+                    continue
+            pares.append((symbol, interval))
+        return pares
+
+    async def _ensure(self, symbol, pares):
+        # Pedidos simultâneos do mesmo símbolo esperam a mesma busca
+        task = self._inflight.get(symbol)
+        if task is None:
+            task = self._inflight[symbol] = asyncio.create_task(self._fetch(symbol, pares))
+            task.add_done_callback(lambda _: self._inflight.pop(symbol, None))
+        # shield: quem desistir do pedido não cancela a busca dos outros
+        await asyncio.shield(task)
+
+    async def _fetch(self, symbol, pares):
+        resultados = await self.cache.update_many(pares)
+        erros = [r for r in resultados.values() if isinstance(r, Exception)]
+        if erros:
+            raise erros[0]
+        if self.max_symbols is not None:
+            self._recentes[symbol] = None
+            self._recentes.move_to_end(symbol)
+            while len(self._recentes) > self.max_symbols:
+                self._recentes.popitem(last=False)
+            self.cache.retain(self._recentes)
+
+    def _render(self, symbol, interval, batch, estado):
+        # Roda em thread: indicadores + pontuação de todas as estratégias para um símbolo
+        r = analyze_batch(*batch, strategies=self.strategies, state=estado)[0]
+        report = render_report(snapshot_from_batch(r, symbol), int(r['confidence']), detailed=True)
+        linhas = [f"🔎 *Análise de `{symbol}` ({interval})*", report]
+        for strategy in self.strategies:
+            alerta = " 🚨 alerta" if r[f'{strategy.name}_alert'] else ""
+            linhas.append(f"`{strategy.name}`: {r[f'{strategy.name}_confidence']:.0f}%{alerta}")
+        return "\n".join(linhas)
+
+    async def analyze(self, symbol, interval=None):
+        """
+        Relatório detalhado de `symbol` com `interval` como timeframe curto (padrão: o
+        primeiro dos intervalos). ValueError para intervalo fora dos monitorados; erros da
+        busca na Binance (símbolo inexistente, por exemplo) são repassados.
+        """
+        inicio = time.perf_counter()
+        symbol = self.normalize(symbol)
+        interval = interval or self.intervals[0]
+        if interval not in self.intervals:
+            raise ValueError(f"intervalo {interval!r} não suportado (use {', '.join(self.intervals)})")
+        timeframes = self.timeframes(interval)
+
+        origem = 'hit'
+        try:
+            pares = self._stale(symbol, int(time.time() * 1000))
+            if pares:
+                origem = 'fetch'
+                await self._ensure(symbol, pares)
+            series = [self.cache.series(symbol, tf) for tf in timeframes]
+            # O candle em formação muda de preço sem mudar de open_time
+            chave = (symbol, interval) + tuple((s.last_open_time(), float(s.close[-1])) for s in series)
+            texto = self._replies.get(chave)
+            if texto is None:
+                # As matrizes são cópias: o cache pode mudar enquanto a thread calcula
+                batch = [frames_to_batch([s]) for s in series]
+                # Mesmo estado incremental que o ciclo usa, para o relatório bater com os alertas
+                estado = None
+                if self.cache.indicators is not None:
+                    estado = [self.cache.indicators.features([symbol], tf) for tf in timeframes]
+                texto = await asyncio.to_thread(self._render, symbol, interval, batch, estado)
+                self._replies[chave] = texto
+                while len(self._replies) > self.max_replies:
+                    self._replies.popitem(last=False)
+            return texto
+        except Exception:
+            origem = 'error'
+            raise
+        finally:
+            COMMAND_SECONDS.observe(time.perf_counter() - inicio, source=origem)
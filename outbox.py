@@ -0,0 +1,196 @@
+#outbox.py
+import asyncio
+import logging
+import time
+from collections import deque
+from metrics import OUTBOX_DEPTH, SEND_SECONDS, ALERT_LATENCY
+
+logger = logging.getLogger(__name__)
+
+DISCORD_MAX_CHARS = 2000
+SEPARADOR = "\n\n"
+
+
+def pack_messages(alerts, max_chars=DISCORD_MAX_CHARS):
+    # Junta os alertas em mensagens de até `max_chars` caracteres, sem quebrar um alerta
+    # entre mensagens; um alerta maior que o limite sozinho é quebrado por linhas.
+    return [mensagem for mensagem, _ in _pack(alerts, max_chars)]
+
+
+def _pack(alerts, max_chars):
+    # Como pack_messages, mas cada mensagem vem com o índice do último alerta que ela
+    # completa (None se o alerta continua na próxima mensagem)
+    mensagens = []
+    atual, ultimo = "", None
+    for i, alerta in enumerate(alerts):
+        for parte in _split(alerta, max_chars):
+            if atual and len(atual) + len(SEPARADOR) + len(parte) <= max_chars:
+                atual += SEPARADOR + parte
+            else:
+                if atual:
+                    mensagens.append((atual, ultimo))
+                atual, ultimo = parte, None
+        ultimo = i
+    if atual:
+        mensagens.append((atual, ultimo))
+    return mensagens
+
+
+def _split(text, max_chars):
+    if len(text) <= max_chars:
+        return [text]
+    partes, atual = [], ""
+    for linha in text.split("\n"):
+        while len(linha) > max_chars:
+            if atual:
+                partes.append(atual)
+                atual = ""
+            partes.append(linha[:max_chars])
+            linha = linha[max_chars:]
+        if atual and len(atual) + 1 + len(linha) > max_chars:
+            partes.append(atual)
+            atual = linha
+        else:
+            atual = f"{atual}\n{linha}" if atual else linha
+    if atual:
+        partes.append(atual)
+    return partes
+
+
+class AlertOutbox:
+    # Fila de alertas entre a análise e o Discord, esvaziada por uma task própria:
+    # o ciclo de análise só enfileira (put) e nunca espera a API do Discord.
+    # - alertas que chegam juntos (dentro de `linger` segundos) saem agrupados em
+    #   mensagens de até 2000 caracteres
+    # - no máximo `rate` mensagens a cada `per` segundos (limite por canal do Discord)
+    # - 429 respeita o retry_after; outras falhas tentam de novo com backoff exponencial
+    # - alerta que não sai depois de `max_retries` tentativas é descartado e o símbolo
+    #   vai para `on_failure(symbol)` (ex.: AlertCooldown.unmute, para o símbolo poder
+    #   alertar de novo no próximo ciclo em vez de ficar silenciado sem ter avisado ninguém)
+    # `channel` é qualquer objeto com `async send(content)` (ex.: StubChannel nos testes).
+    def __init__(self, channel, linger=1.0, rate=5, per=5.0, max_retries=5, max_chars=DISCORD_MAX_CHARS,
+                 on_failure=None):
+        self.channel = channel
+        self.on_failure = on_failure
+        self.linger = linger
+        self.rate = rate
+        self.per = per
+        self.max_retries = max_retries
+        self.max_chars = max_chars
+        self._queue = asyncio.Queue()
+        self._sent = deque()
+        self._task = None
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def put(self, alert, since=None, symbol=None):
+        # `since`: instante (epoch, s) do fechamento de candle que originou o alerta,
+        # para medir quanto tempo o sinal levou até chegar ao Discord.
+        # `symbol`: vai para on_failure se o alerta não for entregue
+        self._queue.put_nowait((alert, since, symbol))
+        OUTBOX_DEPTH.set(self._queue.qsize())
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def drain(self):
+        # Espera até todos os alertas enfileirados terem sido entregues (ou desistidos)
+        await self._queue.join()
+
+    async def stop(self, timeout=10):
+        # Tenta entregar o que ainda está na fila antes de encerrar
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._queue.qsize()} alertas não entregues ao encerrar.")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _collect(self):
+        alertas = [await self._queue.get()]
+        fim = time.monotonic() + self.linger
+        while (restante := fim - time.monotonic()) > 0:
+            try:
+                alertas.append(await asyncio.wait_for(self._queue.get(), restante))
+            except asyncio.TimeoutError:
+                break
+        return alertas
+
+    async def _run(self):
+        while True:
+            alertas = await self._collect()
+            entregues = 0
+            try:
+                for mensagem, ultimo in _pack([texto for texto, _, _ in alertas], self.max_chars):
+                    await self._deliver(mensagem)
+                    if ultimo is not None:
+                        entregues = ultimo + 1
+            except Exception as e:
+                logger.error(f"Falha ao enviar {len(alertas) - entregues} alertas ao Discord: {e}")
+                self._failed(alertas[entregues:])
+            finally:
+                self._delivered(alertas[:entregues])
+                for _ in alertas:
+                    self._queue.task_done()
+                OUTBOX_DEPTH.set(self._queue.qsize())
+
+    def _delivered(self, alertas):
+        agora = time.time()
+        for _, since, _ in alertas:
+            if since is not None:
+                ALERT_LATENCY.observe(agora - since)
+
+    def _failed(self, alertas):
+        if self.on_failure is None:
+            return
+        for symbol in dict.fromkeys(symbol for _, _, symbol in alertas if symbol is not None):
+            try:
+                self.on_failure(symbol)
+            except Exception as e:
+                logger.warning(f"Falha ao liberar o cooldown de {symbol}: {e}")
+
+    async def _throttle(self):
+        while len(self._sent) >= self.rate:
+            espera = self._sent[0] + self.per - time.monotonic()
+            if espera <= 0:
+                self._sent.popleft()
+            else:
+                await asyncio.sleep(espera)
+        self._sent.append(time.monotonic())
+
+    async def _deliver(self, mensagem):
+        for tentativa in range(self.max_retries + 1):
+            await self._throttle()
+            inicio = time.perf_counter()
+            try:
+                resposta = await self.channel.send(mensagem)
+                SEND_SECONDS.observe(time.perf_counter() - inicio, status='ok')
+                return resposta
+            except Exception as e:
+                SEND_SECONDS.observe(time.perf_counter() - inicio, status=getattr(e, 'status', 'error'))
+                if tentativa == self.max_retries:
+                    raise
+                # discord.HTTPException traz o status; discord.RateLimited, o retry_after
+                espera = getattr(e, 'retry_after', None)
+                if espera is None:
+                    espera = 2 ** tentativa
+                logger.warning(f"Envio ao Discord falhou ({getattr(e, 'status', e)}), nova tentativa em {espera}s...")
+                await asyncio.sleep(espera)
+
+
+class StubChannel:
+    # Canal local que só guarda e loga as mensagens; substitui o canal do Discord em testes e replays
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.messages = []
+
+    async def send(self, content):
+        await asyncio.sleep(self.latency)
+        self.messages.append(content)
+        logger.info(f"[stub] {content}")
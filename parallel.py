@@ -0,0 +1,130 @@
+#parallel.py
+import asyncio
+import logging
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from batch import analyze_batch
+
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = ('high', 'low', 'close')
+
+
+def _attach(name):
+    # Workers only borrow the block; the parent owns it and unlinks it. Before
+    # Python 3.13 there is no track=False, but pool workers share the parent's
+    # resource tracker, so the extra registration is a no-op there.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _analyze_rows(shm_name, shape, start, stop, strategies=None, state=None):
+    # Runs in a worker process: maps the shared (timeframes x columns x symbols x candles)
+    # block and analyzes rows [start, stop) without any price data being pickled;
+    # `state` (small per-symbol indicator values) already comes sliced to these rows
+    shm = _attach(shm_name)
+    try:
+        prices = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        timeframes = [tuple(prices[tf, col, start:stop] for col in range(shape[1])) for tf in range(shape[0])]
+        result = analyze_batch(*timeframes, strategies=strategies, state=state)
+        del prices, timeframes
+        return start, result
+    finally:
+        shm.close()
+
+
+def _slice(state, start, stop):
+    if state is None:
+        return None
+    return [None if values is None else {spec: v[start:stop] for spec, v in values.items()} for values in state]
+
+
+class SharedPrices:
+    # Shared memory block holding the aligned price matrices of one analysis cycle
+    def __init__(self, shape):
+        self.shape = shape
+        self.shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+        self.array = np.ndarray(shape, dtype=np.float64, buffer=self.shm.buf)
+        self.array.fill(np.nan)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def fill(self, timeframe, series):
+        # Same layout as batch.to_matrix: shorter series are left-padded with NaN
+        width = self.shape[3]
+        for col, name in enumerate(PRICE_COLUMNS):
+            for row, s in enumerate(series):
+                values = np.asarray(s[name])[-width:]
+                if len(values):
+                    self.array[timeframe, col, row, width - len(values):] = values
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ParallelAnalyzer:
+    # Spreads analyze_batch over a process pool. Each cycle copies the cached
+    # candles once into a shared memory block; workers map it and analyze a
+    # chunk of symbols each, and results are yielded as soon as a chunk finishes.
+    # With max_workers=0 the analysis runs in a thread instead (no processes).
+    # `strategies` (rule specs, see rules.py) are sent to the workers as plain dicts.
+    def __init__(self, max_workers=None, chunk_size=64, strategies=None):
+        self.max_workers = os.cpu_count() if max_workers is None else max_workers
+        self.chunk_size = chunk_size
+        self.strategies = strategies
+        self._executor = None
+        if self.max_workers > 0:
+            # spawn: forking a process that already runs the event loop and
+            # aiohttp/thread pools can deadlock on locks held by other threads
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def analyze(self, symbols, series_by_timeframe, state=None):
+        """
+        Async generator over (symbols, analyze_batch result) chunks, in completion order.
+        series_by_timeframe holds one list per timeframe (short, long, higher) of
+        Candles-like series aligned with `symbols`; `state` is the optional per-timeframe
+        indicator state for the same symbols (see batch.BatchFeatures).
+        """
+        if not symbols:
+            return
+        width = max(len(s) for series in series_by_timeframe for s in series)
+        shared = SharedPrices((len(series_by_timeframe), len(PRICE_COLUMNS), len(symbols), width))
+        try:
+            for tf, series in enumerate(series_by_timeframe):
+                shared.fill(tf, series)
+
+            if self._executor is None:
+                timeframes = [tuple(shared.array[tf]) for tf in range(shared.shape[0])]
+                result = await asyncio.to_thread(analyze_batch, *timeframes, strategies=self.strategies, state=state)
+                del timeframes
+                yield symbols, result
+                return
+
+            loop = asyncio.get_running_loop()
+            futures = [
+                loop.run_in_executor(self._executor, _analyze_rows, shared.name, shared.shape, i, i + self.chunk_size,
+                                     self.strategies, _slice(state, i, i + self.chunk_size))
+                for i in range(0, len(symbols), self.chunk_size)
+            ]
+            try:
+                for future in asyncio.as_completed(futures):
+                    start, result = await future
+                    yield symbols[start:start + len(result)], result
+            finally:
+                # The block can only be released once no worker is still reading it
+                await asyncio.gather(*futures, return_exceptions=True)
+        finally:
+            shared.close()
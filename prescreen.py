@@ -0,0 +1,59 @@
+#prescreen.py
+import logging
+import time
+import numpy as np
+from data import INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+
+def ema_upper_bound(ema, high, steps, period=21):
+    # Maior valor que a EMA(period) pode atingir depois de mais `steps` fechamentos, nenhum acima de `high`
+    alpha = 2 / (period + 1)
+    decay = (1 - alpha) ** steps
+    return decay * ema + (1 - decay) * np.maximum(high, ema)
+
+
+def prescreen(symbols, tickers, cache, interval='15m', period=21, margin=0.002, now=None):
+    """
+    Descarta os símbolos que não podem gerar alerta SHORT neste ciclo, usando só o
+    ticker 24h (uma requisição para todos) e o estado dos indicadores já em cache.
+
+    Os dois gatilhos do alerta exigem o fechamento do timeframe curto abaixo da EMA(21):
+    a reversão confere isso diretamente, e um cruzamento de baixa EMA(9)/EMA(21) só é
+    possível com o novo fechamento abaixo da EMA(21) anterior. A EMA em cache pode estar
+    alguns candles fechados atrás, então é limitada por cima supondo que esses candles
+    fecharam na máxima de 24h. `margin` absorve a variação do preço entre o ticker e a
+    busca de klines. Símbolos sem estado em cache ou sem ticker sempre passam.
+    """
+    symbols = list(symbols)
+    if not symbols or cache.indicators is None:
+        return symbols
+    now = int(time.time() * 1000) if now is None else now
+    step = INTERVAL_MS[interval]
+    forming = now // step * step
+
+    ema = np.full(len(symbols), np.nan)
+    last_open = np.zeros(len(symbols), dtype=np.int64)
+    price = np.full(len(symbols), np.nan)
+    high = np.full(len(symbols), np.nan)
+    for i, symbol in enumerate(symbols):
+        committed = cache.indicators.committed(symbol, interval)
+        ticker = tickers.get(symbol)
+        if committed is None or ticker is None or (symbol, interval) not in cache:
+            continue
+        ema[i] = committed[f'EMA_{period}']
+        last_open[i] = cache.series(symbol, interval).last_open_time()
+        price[i] = float(ticker['lastPrice'])
+        high[i] = float(ticker['highPrice'])
+
+    # Candles fechados que ainda não entraram no estado consolidado: do último candle
+    # em cache (que pode ter sido guardado ainda em formação) até o que está em formação
+    steps = np.maximum((forming - last_open) // step, 0) + 1
+    known = ~np.isnan(ema) & ~np.isnan(price)
+    bound = ema_upper_bound(np.where(known, ema, 0), np.where(known, high, 0), steps, period)
+    keep = ~known | (price < bound * (1 + margin))
+
+    survivors = [s for s, k in zip(symbols, keep) if k]
+    logger.debug(f"Pré-filtro: {len(survivors)}/{len(symbols)} símbolos mantidos.")
+    return survivors
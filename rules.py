@@ -0,0 +1,284 @@
+#rules.py
+import ast
+import json
+import logging
+import re
+from functools import lru_cache
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Declarative signal strategies. A strategy is a plain dict (or JSON file) of
+# expressions over named indicator features; it is compiled once into numpy code
+# and evaluated over a FeatureTable, so every strategy in a cycle shares the same
+# already-computed indicator arrays.
+#
+# Feature names (short timeframe; add _long or _high for the other two):
+#   close, prev_close, high, low        last close, previous close, window max/min
+#   ema_<n>, prev_ema_<n>               EMA(n) on the last / previous candle
+#   rsi, rsi_<n>                        RSI(14) / RSI(n)
+#   macd, macd_signal                   MACD(12, 26, 9); macd_<f>_<s>_<g> for other periods
+# Expressions use Python syntax: arithmetic, comparisons (chains allowed) and
+# and/or/not, which are applied element-wise.
+
+SHORT_STRATEGY = {
+    'name': 'short',
+    'title': "📉 *Alerta SHORT para `{symbol}`*",
+    'direction': "Bearish 📉 (Short)",
+    'side': 'short',
+    'params': {'threshold': 70, 'rsi_low': 40, 'rsi_high': 60},
+    'define': {
+        # Same rules as check_reversal, check_continuation and check_ema_crossover
+        'fib_0618': "high - (high - low) * 0.618",
+        'fib_05': "high - (high - low) * 0.5",
+        'fib_0382': "high - (high - low) * 0.382",
+        'reversal_short': "(close < fib_0618 or close < fib_05 or close < fib_0382) and close < ema_21",
+        'continuation_short': "close > ema_21 and close > prev_close",
+        'crossover_down': "prev_ema_9 > prev_ema_21 and ema_9 < ema_21",
+        'crossover_up': "prev_ema_9 < prev_ema_21 and ema_9 > ema_21",
+        'reversal_long': "(close_long < high_long - (high_long - low_long) * 0.618"
+                         " or close_long < high_long - (high_long - low_long) * 0.5"
+                         " or close_long < high_long - (high_long - low_long) * 0.382)"
+                         " and close_long < ema_21_long",
+        'continuation_long': "close_long > ema_21_long and close_long > prev_close_long",
+        'reversal_high': "(close_high < high_high - (high_high - low_high) * 0.618"
+                         " or close_high < high_high - (high_high - low_high) * 0.5"
+                         " or close_high < high_high - (high_high - low_high) * 0.382)"
+                         " and close_high < ema_21_high",
+        'continuation_high': "close_high > ema_21_high and close_high > prev_close_high",
+    },
+    # Same weights as calculate_signal_confidence
+    'score': [
+        [40, "reversal_short or continuation_short"],
+        [30, "reversal_long or continuation_long"],
+        [20, "reversal_high or continuation_high"],
+        [10, "crossover_down or crossover_up"],
+        [10, "reversal_short and rsi < rsi_low"],
+        [10, "continuation_short and rsi > rsi_high"],
+        [10, "(macd > macd_signal and continuation_short) or (macd < macd_signal and reversal_short)"],
+    ],
+    'max_score': 100,
+    'alert': "confidence >= threshold and (crossover_down or reversal_short) and not continuation_short",
+}
+
+TIMEFRAME_SUFFIXES = {'_long': 1, '_high': 2}
+
+_FEATURE_PATTERNS = [
+    (re.compile(r'(prev_)?close$'), lambda m: ('close', 1 if m.group(1) else 0)),
+    (re.compile(r'high$'), lambda m: ('high',)),
+    (re.compile(r'low$'), lambda m: ('low',)),
+    (re.compile(r'(prev_)?ema_(\d+)$'), lambda m: ('ema', int(m.group(2)), 1 if m.group(1) else 0)),
+    (re.compile(r'rsi(?:_(\d+))?$'), lambda m: ('rsi', int(m.group(1) or 14))),
+    (re.compile(r'macd(_signal)?(?:_(\d+)_(\d+)_(\d+))?$'),
+     lambda m: ('macd_signal' if m.group(1) else 'macd',) + (tuple(int(g) for g in m.group(2, 3, 4)) if m.group(2) else (12, 26, 9))),
+]
+
+
+def parse_feature(name):
+    # 'ema_21_long' -> (1, ('ema', 21, 0)); None if the name is not a feature
+    timeframe = 0
+    for suffix, index in TIMEFRAME_SUFFIXES.items():
+        if name.endswith(suffix):
+            name, timeframe = name[:-len(suffix)], index
+            break
+    for pattern, spec in _FEATURE_PATTERNS:
+        m = pattern.match(name)
+        if m:
+            return timeframe, spec(m)
+    return None
+
+
+class FeatureTable:
+    """
+    Indicator features computed on first use and cached by name. Subclasses
+    implement compute(timeframe, spec), where spec is one of
+    ('close', lag), ('high',), ('low',), ('ema', period, lag), ('rsi', period),
+    ('macd', fast, slow, signal) or ('macd_signal', fast, slow, signal).
+    """
+    def __init__(self):
+        self._features = {}
+        self._defines = {}
+
+    def __getitem__(self, name):
+        value = self._features.get(name)
+        if value is None:
+            parsed = parse_feature(name)
+            if parsed is None:
+                raise KeyError(name)
+            value = self._features[name] = self.compute(*parsed)
+        return value
+
+    def __contains__(self, name):
+        return name in self._features
+
+    def compute(self, timeframe, spec):
+        raise NotImplementedError
+
+
+class _Compiler(ast.NodeTransformer):
+    # Rewrites and/or/not and comparison chains into element-wise numpy calls and
+    # rejects anything that isn't arithmetic over names and numbers
+    ALLOWED = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.BoolOp, ast.Name, ast.Constant,
+               ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.USub, ast.UAdd, ast.Not, ast.And, ast.Or,
+               ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+    def __init__(self):
+        self.names = set()
+
+    def generic_visit(self, node):
+        if not isinstance(node, self.ALLOWED):
+            raise ValueError(f"expressão não suportada: {type(node).__name__}")
+        return super().generic_visit(node)
+
+    @staticmethod
+    def _call(func, *args):
+        return ast.Call(func=ast.Name(id=func, ctx=ast.Load()), args=list(args), keywords=[])
+
+    def _chain(self, func, values):
+        node = values[0]
+        for value in values[1:]:
+            node = self._call(func, node, value)
+        return node
+
+    def visit_Name(self, node):
+        self.names.add(node.id)
+        return node
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+            raise ValueError(f"constante não suportada: {node.value!r}")
+        return node
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        return self._chain('_and' if isinstance(node.op, ast.And) else '_or', node.values)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return self._call('_not', node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        operands = [node.left] + node.comparators
+        pairs = [ast.Compare(left=a, ops=[op], comparators=[b]) for a, op, b in zip(operands, node.ops, operands[1:])]
+        return self._chain('_and', pairs)
+
+
+_GLOBALS = {'__builtins__': {}, '_and': np.logical_and, '_or': np.logical_or, '_not': np.logical_not}
+
+
+def compile_expression(source):
+    # Returns (code, names referenced)
+    compiler = _Compiler()
+    tree = compiler.visit(ast.parse(source.strip(), mode='eval'))
+    ast.fix_missing_locations(tree)
+    return compile(tree, f"<rule {source!r}>", 'eval'), compiler.names
+
+
+class Strategy:
+    # A compiled strategy spec (see SHORT_STRATEGY)
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec['name']
+        self.title = spec.get('title', f"🔔 *Alerta {self.name.upper()} para `{{symbol}}`*")
+        self.direction = spec.get('direction')
+        # Trade side ('short'/'long'): sets the targets and stop loss of the alert report
+        self.side = spec.get('side')
+        if self.side not in (None, 'short', 'long'):
+            raise ValueError(f"estratégia {self.name!r}: side deve ser 'short' ou 'long', não {self.side!r}")
+        self.params = dict(spec.get('params', {}))
+        self.max_score = spec.get('max_score')
+
+        self.defines = []
+        chaves = {}
+        for name, source in spec.get('define', {}).items():
+            code, names = self._compile(source, chaves)
+            # Defines with the same name, source and dependencies are shared between strategies
+            key = (name, source, tuple(sorted(chaves[n] for n in names if n in chaves)),
+                   tuple(sorted((n, self.params[n]) for n in names if n in self.params)))
+            chaves[name] = key
+            self.defines.append((name, key, code))
+        self.score = [(points, self._compile(source, chaves)[0]) for points, source in spec.get('score', [])]
+        self.alert = self._compile(spec['alert'], {**chaves, 'confidence': None})[0]
+
+    def _compile(self, source, defined):
+        code, names = compile_expression(source)
+        for name in names:
+            if name not in defined and name not in self.params and parse_feature(name) is None:
+                raise ValueError(f"estratégia {self.name!r}: nome desconhecido {name!r} em {source!r}")
+        return code, names
+
+    def evaluate_defines(self, table):
+        # Only the named defines ({name: array}), without scoring
+        return dict(self._define(table))
+
+    def _define(self, table):
+        scope = _Scope(table, self.params)
+        for name, key, code in self.defines:
+            value = table._defines.get(key)
+            if value is None:
+                value = table._defines[key] = eval(code, _GLOBALS, scope)
+            scope[name] = value
+        return scope
+
+    def evaluate(self, table):
+        """
+        Returns {'confidence', 'alert', <defines>...} evaluated over the table's arrays.
+        """
+        scope = self._define(table)
+        confidence = 0
+        for points, code in self.score:
+            confidence = confidence + points * eval(code, _GLOBALS, scope)
+        if self.max_score is not None:
+            confidence = np.minimum(confidence, self.max_score)
+        scope['confidence'] = confidence
+        scope['alert'] = eval(self.alert, _GLOBALS, scope)
+        return dict(scope)
+
+
+class _Scope(dict):
+    # Name lookup for eval: strategy locals (the dict itself), then params, then table features
+    def __init__(self, table, params):
+        super().__init__()
+        self.table = table
+        self.params = params
+
+    def __missing__(self, name):
+        if name in self.params:
+            return self.params[name]
+        # KeyError lets eval fall back to the globals (the _and/_or/_not helpers)
+        return self.table[name]
+
+
+@lru_cache(maxsize=64)
+def _compile_cached(spec_json):
+    return Strategy(json.loads(spec_json))
+
+
+def compile_strategy(spec):
+    # Compiled strategies are cached by content, so worker processes that receive the
+    # same spec every cycle only compile it once
+    if isinstance(spec, Strategy):
+        return spec
+    return _compile_cached(json.dumps(spec, sort_keys=True))
+
+
+def with_params(spec, **params):
+    # Copy of a strategy spec with some params overridden (thresholds, RSI levels...)
+    return {**spec, 'params': {**spec.get('params', {}), **params}}
+
+
+def load_strategies(path):
+    # JSON file with one strategy spec or a list of them
+    with open(path, encoding='utf-8') as f:
+        specs = json.load(f)
+    if isinstance(specs, dict):
+        specs = [specs]
+    for spec in specs:
+        compile_strategy(spec)
+    logger.info(f"{len(specs)} estratégias carregadas de {path}: {[s['name'] for s in specs]}")
+    return specs
@@ -0,0 +1,88 @@
+# scheduler.py
+import asyncio
+import logging
+import time
+from data import INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+
+def next_boundary(interval, now_ms):
+    # Candles da Binance fecham em múltiplos do intervalo contados a partir do epoch (UTC)
+    step = INTERVAL_MS[interval]
+    return (now_ms // step + 1) * step
+
+
+class CandleScheduler:
+    # Acorda logo depois do fechamento de candle mais próximo entre os intervalos
+    # e informa quais timeframes fecharam desde o último ciclo. No fechamento de
+    # 15m que não é virada de hora, 1h e 4h não aparecem, e o chamador reaproveita
+    # o que já está no cache em vez de rebuscar.
+    # `delay` dá um respiro para a Binance consolidar o candle; notify() (chamado
+    # pelo stream ao receber um candle fechado) acorda o ciclo antes disso.
+    # `speed`: segundos do `clock` por segundo real, para replays com relógio acelerado.
+    def __init__(self, intervals, delay=2.0, clock=time.time, speed=1.0):
+        self.intervals = tuple(intervals)
+        self.delay = delay
+        self.clock = clock
+        self.speed = speed
+        self._last = None
+        self._wake = asyncio.Event()
+
+    def _now_ms(self):
+        return int(self.clock() * 1000)
+
+    def notify(self, symbol=None, interval=None):
+        self._wake.set()
+
+    def seconds_until_next(self):
+        now = self._now_ms()
+        target = min(next_boundary(i, now) for i in self.intervals)
+        return max((target - now) / 1000 + self.delay, 0)
+
+    async def wait_next(self):
+        # Primeiro ciclo: todos os timeframes, para carregar o cache
+        if self._last is None:
+            self._last = self._now_ms()
+            return set(self.intervals)
+
+        target = min(next_boundary(i, self._last) for i in self.intervals)
+        while True:
+            now = self._now_ms()
+            restante = (target - now) / 1000 + self.delay
+            if restante <= 0:
+                break
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=restante / self.speed)
+            except asyncio.TimeoutError:
+                break
+            if self._now_ms() >= target:
+                break
+
+        # Se o ciclo anterior atrasou e passou por mais de uma virada, nenhuma se perde
+        agora = max(self._now_ms(), target)
+        fechados = {i for i in self.intervals if agora // INTERVAL_MS[i] > self._last // INTERVAL_MS[i]}
+        self._last = agora
+        logger.debug(f"Candles fechados: {sorted(fechados, key=INTERVAL_MS.get)}")
+        return fechados
+
+    async def spread(self, items, handler, seconds, batches=10):
+        # Divide `items` em lotes disparados em intervalos iguais ao longo de `seconds`,
+        # para não mandar todas as requisições do ciclo na mesma rajada.
+        # `handler` recebe uma lista e devolve um dict; os dicts são unidos no final.
+        items = list(items)
+        if not items or seconds <= 0:
+            return await handler(items)
+        batches = max(1, min(batches, len(items)))
+        size = -(-len(items) // batches)
+        intervalo = seconds / batches
+
+        async def lote(i):
+            await asyncio.sleep(i * intervalo)
+            return await handler(items[i * size:(i + 1) * size])
+
+        resultados = {}
+        for parcial in await asyncio.gather(*(lote(i) for i in range(batches))):
+            resultados.update(parcial)
+        return resultados
@@ -0,0 +1,468 @@
+#shard.py
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+from collections import deque
+from data import (
+    FUTURES_BASE_URL,
+    get_binance_client,
+    UniverseResolver,
+    AsyncKlineFetcher,
+    KlineCache,
+    KlineStore
+)
+from indicators import IndicatorEngine
+from parallel import ParallelAnalyzer
+from scheduler import CandleScheduler
+from cooldown import AlertCooldown
+from outbox import AlertOutbox, StubChannel
+from monitor import Monitor
+from rules import SHORT_STRATEGY, load_strategies
+
+logger = logging.getLogger(__name__)
+
+# Modo coordenador/worker: o coordenador resolve o universo de símbolos e divide
+# entre os workers por hash consistente; cada worker roda o Monitor só no seu shard
+# e devolve os alertas ao coordenador, o único processo que posta no Discord.
+# A conversa é JSON por linha num socket local (TCP ou Unix):
+#   worker -> coordenador: hello {worker}, alert {text, since, symbol}, mute {symbol, ttl}
+#   coordenador -> worker: shard {symbols, muted: {symbol: segundos restantes}}, unmute {symbol}
+# Mensagem com campo faltando ou de tipo errado (MESSAGES) é ignorada com um aviso.
+# Quando um worker entra ou sai, o anel é recalculado e só ~1/N dos símbolos muda de dono.
+
+# Mesmos timeframes do bot.py
+INTERVALS = ('15m', '1h', '4h')
+DERIVED = {'1h': '15m', '4h': '15m'}
+# Linhas do protocolo podem carregar shards com milhares de símbolos
+LINE_LIMIT = 2 ** 22
+# Campos de cada tipo de mensagem e os tipos aceitos (None = campo opcional)
+MESSAGES = {
+    'hello': {'worker': str},
+    'alert': {'text': str, 'since': (int, float, type(None)), 'symbol': (str, type(None))},
+    'mute': {'symbol': str, 'ttl': (int, float)},
+    'shard': {'symbols': list, 'muted': dict},
+    'unmute': {'symbol': str},
+}
+
+
+def parse_address(address):
+    # 'host:porta' ou 'unix:/caminho/do/socket'
+    if address.startswith('unix:'):
+        return ('unix', address[len('unix:'):])
+    host, _, port = address.rpartition(':')
+    return ('tcp', (host or '127.0.0.1', int(port)))
+
+
+async def _open(address):
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        return await asyncio.open_unix_connection(target, limit=LINE_LIMIT)
+    return await asyncio.open_connection(*target, limit=LINE_LIMIT)
+
+
+async def _serve(handler, address):
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        if os.path.exists(target):
+            os.unlink(target)
+        return await asyncio.start_unix_server(handler, target, limit=LINE_LIMIT)
+    return await asyncio.start_server(handler, *target, limit=LINE_LIMIT)
+
+
+def _encode(msg):
+    return json.dumps(msg, separators=(',', ':')).encode() + b'\n'
+
+
+async def _read(reader):
+    linha = await reader.readline()
+    return json.loads(linha) if linha else None
+
+
+def _valid(msg, *types):
+    # A mensagem é de um dos `types` e traz os campos de MESSAGES com o tipo certo?
+    if not isinstance(msg, dict) or msg.get('type') not in types:
+        return False
+    return all(isinstance(msg.get(campo), tipo) for campo, tipo in MESSAGES[msg['type']].items())
+
+
+class HashRing:
+    # Hash consistente com nós virtuais (`replicas` pontos por worker no anel)
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self.nodes = set()
+        self._keys = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            pos = bisect.bisect(self._keys, h)
+            self._keys.insert(pos, h)
+            self._owners.insert(pos, node)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        pontos = [(k, o) for k, o in zip(self._keys, self._owners) if o != node]
+        self._keys = [k for k, _ in pontos]
+        self._owners = [o for _, o in pontos]
+
+    def owner(self, key):
+        if not self._keys:
+            return None
+        return self._owners[bisect.bisect(self._keys, self._hash(key)) % len(self._keys)]
+
+    def partition(self, keys):
+        # {node: [keys]}, na ordem original; todo node aparece, mesmo com shard vazio
+        shards = {node: [] for node in self.nodes}
+        for key in keys:
+            node = self.owner(key)
+            if node is not None:
+                shards[node].append(key)
+        return shards
+
+
+class Coordinator:
+    # Lado coordenador: aceita workers, redistribui o universo a cada mudança (símbolos
+    # ou membros) e encaminha os alertas recebidos para a fila de saída do Discord.
+    # Os mutes dos workers vão para o cooldown central, que acompanha cada símbolo
+    # quando ele muda de shard (o novo dono não alerta de novo). Alerta que o outbox
+    # não consegue entregar libera o cooldown central e o do worker dono do símbolo.
+    def __init__(self, universe, outbox, cooldown, address='127.0.0.1:8765', refresh=60.0, replicas=100):
+        self.universe = universe
+        self.outbox = outbox
+        self.outbox.on_failure = self.unmute
+        self.cooldown = cooldown
+        self.address = address
+        self.refresh = refresh
+        self.ring = HashRing(replicas=replicas)
+        self.symbols = []
+        self._workers = {}
+        self._assigned = {}
+        self._lock = asyncio.Lock()
+        self._server = None
+        self._refresh_task = None
+        self._handlers = set()
+        self._closing = False
+
+    @property
+    def workers(self):
+        return dict(self._assigned)
+
+    async def start(self):
+        self._server = await _serve(self._handle, self.address)
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+        logger.info(f"Coordenador aguardando workers em {self.address}")
+        return self
+
+    async def stop(self):
+        self._closing = True
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            # Os handlers das conexões abertas não terminam sozinhos: são cancelados e
+            # aguardados aqui, antes de o loop fechar
+            handlers = list(self._handlers)
+            for task in handlers:
+                task.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def run(self):
+        await self.start()
+        await self._server.serve_forever()
+
+    def unmute(self, symbol):
+        self.cooldown.unmute(symbol)
+        writer = self._workers.get(self.ring.owner(symbol))
+        if writer is not None and not writer.is_closing():
+            writer.write(_encode({'type': 'unmute', 'symbol': symbol}))
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                symbols = await self.universe.symbols()
+                if symbols != self.symbols:
+                    self.symbols = symbols
+                    await self._rebalance()
+            except Exception as e:
+                logger.warning(f"Falha ao atualizar o universo de símbolos, mantendo o anterior: {e}")
+            await asyncio.sleep(self.refresh)
+
+    async def _handle(self, reader, writer):
+        worker = None
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            hello = await _read(reader)
+            if not _valid(hello, 'hello'):
+                logger.warning(f"Conexão descartada: esperava hello, recebeu {str(hello)[:200]}")
+                return
+            worker = hello['worker']
+            anterior = self._workers.get(worker)
+            if anterior is not None:
+                # Reconexão do mesmo worker: a conexão antiga é descartada
+                anterior.close()
+            self._workers[worker] = writer
+            self._assigned.pop(worker, None)
+            self.ring.add(worker)
+            logger.info(f"Worker {worker} conectado ({len(self.ring)} no anel).")
+            await self._rebalance()
+
+            while (msg := await _read(reader)) is not None:
+                if not _valid(msg, 'alert', 'mute'):
+                    logger.warning(f"Mensagem inválida do worker {worker} ignorada: {str(msg)[:200]}")
+                elif msg['type'] == 'alert':
+                    self.outbox.put(msg['text'], since=msg.get('since'), symbol=msg.get('symbol'))
+                else:
+                    self.cooldown.mute(msg['symbol'], ttl=msg['ttl'])
+        except asyncio.CancelledError:
+            # Cancelado pelo stop(): termina sem exceção, senão o callback do asyncio.streams
+            # registra um traceback para cada conexão aberta
+            if not self._closing:
+                raise
+        except Exception as e:
+            # Qualquer erro (linha longa demais, JSON inválido, ...) derruba só esta
+            # conexão; o finally tira o worker do anel
+            logger.warning(f"Conexão com o worker {worker} encerrada com erro: {e!r}")
+        finally:
+            self._handlers.discard(task)
+            if worker is not None and self._workers.get(worker) is writer:
+                del self._workers[worker]
+                self._assigned.pop(worker, None)
+                self.ring.remove(worker)
+                logger.info(f"Worker {worker} saiu ({len(self.ring)} no anel).")
+                if not self._closing:
+                    await self._rebalance()
+            writer.close()
+
+    async def _rebalance(self):
+        async with self._lock:
+            if not self._workers:
+                if self.symbols:
+                    logger.warning(f"Nenhum worker conectado; {len(self.symbols)} símbolos sem dono.")
+                return
+            movidos = 0
+            for worker, symbols in self.ring.partition(self.symbols).items():
+                writer = self._workers.get(worker)
+                if writer is None or symbols == self._assigned.get(worker):
+                    continue
+                movidos += len(set(symbols) - set(self._assigned.get(worker, ())))
+                self._assigned[worker] = symbols
+                now = time.time()
+                muted = {s: self.cooldown.remaining(s, now) for s in symbols if self.cooldown.is_muted(s, now)}
+                writer.write(_encode({'type': 'shard', 'symbols': symbols, 'muted': muted}))
+                try:
+                    await writer.drain()
+                except ConnectionError as e:
+                    logger.warning(f"Falha ao enviar o shard para o worker {worker}: {e}")
+            if movidos:
+                tamanhos = {w: len(s) for w, s in sorted(self._assigned.items())}
+                logger.info(f"Shards redistribuídos ({movidos} símbolos mudaram de dono): {tamanhos}")
+
+
+class _Link:
+    # Canal do worker para o coordenador; o que é enviado sem conexão fica guardado
+    # e sai assim que ela volta
+    def __init__(self, max_pending=10_000):
+        self.writer = None
+        self._pending = deque(maxlen=max_pending)
+
+    def attach(self, writer):
+        self.writer = writer
+        while self._pending:
+            writer.write(self._pending.popleft())
+
+    def detach(self):
+        self.writer = None
+
+    def send(self, msg):
+        linha = _encode(msg)
+        if self.writer is None or self.writer.is_closing():
+            self._pending.append(linha)
+        else:
+            self.writer.write(linha)
+
+
+class ShardUniverse:
+    # Universo do worker: o shard que o coordenador mandou por último
+    def __init__(self):
+        self._symbols = []
+
+    def assign(self, symbols):
+        self._symbols = list(symbols)
+
+    async def symbols(self):
+        return self._symbols
+
+
+class RemoteOutbox:
+    # Mesma interface de AlertOutbox.put, mas o alerta vai para o coordenador
+    def __init__(self, link):
+        self.link = link
+
+    def put(self, alert, since=None, symbol=None):
+        self.link.send({'type': 'alert', 'text': alert, 'since': since, 'symbol': symbol})
+
+
+class RemoteCooldown:
+    # Cooldown local do worker (consulta sem I/O no ciclo); cada mute também vai para
+    # o cooldown central do coordenador
+    def __init__(self, link, ttl=6 * 3600, clock=time.time):
+        self.link = link
+        self.local = AlertCooldown(':memory:', ttl=ttl, clock=clock)
+
+    def is_muted(self, symbol, now=None):
+        return self.local.is_muted(symbol, now)
+
+    def mute(self, symbol, now=None, ttl=None):
+        self.local.mute(symbol, now, ttl)
+        self.link.send({'type': 'mute', 'symbol': symbol, 'ttl': self.local.remaining(symbol, now)})
+
+    def close(self):
+        self.local.close()
+
+
+class ShardWorker:
+    # Lado worker: conecta no coordenador, recebe o shard e roda o Monitor só nele.
+    # Sem conexão, o shard é esvaziado (o coordenador já repassou os símbolos a outros)
+    # e o worker tenta reconectar a cada `reconnect` segundos.
+    def __init__(self, worker_id, address, fetcher, cache, scheduler, analyzer, intervals=INTERVALS,
+                 stream=None, spread_seconds=5, strategies=None, cooldown_ttl=6 * 3600, reconnect=5.0):
+        self.worker_id = worker_id
+        self.address = address
+        self.reconnect = reconnect
+        self.link = _Link()
+        self.universe = ShardUniverse()
+        self.cooldown = RemoteCooldown(self.link, cooldown_ttl)
+        self.monitor = Monitor(self.universe, fetcher, cache, scheduler, self.cooldown, analyzer,
+                               RemoteOutbox(self.link), intervals, stream, spread_seconds, strategies)
+        self._monitor_task = None
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    reader, writer = await _open(self.address)
+                except OSError as e:
+                    logger.warning(f"Coordenador indisponível em {self.address} ({e}), nova tentativa em {self.reconnect}s...")
+                    await asyncio.sleep(self.reconnect)
+                    continue
+                await self._session(reader, writer)
+                logger.warning(f"Conexão com o coordenador perdida, nova tentativa em {self.reconnect}s...")
+                await asyncio.sleep(self.reconnect)
+        finally:
+            if self._monitor_task is not None:
+                self._monitor_task.cancel()
+                await asyncio.gather(self._monitor_task, return_exceptions=True)
+
+    async def _session(self, reader, writer):
+        writer.write(_encode({'type': 'hello', 'worker': self.worker_id}))
+        self.link.attach(writer)
+        if self._monitor_task is None:
+            self._monitor_task = asyncio.create_task(self.monitor.run())
+        try:
+            while (msg := await _read(reader)) is not None:
+                if not _valid(msg, 'shard', 'unmute'):
+                    logger.warning(f"Mensagem inválida do coordenador ignorada: {str(msg)[:200]}")
+                elif msg['type'] == 'shard':
+                    self.universe.assign(msg['symbols'])
+                    for symbol, ttl in msg['muted'].items():
+                        self.cooldown.local.mute(symbol, ttl=ttl)
+                    logger.info(f"Shard recebido: {len(msg['symbols'])} símbolos.")
+                else:
+                    self.cooldown.local.unmute(msg['symbol'])
+        except (ConnectionError, ValueError) as e:
+            # ValueError cobre JSON inválido e linha maior que LINE_LIMIT
+            logger.warning(f"Erro na conexão com o coordenador: {e!r}")
+        finally:
+            self.link.detach()
+            self.universe.assign([])
+            writer.close()
+
+
+async def _run_worker(args):
+    fetcher = AsyncKlineFetcher(args.base_url, weight_limit=args.weight_limit)
+    store = KlineStore(args.store) if args.store else None
+    cache = KlineCache(fetcher, indicators=IndicatorEngine(), store=store, derived=DERIVED)
+    strategies = load_strategies(args.estrategias) if args.estrategias else [SHORT_STRATEGY]
+    analisador = ParallelAnalyzer(args.analise_workers, strategies=strategies)
+    worker = ShardWorker(args.id, args.coordenador, fetcher, cache, CandleScheduler(INTERVALS), analisador,
+                         strategies=strategies, cooldown_ttl=args.cooldown_horas * 3600)
+    try:
+        await worker.run()
+    finally:
+        if store is not None:
+            await store.flush()
+        await fetcher.close()
+        analisador.shutdown()
+
+
+async def _run_coordinator(args):
+    # Coordenador sem Discord, para testes locais; em produção o coordenador é o bot
+    # (SHARD_COORDENADOR no .env)
+    client = await asyncio.to_thread(get_binance_client, os.getenv('API_KEY'), os.getenv('API_SECRET'))
+    universo = UniverseResolver(client, args.min_cap, args.max_cap)
+    saida = AlertOutbox(StubChannel()).start()
+    cooldown = AlertCooldown(args.alertas_db, ttl=args.cooldown_horas * 3600)
+    coordenador = Coordinator(universo, saida, cooldown, args.escutar)
+    try:
+        await coordenador.run()
+    finally:
+        await coordenador.stop()
+        await saida.stop()
+        cooldown.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modo coordenador/worker: divide os símbolos entre processos.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    worker = sub.add_parser('worker', help="analisa o shard recebido do coordenador")
+    worker.add_argument('--coordenador', default='127.0.0.1:8765', help="host:porta ou unix:/caminho")
+    worker.add_argument('--id', default=f"{socket.gethostname()}-{os.getpid()}", help="nome único do worker")
+    worker.add_argument('--base-url', default=FUTURES_BASE_URL, help="API de futuros da Binance")
+    worker.add_argument('--weight-limit', type=int, default=2400,
+                        help="peso por minuto deste worker (workers no mesmo IP dividem o limite)")
+    worker.add_argument('--store', help="diretório do KlineStore (opcional)")
+    worker.add_argument('--analise-workers', type=int, help="processos de análise (padrão: nº de CPUs; 0 = thread)")
+    worker.add_argument('--estrategias', help="JSON com as estratégias de alerta")
+    worker.add_argument('--cooldown-horas', type=float, default=6)
+    coordenador = sub.add_parser('coordinator', help="coordenador sem Discord (alertas só no log)")
+    coordenador.add_argument('--escutar', default='127.0.0.1:8765', help="host:porta ou unix:/caminho")
+    coordenador.add_argument('--min-cap', type=float, default=200_000_000)
+    coordenador.add_argument('--max-cap', type=float, default=350_000_000)
+    coordenador.add_argument('--alertas-db', default='alertas.db')
+    coordenador.add_argument('--cooldown-horas', type=float, default=6)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv('LOG_NIVEL', 'INFO').upper(),
+                        format='[%(asctime)s] [%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    try:
+        asyncio.run(_run_worker(args) if args.command == 'worker' else _run_coordinator(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# stream.py
+import asyncio
+import logging
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+FUTURES_WS_URL = "wss://fstream.binance.com"
+
+# A Binance aceita no máximo 200 streams por conexão nos futuros
+MAX_STREAMS_PER_CONNECTION = 200
+
+
+def stream_name(symbol, interval):
+    return f"{symbol.lower()}@kline_{interval}"
+
+
+def kline_from_ws(k):
+    # Converte o payload "k" do evento kline para o mesmo formato de linha do REST
+    return [
+        k['t'], k['o'], k['h'], k['l'], k['c'], k['v'],
+        k['T'], k['q'], k['n'], k['V'], k['Q'], k['B']
+    ]
+
+
+class _Connection:
+    # Uma conexão de combined streams. `pairs` muda com SUBSCRIBE/UNSUBSCRIBE
+    # enviados na própria conexão; numa reconexão a URL já sai com o conjunto atual.
+    __slots__ = ('pairs', 'ws', 'task')
+
+    def __init__(self, pairs):
+        self.pairs = set(pairs)
+        self.ws = None
+        self.task = None
+
+
+class KlineStream:
+    # Ingestão via combined streams de kline dos futuros.
+    # Cada evento (candle fechado ou em formação) é mesclado direto no KlineCache.
+    # Ao (re)conectar, o buraco desde a última conexão é preenchido via REST
+    # antes de consumir as mensagens; enquanto uma conexão está caída, seus pares
+    # aparecem em stale_pairs() para o chamador cair de volta para o REST.
+    # Mudanças no universo só mexem nas conexões afetadas: pares que saem recebem
+    # UNSUBSCRIBE, pares novos entram com SUBSCRIBE onde houver vaga (e backfill só
+    # deles); as demais conexões seguem sem reconectar.
+    def __init__(self, cache, base_url=FUTURES_WS_URL, on_close=None,
+                 max_streams_per_connection=MAX_STREAMS_PER_CONNECTION, max_backoff=60):
+        self.cache = cache
+        self.base_url = base_url.rstrip('/')
+        self.on_close = on_close
+        self.max_streams_per_connection = max_streams_per_connection
+        self.max_backoff = max_backoff
+        self._pairs = frozenset()
+        self._por_stream = {}
+        self._live = set()
+        self._connections = []
+        self._session = None
+        self._request_id = 0
+
+    def subscribe(self, pairs):
+        pairs = frozenset(pairs)
+        if pairs == self._pairs:
+            return
+        saindo, entrando = self._pairs - pairs, sorted(pairs - self._pairs)
+        logger.debug(f"Assinando {len(pairs)} streams de kline (+{len(entrando)}, -{len(saindo)})...")
+        self._pairs = pairs
+        self._por_stream = {stream_name(symbol, interval): (symbol, interval) for symbol, interval in pairs}
+
+        for conn in self._connections:
+            removidos = conn.pairs & saindo
+            if removidos:
+                conn.pairs -= removidos
+                self._live.difference_update(removidos)
+                self._send(conn, 'UNSUBSCRIBE', removidos)
+        for conn in self._connections:
+            if not conn.pairs:
+                conn.task.cancel()
+        self._connections = [conn for conn in self._connections if conn.pairs]
+
+        n = self.max_streams_per_connection
+        for conn in self._connections:
+            vagas = n - len(conn.pairs)
+            if not entrando or vagas <= 0:
+                continue
+            novos, entrando = entrando[:vagas], entrando[vagas:]
+            conn.pairs.update(novos)
+            if conn.ws is not None:
+                self._send(conn, 'SUBSCRIBE', novos)
+                asyncio.create_task(self._backfill_live(conn, novos))
+        for i in range(0, len(entrando), n):
+            conn = _Connection(entrando[i:i + n])
+            conn.task = asyncio.create_task(self._run_connection(conn))
+            self._connections.append(conn)
+
+    def stale_pairs(self, pairs):
+        # Séries derivadas (KlineCache.derived) estão vivas se a base estiver
+        return [pair for pair in pairs if self.cache.source(*pair) not in self._live or pair not in self.cache]
+
+    async def stop(self):
+        tasks = [conn.task for conn in self._connections]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._connections = []
+        self._pairs = frozenset()
+        self._live.clear()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    def _send(self, conn, method, pairs):
+        # Sem conexão aberta não há o que enviar: a próxima URL já sai com conn.pairs
+        if conn.ws is None or conn.ws.closed or not pairs:
+            return
+        self._request_id += 1
+        mensagem = {'method': method, 'params': [stream_name(*pair) for pair in sorted(pairs)], 'id': self._request_id}
+        asyncio.create_task(conn.ws.send_json(mensagem))
+
+    async def _backfill_live(self, conn, pairs):
+        ws = conn.ws
+        await self._backfill(pairs)
+        if conn.ws is ws and ws is not None and not ws.closed:
+            self._live.update(pair for pair in pairs if pair in conn.pairs)
+
+    async def _run_connection(self, conn):
+        backoff = 1
+        while True:
+            assinados = set(conn.pairs)
+            url = f"{self.base_url}/stream?streams={'/'.join(stream_name(*pair) for pair in sorted(assinados))}"
+            try:
+                async with self._get_session().ws_connect(url, heartbeat=30) as ws:
+                    conn.ws = ws
+                    # O conjunto pode ter mudado enquanto a conexão abria
+                    self._send(conn, 'SUBSCRIBE', conn.pairs - assinados)
+                    self._send(conn, 'UNSUBSCRIBE', assinados - conn.pairs)
+                    logger.info(f"Conectado a {len(conn.pairs)} streams de kline.")
+                    pares = set(conn.pairs)
+                    await self._backfill(pares)
+                    self._live.update(pares & conn.pairs)
+                    backoff = 1
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self._handle(msg.json())
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+                logger.warning("Conexão de stream de kline encerrada pelo servidor.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Erro no stream de kline: {e}")
+            finally:
+                conn.ws = None
+                self._live.difference_update(assinados | conn.pairs)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _backfill(self, pairs):
+        resultados = await self.cache.update_many(pairs)
+        falhas = [pair for pair, r in resultados.items() if isinstance(r, Exception)]
+        if falhas:
+            logger.warning(f"Backfill via REST falhou para {len(falhas)} pares.")
+
+    def _handle(self, payload):
+        # Respostas de SUBSCRIBE/UNSUBSCRIBE ({'result': None, 'id': ...}) não têm 'stream'
+        pair = self._por_stream.get(payload.get('stream'))
+        data = payload.get('data', {})
+        if pair is None or data.get('e') != 'kline':
+            return
+        k = data['k']
+        self.cache.merge(pair[0], pair[1], [kline_from_ws(k)])
+        if k['x'] and self.on_close is not None:
+            self.on_close(pair[0], pair[1])
@@ -0,0 +1,267 @@
+#sweep.py
+import argparse
+import asyncio
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from data import KlineStore, INTERVAL_MS
+from rules import SHORT_STRATEGY, with_params
+from parallel import _attach
+from backtest import (
+    WINDOW, HistoryFeatures, history_matrix, compute_signals, simulate_exits,
+    load_histories, load_histories_from_store
+)
+
+logger = logging.getLogger(__name__)
+
+# Parameter grid over the fixed defaults of the SHORT rule: the crossover EMAs of
+# check_ema_crossover, the RSI and MACD periods and the confidence cutoff.
+# Every combination is backtested with the same code as backtest.py; combinations
+# are evaluated chunk by chunk of symbols so indicator columns shared by many of
+# them (EMA(21), RSI(14), ...) are computed once per chunk by HistoryFeatures.
+
+DEFAULT_GRID = {
+    'ema_fast': [5, 7, 9, 12],
+    'ema_slow': [21, 26, 34, 50],
+    'rsi': [7, 14, 21],
+    'macd': [(12, 26, 9), (8, 21, 5), (5, 35, 5)],
+    'threshold': [50, 60, 70, 80, 90],
+}
+
+STATS = ['alerts', 'trades', 'target_1', 'target_2', 'stopped', 'bars_held']
+
+
+def tuned_strategy(ema_fast=9, ema_slow=21, rsi=14, macd=(12, 26, 9), threshold=70):
+    # SHORT_STRATEGY with its crossover EMAs, RSI/MACD periods and cutoff replaced;
+    # the defaults give back the live rule
+    suffix = '_%d_%d_%d' % tuple(macd)
+    define = {
+        **SHORT_STRATEGY['define'],
+        'crossover_down': f"prev_ema_{ema_fast} > prev_ema_{ema_slow} and ema_{ema_fast} < ema_{ema_slow}",
+        'crossover_up': f"prev_ema_{ema_fast} < prev_ema_{ema_slow} and ema_{ema_fast} > ema_{ema_slow}",
+    }
+    score = [
+        [points, re.sub(r'\bmacd(_signal)?\b', lambda m: m.group(0) + suffix, re.sub(r'\brsi\b', f'rsi_{rsi}', source))]
+        for points, source in SHORT_STRATEGY['score']
+    ]
+    return with_params({**SHORT_STRATEGY, 'define': define, 'score': score}, threshold=threshold)
+
+
+def parameter_grid(grid=None, samples=None, seed=0):
+    """
+    Combinations of the grid's values (dicts of tuned_strategy kwargs), skipping
+    fast periods that aren't below the slow ones. With `samples`, a random subset
+    of that size instead. Combinations are ordered by the indicators they use, so
+    contiguous batches share most of their features.
+    """
+    grid = {**DEFAULT_GRID, **(grid or {})}
+    combos = [
+        dict(zip(grid, values)) for values in itertools.product(*grid.values())
+    ]
+    combos = [c for c in combos if c['ema_fast'] < c['ema_slow'] and c['macd'][0] < c['macd'][1]]
+    if samples is not None and samples < len(combos):
+        picked = np.random.default_rng(seed).choice(len(combos), samples, replace=False)
+        combos = [combos[i] for i in picked]
+    return sorted(combos, key=lambda c: (c['macd'], c['rsi'], c['ema_fast'], c['ema_slow'], c['threshold']))
+
+
+def evaluate(table, combos, horizon=96):
+    # Backtest totals (see STATS) of each combination over one table of symbols
+    intervals, window = table.intervals, table.window
+    short = table.timeframes[0]
+    results = []
+    for params in combos:
+        _, signals = compute_signals(*table.timeframes, intervals, window, tuned_strategy(**params), table=table)
+        trades = simulate_exits(short, signals, signals['alert'], horizon)
+        results.append((
+            int(signals['alert'].to_numpy().sum()), len(trades), int(trades['hit_target_1'].sum()),
+            int(trades['hit_target_2'].sum()), int(trades['stopped'].sum()), int(trades['bars_held'].sum()),
+        ))
+    return results
+
+
+class SharedHistory:
+    # history_matrix frames of every timeframe in one shared memory block each,
+    # laid out (close/high/low x symbols x bars) so the symbols of a chunk are a
+    # contiguous slice workers can map without copying or pickling
+    def __init__(self, frames_by_timeframe):
+        self.blocks = []
+        self._shms = []
+        for close, high, low in frames_by_timeframe:
+            shape = (3, close.shape[1], close.shape[0])
+            shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+            array = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            for k, frame in enumerate((close, high, low)):
+                array[k] = frame.to_numpy().T
+            del array
+            self._shms.append(shm)
+            self.blocks.append((shm.name, shape, int(close.index[0])))
+
+    def close(self):
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+
+
+# Worker state: attached blocks stay mapped for the worker's lifetime, and the
+# table of the last chunk is kept so consecutive batches on it reuse its features
+_attached = {}
+_last_table = None
+
+
+def _frames(block, interval, symbols, lo, hi):
+    name, shape, start = block
+    if name not in _attached:
+        _attached[name] = _attach(name)
+    array = np.ndarray(shape, dtype=np.float64, buffer=_attached[name].buf)[:, lo:hi]
+    array.flags.writeable = False
+    index = start + INTERVAL_MS[interval] * np.arange(shape[2])
+    # pandas keeps 2D values as (columns x rows), so the transposed view is used as is
+    return tuple(pd.DataFrame(array[k].T, index=index, columns=symbols, copy=False) for k in range(3))
+
+
+def _sweep_task(blocks, intervals, window, symbols, lo, hi, combos, horizon):
+    # Runs in a worker process: evaluates a batch of combinations on symbols [lo, hi)
+    global _last_table
+    key = (blocks[0][0], lo, hi)
+    if _last_table is None or _last_table[0] != key:
+        frames = [_frames(block, interval, symbols, lo, hi) for block, interval in zip(blocks, intervals)]
+        _last_table = (key, HistoryFeatures(*frames, intervals, window))
+    return lo, evaluate(_last_table[1], combos, horizon)
+
+
+def rank(combos, totals, min_trades=30, sort='edge'):
+    """
+    Results table, one row per combination, best first. `edge` is the share of
+    trades reaching target 1 minus the share stopped out; combinations with fewer
+    than `min_trades` trades go to the bottom.
+    """
+    params = pd.DataFrame([{**c, 'macd': '%d/%d/%d' % tuple(c['macd'])} for c in combos])
+    stats = pd.DataFrame(totals, columns=STATS)
+    trades = stats['trades'].where(stats['trades'] > 0)
+    table = pd.concat([params, stats[['alerts', 'trades']]], axis=1)
+    table['target_1_rate'] = stats['target_1'] / trades
+    table['target_2_rate'] = stats['target_2'] / trades
+    table['stop_rate'] = stats['stopped'] / trades
+    table['expired_rate'] = (stats['trades'] - stats['target_1'] - stats['stopped']) / trades
+    table['avg_bars_held'] = stats['bars_held'] / trades
+    table['edge'] = table['target_1_rate'] - table['stop_rate']
+    table['_enough'] = stats['trades'] >= min_trades
+    table = table.sort_values(['_enough', sort], ascending=False, na_position='last', kind='stable')
+    return table.drop(columns='_enough').reset_index(drop=True)
+
+
+def run_sweep(histories, combos, intervals=('15m', '1h', '4h'), horizon=96, window=WINDOW,
+              symbols_per_chunk=50, max_workers=None, min_trades=30, sort='edge'):
+    """
+    Backtests every combination (see parameter_grid) over histories
+    ({interval: {symbol: Candles}}) and returns the ranked table (see rank).
+    The aligned price matrices are built once and shared read-only with a process
+    pool; each task evaluates a batch of combinations on a chunk of symbols.
+    With max_workers=0 everything runs in this process.
+    """
+    inicio = time.perf_counter()
+    max_workers = os.cpu_count() if max_workers is None else max_workers
+    symbols = [s for s, c in histories[intervals[0]].items() if len(c)]
+    frames = [
+        tuple(f.reindex(columns=symbols) for f in history_matrix(
+            {s: histories[interval][s] for s in symbols if s in histories[interval]}, interval))
+        for interval in intervals
+    ]
+    chunks = [(lo, min(lo + symbols_per_chunk, len(symbols))) for lo in range(0, len(symbols), symbols_per_chunk)]
+    totals = np.zeros((len(combos), len(STATS)), dtype=np.int64)
+
+    if max_workers == 0:
+        for lo, hi in chunks:
+            table = HistoryFeatures(*(tuple(f.iloc[:, lo:hi] for f in tf) for tf in frames), intervals, window)
+            totals += np.array(evaluate(table, combos, horizon), dtype=np.int64).reshape(totals.shape)
+    else:
+        # Enough batches per chunk to keep every worker busy; batches are contiguous
+        # in parameter order so each one touches few distinct indicator columns
+        n_batches = max(1, math.ceil(2 * max_workers / len(chunks)))
+        size = -(-len(combos) // n_batches)
+        shared = SharedHistory(frames)
+        executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            futures = {}
+            for lo, hi in chunks:
+                for b in range(0, len(combos), size):
+                    future = executor.submit(_sweep_task, shared.blocks, intervals, window, symbols[lo:hi],
+                                             lo, hi, combos[b:b + size], horizon)
+                    futures[future] = b
+            for done, future in enumerate(as_completed(futures), 1):
+                b = futures[future]
+                _, results = future.result()
+                totals[b:b + len(results)] += np.array(results, dtype=np.int64).reshape(len(results), len(STATS))
+                logger.debug(f"Sweep: {done}/{len(futures)} tarefas concluídas.")
+        finally:
+            executor.shutdown(cancel_futures=True)
+            shared.close()
+
+    logger.info(
+        f"Sweep: {len(combos)} combinações x {len(symbols)} símbolos x {frames[0][0].shape[0]} barras "
+        f"em {time.perf_counter() - inicio:.1f}s."
+    )
+    return rank(combos, totals, min_trades, sort)
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(',')]
+
+
+def _macd_list(text):
+    return [tuple(int(p) for p in v.split(':')) for v in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Busca de parâmetros da regra SHORT sobre candles históricos.")
+    parser.add_argument('symbols', nargs='*', help="padrão com --store: todos os símbolos gravados")
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--store', help="diretório do KlineStore; sem ele os candles vêm da Binance")
+    parser.add_argument('--ema-fast', type=_int_list, help="EMAs curtas do cruzamento, ex.: 5,9,12")
+    parser.add_argument('--ema-slow', type=_int_list, help="EMAs longas do cruzamento, ex.: 21,26,50")
+    parser.add_argument('--rsi', type=_int_list, help="períodos do RSI, ex.: 7,14,21")
+    parser.add_argument('--macd', type=_macd_list, help="MACD rápido:lento:sinal, ex.: 12:26:9,8:21:5")
+    parser.add_argument('--threshold', type=_int_list, help="confianças mínimas, ex.: 50,70,90")
+    parser.add_argument('--random', type=int, help="sorteia N combinações da grade em vez de testar todas")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--horizon', type=int, default=96, help="barras do timeframe curto até o trade expirar")
+    parser.add_argument('--workers', type=int, help="processos (padrão: nº de CPUs; 0 = sem processos)")
+    parser.add_argument('--min-trades', type=int, default=30, help="combinações com menos trades ficam no fim")
+    parser.add_argument('--sort', default='edge', help="coluna usada no ranking (padrão: edge)")
+    parser.add_argument('--top', type=int, default=20, help="linhas exibidas")
+    parser.add_argument('--output', help="grava a tabela completa em CSV")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s')
+    intervals = ('15m', '1h', '4h')
+    if args.store:
+        store = KlineStore(args.store)
+        symbols = args.symbols or store.symbols(intervals[0])
+        histories = load_histories_from_store(store, symbols, intervals, args.days)
+    else:
+        if not args.symbols:
+            parser.error("informe os símbolos ou --store")
+        histories = asyncio.run(load_histories(args.symbols, intervals, args.days))
+
+    grid = {name: getattr(args, name) for name in DEFAULT_GRID if getattr(args, name) is not None}
+    combos = parameter_grid(grid, args.random, args.seed)
+    if not combos:
+        parser.error("nenhuma combinação válida na grade")
+    results = run_sweep(histories, combos, intervals, args.horizon, max_workers=args.workers,
+                        min_trades=args.min_trades, sort=args.sort)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.head(args.top).to_string())
+
+
+if __name__ == '__main__':
+    main()